@@ -0,0 +1,45 @@
+import sys
+import json
+import time
+import tracemalloc
+import importlib.util
+import src
+import src.collectors as collectors
+
+# resource only exists on unix, elsewhere the peak of python allocations stands in for peak rss
+def has_resource() -> bool:
+	return importlib.util.find_spec("resource") != None
+
+def get_peak_mb() -> float:
+	if not has_resource():
+		return tracemalloc.get_traced_memory()[1]/1024/1024
+	import resource
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# macos reports bytes, linux kilobytes
+	return rss/1024/1024 if sys.platform == "darwin" else rss/1024
+
+# runs one benchmark case in a fresh process so peak rss is its own
+def main():
+	case = sys.argv[1]
+	if not has_resource():
+		tracemalloc.start()
+	start = time.perf_counter()
+	cpu_start = time.process_time()
+
+	if case.startswith("collector:"):
+		name = case.split(":")[1]
+		workers = src.get_int_arg("-workers", 1)
+		session = src.get_session(workers)
+		contexts = collectors.get_contexts(session, src.get_place_ids(), int(src.get_arg("-interval")), int(src.get_arg("-group")))
+		collectors.collect_places(session, name, contexts, workers)
+	else:
+		src.main()
+
+	print(json.dumps({
+		"wall": time.perf_counter() - start,
+		"cpu": time.process_time() - cpu_start,
+		"peak_rss_mb": get_peak_mb(),
+	}))
+
+if __name__ == '__main__':
+	main()
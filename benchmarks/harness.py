@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import glob
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import TypedDict
+from src import get_arg, get_int_arg, has_flag
+import src.collectors as collectors
+from benchmarks.mock_server import MockServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DEFAULT_PLACES = "5"
+DEFAULT_THRESHOLD = 0.2
+
+class CaseResult(TypedDict):
+	wall: float
+	cpu: float
+	peak_rss_mb: float
+	requests: int
+	throttled: int
+	bytes_in: int
+	bytes_out: int
+
+def get_commit() -> str:
+	try:
+		return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return "unknown"
+
+def get_cases() -> list[str]:
+	cases_arg = get_arg("-cases")
+	if cases_arg is not None:
+		return cases_arg.split(",")
+	return ["run", "run-async"] + [f"collector:{name}" for name in collectors.COLLECTORS]
+
+def run_case(server: MockServer, case: str, places: str, workers: int) -> CaseResult:
+	# benchmarks.case hands "run" straight to main, which reads the place from argv[2]
+	command = "run" if case.startswith("run") else case
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		argv = [
+			sys.executable, "-m", "benchmarks.case", command, places,
+			"-places", places,
+			"-o", os.path.join(tmp_dir, "data"),
+			"-cache", os.path.join(tmp_dir, "cache"),
+			"-interval", "1",
+			"-group", "1",
+			"-cookie", "benchmark",
+			"-workers", str(workers),
+			"-api-redirect", server.get_base_url(),
+		]
+		if case == "run-async":
+			argv.append("-async")
+		host_rates = get_arg("-host-rates")
+		if host_rates is not None:
+			argv += ["-host-rates", host_rates]
+
+		env = {**os.environ, "ROBLOX_COOKIE": "benchmark"}
+		server.reset_stats()
+		output = subprocess.run(argv, env=env, capture_output=True, text=True)
+		assert output.returncode == 0, f"{case} failed\n{output.stderr}"
+
+	case_stats = json.loads(output.stdout.strip().splitlines()[-1])
+	return {
+		"wall": case_stats["wall"],
+		"cpu": case_stats["cpu"],
+		"peak_rss_mb": case_stats["peak_rss_mb"],
+		"requests": server.stats["requests"],
+		"throttled": server.stats["throttled"],
+		"bytes_in": server.stats["bytes_in"],
+		"bytes_out": server.stats["bytes_out"],
+	}
+
+def get_previous(settings: dict) -> dict | None:
+	# only a run with the same places, workers and mock server is a baseline, newest first
+	for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), reverse=True):
+		with open(path) as results_file:
+			previous = json.load(results_file)
+		if previous.get("settings") == settings:
+			return previous
+	return None
+
+def get_change(new: float, old: float) -> str:
+	if old == 0:
+		return ""
+	return f"{(new - old)/old*100:+.0f}%"
+
+def main():
+	places = get_arg("-places") or DEFAULT_PLACES
+	workers = get_int_arg("-workers", 8)
+	latency = float(get_arg("-latency") or 20)/1000
+	throttle_rate = float(get_arg("-throttle") or 0)
+	threshold = float(get_arg("-threshold") or DEFAULT_THRESHOLD)
+
+	settings = {"places": places, "workers": workers, "latency": latency, "throttle": throttle_rate, "host_rates": get_arg("-host-rates")}
+	server = MockServer(latency=latency, throttle_rate=throttle_rate).start()
+	previous = get_previous(settings)
+	if previous is None:
+		print("no saved run with these settings, nothing to compare against")
+	results: dict[str, CaseResult] = {}
+
+	print(f"{'case':<22} {'wall s':>8} {'cpu s':>7} {'rss mb':>7} {'requests':>8} {'429s':>5} {'kb out':>8}  change")
+	regressions: list[str] = []
+	for case in get_cases():
+		result = run_case(server, case, places, workers)
+		results[case] = result
+
+		change = ""
+		if previous is not None and case in previous["results"]:
+			old = previous["results"][case]
+			change = f"wall {get_change(result['wall'], old['wall'])}, requests {get_change(result['requests'], old['requests'])}"
+			if result["wall"] > old["wall"]*(1 + threshold) or result["requests"] > old["requests"]:
+				regressions.append(case)
+
+		print(f"{case:<22} {result['wall']:>8.2f} {result['cpu']:>7.2f} {result['peak_rss_mb']:>7.1f} {result['requests']:>8} {result['throttled']:>5} {result['bytes_out']/1024:>8.0f}  {change}")
+
+	server.shutdown()
+
+	if not has_flag("-no-save"):
+		os.makedirs(RESULTS_DIR, exist_ok=True)
+		commit = get_commit()
+		path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{commit}.json")
+		with open(path, "w") as results_file:
+			json.dump({
+				"commit": commit,
+				"settings": settings,
+				"results": results,
+			}, results_file, indent=1)
+		print(f"saved {path}")
+
+	if previous is not None and len(regressions) > 0:
+		print(f"regressed against {previous['commit']}: {', '.join(regressions)}")
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
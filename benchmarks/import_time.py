@@ -0,0 +1,68 @@
+import sys
+import subprocess
+from src import get_int_arg
+
+DEFAULT_BUDGET_MS = 200
+DEFAULT_RUNS = 5
+
+# modules only some subcommands need, a bare import of src must not pull them in
+LAZY_MODULES = [
+	"bs4",
+	"lxml",
+	"httpx",
+	"asyncio",
+	"http.server",
+	"cProfile",
+	"multiprocessing",
+	"src.daemon",
+	"src.compact",
+	"src.profiling",
+	"src.export",
+	"src.ads",
+	"src.dashboard",
+	"src.devstat",
+	"src.info",
+	"src.sponsorships",
+	"src.rollup",
+	"sqlite3",
+	"pyarrow",
+]
+
+LOADED_SCRIPT = "import sys, src; print(' '.join(sorted(sys.modules)))"
+
+def get_import_us() -> int:
+	# -X importtime writes "import time: self | cumulative | name" lines to stderr
+	result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import src"], capture_output=True, text=True, check=True)
+	for line in result.stderr.splitlines():
+		parts = [part.strip() for part in line.split("|")]
+		if len(parts) == 3 and parts[2] == "src":
+			return int(parts[1])
+	raise AssertionError("no import time reported for src")
+
+def get_eager_modules() -> list[str]:
+	result = subprocess.run([sys.executable, "-c", LOADED_SCRIPT], capture_output=True, text=True, check=True)
+	loaded = set(result.stdout.split())
+	return [name for name in LAZY_MODULES if name in loaded]
+
+def main():
+	budget_ms = get_int_arg("-budget", DEFAULT_BUDGET_MS)
+	runs = get_int_arg("-runs", DEFAULT_RUNS)
+
+	# the fastest run is the least disturbed by whatever else the machine is doing
+	import_ms = min(get_import_us() for _ in range(runs))/1000
+	eager = get_eager_modules()
+
+	print(f"import src: {import_ms:.1f} ms (budget {budget_ms} ms, best of {runs})")
+	failed = False
+	if import_ms > budget_ms:
+		print(f"over budget by {import_ms - budget_ms:.1f} ms")
+		failed = True
+	for name in eager:
+		print(f"{name} is imported eagerly")
+		failed = True
+
+	if failed:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import time
+import random
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+from urllib.parse import urlsplit, parse_qs
+from typing import TypedDict, Callable, Literal
+from src import get_arg, get_int_arg
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+CSRF_TOKEN = "mock-csrf-token"
+DIVISIONS = ["Total", "Computer", "Phone", "Tablet", "Console"]
+UNIVERSE_OFFSET = 1000000
+
+class ServerStats(TypedDict):
+	requests: int
+	throttled: int
+	bytes_in: int
+	bytes_out: int
+
+StatKey = Literal["requests", "throttled", "bytes_in", "bytes_out"]
+
+def read_fixture(name: str) -> str:
+	with open(os.path.join(FIXTURE_DIR, name)) as fixture_file:
+		return fixture_file.read()
+
+def get_hours(start: str, end: str) -> list[str]:
+	start_time = datetime.strptime(start[:19], "%Y-%m-%dT%H:%M:%S").replace(minute=0, second=0)
+	end_time = datetime.strptime(end[:19], "%Y-%m-%dT%H:%M:%S")
+	hours = []
+	while start_time <= end_time:
+		hours.append(start_time.strftime("%Y-%m-%dT%H:%M:%SZ"))
+		start_time += timedelta(hours=1)
+	return hours
+
+def get_breakdown(body: dict) -> dict:
+	hours = get_hours(body["aggregationStartDateTime"], body["aggregationEndDateTime"])
+	return {
+		"values": [
+			{
+				"dataDivisionTargetValue": division,
+				"data": {ts: round(random.uniform(0, 1000), 2) for ts in hours},
+			} for division in DIVISIONS
+		]
+	}
+
+def get_acquisition(body: dict) -> dict:
+	days = get_hours(body["startTime"], body["endTime"])[::24]
+	return {
+		"values": [
+			{
+				"breakdowns": [{"dimension": "Source", "value": source}],
+				"datapoints": [{"timestamp": ts, "value": random.randint(0, 5000)} for ts in days],
+			} for source in ["Home", "Organic", "Search"]
+		]
+	}
+
+def get_stats(granularity: str) -> dict:
+	points = {"Hourly": 24, "Daily": 30, "Monthly": 12}.get(granularity, 24)
+	now = int(time.time()*1000)
+	return {
+		"data": {
+			division: {
+				"type": division,
+				"data": {str(now - i*3600000): random.randint(0, 500) for i in range(points)},
+			} for division in DIVISIONS[1:]
+		}
+	}
+
+def get_sponsors() -> dict:
+	return {
+		"sponsoredGames": [
+			{
+				"adName": f"Sponsor {i}",
+				"adId": i,
+				"adSetStatus": "Running",
+				"bidAmountInRobux": 10*i,
+				"budgetInRobux": 100*i,
+				"totalImpressions": 1000*i,
+				"impressionConversions": 10*i,
+				"totalClicks": 50*i,
+				"clickConversions": 5*i,
+				"targetGender": "Male,Female",
+				"targetAgeBracket": "All",
+				"targetDeviceType": "Computer,Phone",
+				"startDate": "2023-06-01T00:00:00Z",
+				"endDate": "2023-07-01T00:00:00Z",
+			} for i in range(1, 6)
+		]
+	}
+
+def get_ids(query: dict, key: str) -> list[int]:
+	return [int(i) for i in query[key][0].split(",")]
+
+# host, path pattern, handler(match, query, body) -> (status, content type, text)
+Route = tuple[str, str, Callable[[re.Match, dict, dict], tuple[int, str, str]]]
+
+def json_response(data) -> tuple[int, str, str]:
+	return 200, "application/json", json.dumps(data)
+
+ROUTES: list[Route] = [
+	("auth.roblox.com", r"/v2/logout", lambda m, q, b: (403, "application/json", "{}")),
+	("games.roblox.com", r"/v1/games/multiget-place-details", lambda m, q, b: json_response([
+		{"placeId": place_id, "universeId": UNIVERSE_OFFSET + place_id} for place_id in get_ids(q, "placeIds")
+	])),
+	("games.roblox.com", r"/v1/games/votes", lambda m, q, b: json_response({"data": [
+		{"id": universe_id, "upVotes": 900, "downVotes": 100} for universe_id in get_ids(q, "universeIds")
+	]})),
+	("games.roblox.com", r"/v1/games/\d+/favorites/count", lambda m, q, b: json_response({"favoritesCount": 4321})),
+	("apis.roblox.com", r"/developer-analytics-aggregations/v1/universes/\d+/breakdown", lambda m, q, b: json_response(get_breakdown(b))),
+	("apis.roblox.com", r"/developer-analytics-aggregations/v1/metrics/user-acquisition/universes/\d+", lambda m, q, b: json_response(get_acquisition(b))),
+	("develop.roblox.com", r"/v1/universes/\d+/live-stats", lambda m, q, b: json_response({
+		"totalPlayerCount": 1234, "gameCount": 40, "playerCountsByDeviceType": {"Computer": 800, "Phone": 434}
+	})),
+	("develop.roblox.com", r"/v1/universes/\d+/compatibilities", lambda m, q, b: json_response({"Compatibilities": []})),
+	("develop.roblox.com", r"/v1/places/\d+/stats/\w+", lambda m, q, b: json_response(get_stats(q["granularity"][0]))),
+	("adconfiguration.roblox.com", r"/v2/sponsored-games", lambda m, q, b: json_response(get_sponsors())),
+	("www.roblox.com", r"/develop(/groups/\d+)?", lambda m, q, b: (200, "text/html", read_fixture("ads.html"))),
+	("www.roblox.com", r"/games/\d+.*", lambda m, q, b: (200, "text/html", read_fixture("game.html"))),
+]
+
+class MockServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, port: int = 0, latency: float = 0, throttle_rate: float = 0, retry_after: float = 0.1):
+		super().__init__(("127.0.0.1", port), MockHandler)
+		self.latency = latency
+		self.throttle_rate = throttle_rate
+		self.retry_after = retry_after
+		self.stats_lock = Lock()
+		self.reset_stats()
+
+	def get_base_url(self) -> str:
+		return f"http://127.0.0.1:{self.server_address[1]}"
+
+	def reset_stats(self):
+		with self.stats_lock:
+			self.stats: ServerStats = {"requests": 0, "throttled": 0, "bytes_in": 0, "bytes_out": 0}
+
+	def count(self, key: StatKey, amount: int = 1):
+		with self.stats_lock:
+			self.stats[key] += amount
+
+	def start(self) -> "MockServer":
+		Thread(target=self.serve_forever, daemon=True).start()
+		return self
+
+class MockHandler(BaseHTTPRequestHandler):
+	server: MockServer
+	protocol_version = "HTTP/1.1"
+
+	def log_message(self, *args):
+		pass
+
+	def reply(self, status: int, content_type: str, text: str, headers: dict[str, str] = {}):
+		content = text.encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(content)))
+		for key, value in headers.items():
+			self.send_header(key, value)
+		self.end_headers()
+		self.wfile.write(content)
+		self.server.count("bytes_out", len(content))
+
+	def handle_request(self):
+		length = int(self.headers.get("Content-Length") or 0)
+		raw_body = self.rfile.read(length) if length > 0 else b""
+		self.server.count("requests")
+		self.server.count("bytes_in", len(raw_body))
+
+		if self.server.latency > 0:
+			time.sleep(self.server.latency)
+
+		if self.server.throttle_rate > 0 and random.random() < self.server.throttle_rate:
+			self.server.count("throttled")
+			self.reply(429, "application/json", "{}", {"Retry-After": str(self.server.retry_after)})
+			return
+
+		# requests arrive as /<host>/<path>, see transport.set_redirect
+		parts = urlsplit(self.path)
+		host, _, path = parts.path.lstrip("/").partition("/")
+		path = "/"+path
+		query = parse_qs(parts.query)
+		body = json.loads(raw_body) if raw_body else {}
+
+		for route_host, pattern, handler in ROUTES:
+			match = re.fullmatch(pattern, path)
+			if route_host == host and match != None:
+				status, content_type, text = handler(match, query, body)
+				self.reply(status, content_type, text, {"x-csrf-token": CSRF_TOKEN})
+				return
+
+		self.reply(404, "text/plain", f"no mock for {host}{path}")
+
+	def do_GET(self):
+		self.handle_request()
+
+	def do_POST(self):
+		self.handle_request()
+
+	def do_PATCH(self):
+		self.handle_request()
+
+def main():
+	latency = float(get_arg("-latency") or 0)/1000
+	throttle_rate = float(get_arg("-throttle") or 0)
+	server = MockServer(get_int_arg("-port", 8765), latency, throttle_rate)
+	print(f"mock roblox api on {server.get_base_url()}, pass -api-redirect {server.get_base_url()}")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,77 @@
+import os
+import timeit
+import src.util as util
+import src.info as info
+import src.ads as ads
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+AD_PLACE_ID = 5
+
+def read_fixture(name: str) -> str:
+	with open(os.path.join(FIXTURE_DIR, name)) as fixture_file:
+		return fixture_file.read()
+
+# the scrapers as they were before the single pass extraction, kept for comparison
+def legacy_parse_concurrents(text: str) -> int:
+	tree = util.get_html_tree(text)
+	for element in tree.xpath("//li[@class='game-stat game-stat-width-voice']"):
+		for stat in element.xpath(".//p[@class='text-label text-overflow font-caption-header']"):
+			if stat.text == "Active":
+				for val in element.xpath(".//p[@class='text-lead font-caption-body wait-for-i18n-format-render invisible']"):
+					return int(val.text.replace(",", ""))
+	return 0
+
+def legacy_parse_visits(text: str) -> int:
+	tree = util.get_html_tree(text)
+	for element in tree.xpath("//p[@id='game-visit-count']"):
+		visits = int(element.get("title").replace(",", ""))
+	return visits
+
+def legacy_parse_game_page(text: str) -> dict:
+	return {
+		"visits": legacy_parse_visits(text),
+		"concurrents": legacy_parse_concurrents(text),
+	}
+
+def legacy_parse_ads(text: str, place_id: int) -> list[dict]:
+	tree = util.get_html_tree(text)
+	found = []
+	for tabl in tree.xpath('//table[@data-ad-type]'):
+		ad_place_id = None
+		for title in tabl.xpath('.//td[@colspan="6"]'):
+			for a in title.xpath('.//a[@href]'):
+				if info.GAME_URL_PREFIX in a.get("href"):
+					ad_place_id = int(a.get("href").replace(info.GAME_URL_PREFIX, "").split("/")[0])
+		stats = {}
+		for div in tabl.xpath('.//td[@class="stats-col"]//div[@class="totals-label"]'):
+			for span in div.xpath(".//span"):
+				stats[(div.get("title") != None, div.text)] = span.text
+		is_running = len(tabl.xpath("//*[text()='Not running']")) == 0
+		if ad_place_id == place_id:
+			found.append({"id": tabl.get("data-item-id"), "is_running": is_running, "stats": stats})
+	return found
+
+def run_case(name: str, func, number: int) -> float:
+	best = min(timeit.repeat(func, number=number, repeat=5))/number
+	print(f"{name:<28} {best*1000:>9.3f} ms")
+	return best
+
+def main():
+	game_text = read_fixture("game.html")
+	ads_text = read_fixture("ads.html")
+
+	assert info.parse_game_page(game_text) == legacy_parse_game_page(game_text)
+	ad_ids = [ad["id"] for ad in ads.parse_ads(ads_text, AD_PLACE_ID)]
+	assert ad_ids == [ad["id"] for ad in legacy_parse_ads(ads_text, AD_PLACE_ID)]
+	not_running = sum(not ad["is_running"] for ad in ads.parse_ads(ads_text, AD_PLACE_ID))
+	print(f"{len(ad_ids)} ads for place {AD_PLACE_ID}, {not_running} not running")
+
+	legacy_game = run_case("game page (legacy)", lambda: legacy_parse_game_page(game_text), 20)
+	game = run_case("game page (single pass)", lambda: info.parse_game_page(game_text), 20)
+	legacy_ads = run_case("ads page (legacy)", lambda: legacy_parse_ads(ads_text, AD_PLACE_ID), 5)
+	ads_time = run_case("ads page (single pass)", lambda: ads.parse_ads(ads_text, AD_PLACE_ID), 5)
+
+	print(f"game page speedup {legacy_game/game:.1f}x, ads page speedup {legacy_ads/ads_time:.1f}x")
+
+if __name__ == '__main__':
+	main()
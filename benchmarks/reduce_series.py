@@ -0,0 +1,89 @@
+import json
+import random
+import timeit
+from datetime import datetime, timedelta
+import src.dashboard as dashboard
+import src.series as series
+
+SERIES_COUNT = 400
+HOURS = 24*7
+NULL_RATE = 0.05
+
+def get_breakdown_payload() -> dict:
+	random.seed(17)
+	start = datetime(2023, 6, 1)
+	stamps = [(start + timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ") for i in range(HOURS)]
+	values = []
+	for i in range(SERIES_COUNT):
+		shuffled = random.sample(stamps, len(stamps))
+		values.append({
+			"dataDivisionTargetValue": f"Country{i}",
+			"data": {ts: None if random.random() < NULL_RATE else round(random.uniform(0, 100), 2) for ts in shuffled},
+		})
+	return {"values": values}
+
+def get_stat_payload() -> dict:
+	random.seed(17)
+	ticks = [str(1685577600000 + i*3600000) for i in range(HOURS)]
+	return {
+		"data": {
+			f"Division{i}": {"type": "x", "data": {tick: random.randint(0, 500) for tick in random.sample(ticks, len(ticks))}}
+			for i in range(SERIES_COUNT)
+		}
+	}
+
+# the reducers as they were, one strptime per point and the oldest point kept
+def legacy_reduce_data(dashboard_data: dict) -> dict:
+	out = {}
+	for value_data in dashboard_data["values"]:
+		max_datetime = None
+		max_val = None
+		for ts, val in value_data["data"].items():
+			ts_datetime = datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ")
+			if max_datetime is None or max_datetime > ts_datetime:
+				max_datetime = ts_datetime
+				max_val = val
+		out[value_data["dataDivisionTargetValue"].lower()] = max_val
+	return out
+
+def legacy_reduce_stats(data: dict) -> dict:
+	out = {}
+	for name, data_table in data["data"].items():
+		max_tick = 0
+		final_val = None
+		for tick, val in data_table["data"].items():
+			if int(tick) > max_tick:
+				max_tick = int(tick)
+				final_val = val
+		out[name] = final_val
+	return out
+
+def run_case(name: str, func, number: int) -> float:
+	best = min(timeit.repeat(func, number=number, repeat=5))/number
+	print(f"{name:<30} {best*1000:>9.3f} ms")
+	return best
+
+def main():
+	breakdown = get_breakdown_payload()
+	stats = get_stat_payload()
+	print(f"{SERIES_COUNT} series x {HOURS} points")
+
+	# every reduced point must be the newest non null one
+	expected = {}
+	for value_data in breakdown["values"]:
+		points = {ts: val for ts, val in value_data["data"].items() if val != None}
+		expected[value_data["dataDivisionTargetValue"].lower()] = points[max(points, key=lambda ts: datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ"))]
+	assert dashboard.reduce_data(breakdown) == expected
+	assert legacy_reduce_stats(stats) == series.reduce_latest_tick((name, table["data"]) for name, table in stats["data"].items())
+
+	text = json.dumps(breakdown)
+	legacy = run_case("breakdown (legacy)", lambda: legacy_reduce_data(breakdown), 3)
+	latest = run_case("breakdown (latest iso)", lambda: dashboard.reduce_data(breakdown), 20)
+	run_case("breakdown parse + reduce", lambda: dashboard.parse_data(text), 20)
+	legacy_ticks = run_case("stats (legacy)", lambda: legacy_reduce_stats(stats), 20)
+	ticks = run_case("stats (latest tick)", lambda: series.reduce_latest_tick((name, table["data"]) for name, table in stats["data"].items()), 20)
+
+	print(f"breakdown speedup {legacy/latest:.1f}x, stats speedup {legacy_ticks/ticks:.1f}x")
+
+if __name__ == '__main__':
+	main()
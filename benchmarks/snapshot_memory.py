@@ -0,0 +1,125 @@
+import gc
+import json
+import time
+import random
+import tracemalloc
+import src.dashboard as dashboard
+import src.devstat as devstat
+import src.records as records
+from src import get_int_arg
+
+# a day of one minute snapshots
+DEFAULT_SNAPSHOTS = 60*24
+
+BREAKDOWN_SIZES: dict[str, int] = {
+	"device_type": 5,
+	"os": 6,
+	"age_group": 6,
+	"country": 60,
+	"locale": 20,
+	"total": 1,
+}
+
+def get_breakdown(prefix: str, size: int, ints: bool) -> dict:
+	return {
+		f"{prefix}{i}": None if random.random() < 0.02 else random.randint(0, 100000) if ints else round(random.uniform(0, 1000), 2)
+		for i in range(size)
+	}
+
+def get_snapshot(i: int) -> dict:
+	kpi = {
+		kpi_key: {breakdown_key: get_breakdown(breakdown_key, size, False) for breakdown_key, size in BREAKDOWN_SIZES.items()}
+		for kpi_key in dashboard.KPI_KEYS
+	}
+	aquisition: dict = {}
+	for path in dashboard.AQUISITION_KEYS:
+		branch = aquisition
+		for key in path:
+			branch = branch.setdefault(key, {})
+		for platform in dashboard.PLATFORM_FILTERS:
+			branch[platform.lower()] = {source: random.randint(0, 5000) for source in ["home", "organic", "search"]}
+
+	dev_stat: dict = {}
+	for path in devstat.STAT_KEYS:
+		branch = dev_stat
+		for key in path:
+			branch = branch.setdefault(key, {})
+		for division in devstat.DIVISION_KEYS:
+			branch[division] = get_breakdown(division, 6, True)
+
+	snapshot = {
+		"dashboard": {"kpi": kpi, "aquisition": aquisition},
+		"dev_stat": dev_stat,
+		"info": {
+			"rating": {"likes": random.randint(0, 10**6), "dislikes": random.randint(0, 10**5)},
+			"favorites": random.randint(0, 10**6),
+			"visits": random.randint(0, 10**9),
+			"concurrents": random.randint(0, 10**4),
+		},
+		"ads": [
+			{
+				"title": f"Ad {n}",
+				"id": str(9000+n),
+				"type": "Banner",
+				"is_running": n % 2 == 0,
+				"clicks": {"current": random.randint(0, 500), "total": random.randint(0, 5000)},
+				"ctr": {"current": random.random(), "total": random.random()},
+				"bid": {"current": random.randint(0, 500), "total": random.randint(0, 5000)},
+				"impressions": {"current": random.randint(0, 10**5), "total": random.randint(0, 10**6)},
+				"cpc": {"current": random.random(), "total": random.random()},
+			} for n in range(10)
+		],
+		"sponsors": [
+			{
+				"title": f"Sponsor {n}",
+				"id": 7000+n,
+				"status": "Running",
+				"bid": 10,
+				"budget": 1000,
+				"impressions": random.randint(0, 10**5),
+				"impression_conversions": random.randint(0, 1000),
+				"clicks": random.randint(0, 1000),
+				"click_conversions": random.randint(0, 100),
+				"target": {"gender": ["Male", "Female"], "age": ["Age13AndOver"], "device": ["Computer", "Phone"]},
+				"time": {"start": "2023-06-01T00:00:00Z", "end": "2023-07-01T00:00:00Z"},
+			} for n in range(5)
+		],
+		"meta": {},
+		"timestamp": f"2023y-06m-24d{i//60:02}h{i%60:02}m",
+	}
+	# a round trip through json, so keys are fresh strings as they are after a response is parsed
+	return json.loads(json.dumps(snapshot))
+
+def measure(name: str, count: int, convert) -> tuple[float, list]:
+	random.seed(17)
+	gc.collect()
+	tracemalloc.start()
+	held = [convert(get_snapshot(i), float(i*60)) for i in range(count)]
+	gc.collect()
+	size = tracemalloc.get_traced_memory()[0]/1024/1024
+	tracemalloc.stop()
+	print(f"{name:<16} {size:>10.1f} {size*1024/count:>12.1f}")
+	return size, held
+
+def main():
+	count = get_int_arg("-snapshots", DEFAULT_SNAPSHOTS)
+	print(f"{count} snapshots held in memory")
+	print(f"{'case':<16} {'held mb':>10} {'kb/snapshot':>12}")
+
+	dict_size, dicts = measure("dicts", count, lambda snapshot, recorded_at: snapshot)
+	del dicts
+	record_size, held = measure("records", count, records.SnapshotRecord.from_json)
+
+	# the records must write out exactly what the dicts would have
+	random.seed(17)
+	for i in range(min(count, 50)):
+		assert json.dumps(held[i].to_json()) == json.dumps(get_snapshot(i))
+
+	start = time.perf_counter()
+	for record in held:
+		record.to_json()
+	print(f"to_json {(time.perf_counter() - start)/len(held)*1000:.2f} ms per snapshot")
+	print(f"records hold {dict_size/record_size:.1f}x less memory")
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,71 @@
+import time
+import random
+import tempfile
+import tracemalloc
+from typing import Any
+import src.store as store
+import src.reader as reader
+from src.store import Store
+from src.writer import SnapshotWriter
+from src import get_arg, get_int_arg
+
+SECTION_NAMES = ["dashboard", "dev_stat", "info", "ads", "sponsors"]
+# keys per section, about 40 bytes of json each
+DEFAULT_SECTION_KEYS = 50000
+# a finisher's parse and reduce work, stood in for by a sleep
+FINISH_TIME = 0.05
+
+def get_section(name: str, keys: int) -> dict:
+	random.seed(name)
+	return {f"{name}.{i}": {"value": round(random.uniform(0, 1000), 2), "n": i} for i in range(keys)}
+
+def finish_section(name: str, keys: int) -> dict:
+	time.sleep(FINISH_TIME)
+	return get_section(name, keys)
+
+# the synchronous path as it was, the whole snapshot held until one append at the end
+def write_legacy(data_store: Store, keys: int) -> float:
+	final_data = {name: finish_section(name, keys) for name in SECTION_NAMES}
+	write_start = time.perf_counter()
+	data_store.append(final_data)
+	return time.perf_counter() - write_start
+
+def write_streamed(data_store: Store, keys: int) -> float:
+	snapshot_writer = SnapshotWriter()
+	spool = snapshot_writer.open(data_store)
+	for name in SECTION_NAMES:
+		spool.write(name, finish_section(name, keys))
+	spool.commit(time.time())
+	write_start = time.perf_counter()
+	snapshot_writer.close()
+	return time.perf_counter() - write_start
+
+def run_case(name: str, write, codec: store.Codec, keys: int) -> tuple[float, float]:
+	# timed and traced separately, tracemalloc slows the encoding several times over
+	path = tempfile.mkdtemp()
+	start = time.perf_counter()
+	visible = write(Store(path, codec), keys)
+	wall = time.perf_counter() - start
+
+	tracemalloc.start()
+	write(Store(tempfile.mkdtemp(), codec), keys)
+	peak = tracemalloc.get_traced_memory()[1]/1024/1024
+	tracemalloc.stop()
+
+	snapshots = list(reader.iter_snapshots(path))
+	assert len(snapshots) == 1 and list(snapshots[0][1]) == SECTION_NAMES
+	print(f"{name:<22} {wall:>8.2f} {visible*1000:>12.1f} {peak:>12.1f}")
+	return visible, peak
+
+def main():
+	codec: Any = get_arg("-codec") or store.get_default_codec()
+	keys = get_int_arg("-keys", DEFAULT_SECTION_KEYS)
+	print(f"{len(SECTION_NAMES)} sections x {keys} keys, {codec}")
+	print(f"{'case':<22} {'wall s':>8} {'end write ms':>12} {'peak mb':>12}")
+
+	legacy_visible, legacy_peak = run_case("append at end", write_legacy, codec, keys)
+	visible, peak = run_case("background writer", write_streamed, codec, keys)
+	print(f"end write {legacy_visible/max(visible, 1e-6):.1f}x shorter, peak memory {legacy_peak/peak:.1f}x lower")
+
+if __name__ == '__main__':
+	main()
@@ -1,16 +1,17 @@
 import os
-import multiprocessing
-import json
 import requests
-from datetime import datetime
-import base64
+from datetime import datetime, timedelta, timezone
 import src.util as util
-import src.ads as ads
-import src.dashboard as dashboard
-import src.devstat as devstat
-import src.info as info
-import src.sponsorships as sponsorships
+import src.transport as transport
+import src.cache as cache
+import src.metrics as metrics
 import sys
+from typing import Callable, Any, TYPE_CHECKING
+
+# collectors, stores and their sqlite side stores are imported by the subcommands that use them
+if TYPE_CHECKING:
+	from src.store import Store
+	from src.writer import SnapshotWriter
 
 ROBLOX_COOKIE_ENV_KEY = "ROBLOX_COOKIE"
 
@@ -25,6 +26,28 @@ def get_arg(key: str) -> str | None:
 				# return None
 	return None
 
+def get_int_arg(key: str, default: int) -> int:
+	str_val = get_arg(key)
+	if str_val is None:
+		return default
+	return int(str_val)
+
+def has_flag(key: str) -> bool:
+	return key in sys.argv
+
+def get_place_ids() -> list[int]:
+	places_arg = get_arg("-places")
+	if places_arg is not None:
+		return [int(place_id) for place_id in places_arg.split(",") if place_id.strip()]
+
+	places_path = get_arg("-places-file")
+	if places_path is not None:
+		with open(places_path) as places_file:
+			lines = [line.split("#")[0].strip() for line in places_file.read().splitlines()]
+		return [int(line) for line in lines if line]
+
+	return [get_place_id()]
+
 def get_place_id() -> int:
 	place_id_str = sys.argv[2]
 	assert place_id_str
@@ -46,73 +69,351 @@ def get_roblox_cookie() -> str:
 	assert roblox_cookie, "github secret ROBLOX_COOKIE does not exist"
 	return roblox_cookie
 
+def get_cadences() -> dict[str, int]:
+	import src.collectors as collectors
+	cadences = dict(collectors.DEFAULT_CADENCES)
+	cadence_arg = get_arg("-cadence")
+	if cadence_arg is not None:
+		for entry in cadence_arg.split(","):
+			name, seconds = entry.split("=")
+			assert name in collectors.COLLECTORS, f"unknown collector {name}"
+			cadences[name] = int(seconds)
+	return {name: seconds for name, seconds in cadences.items() if seconds > 0}
+
+def get_host_rates() -> dict[str, float]:
+	rates: dict[str, float] = {}
+	rates_arg = get_arg("-host-rates")
+	if rates_arg is not None:
+		for entry in rates_arg.split(","):
+			host, rate = entry.split("=")
+			assert float(rate) > 0, f"rate for {host} must be positive"
+			rates[host] = float(rate)
+	return rates
+
+def get_response_cache() -> cache.ResponseCache | None:
+	mode = get_arg("-response-cache")
+	if mode == None:
+		return None
+	assert mode in ["memory", "disk"], f"unknown response cache {mode}"
+
+	max_bytes = get_int_arg("-cache-mb", int(cache.DEFAULT_MAX_BYTES/1024/1024))*1024*1024
+	disk_path = util.get_cache_path(cache.RESPONSE_CACHE_FILE) if mode == "disk" else None
+	return cache.ResponseCache(max_bytes, disk_path=disk_path)
+
+def save_response_cache(session: requests.Session, report: bool = False):
+	response_cache = transport.get_cache(session)
+	if response_cache is None:
+		return
+	if report:
+		print(response_cache.get_report())
+	response_cache.save()
+
+def get_session(workers: int, logged_in: bool = True) -> requests.Session:
+	cache_dir = get_arg("-cache")
+	if cache_dir is not None:
+		util.set_cache_dir(cache_dir)
+
+	host_limit = get_int_arg("-host-limit", transport.DEFAULT_HOST_LIMIT)
+	transport.set_redirect(get_arg("-api-redirect"))
+	transport.set_host_rates(get_host_rates())
+
+	session = transport.mount(requests.Session(), workers, host_limit, get_response_cache())
+	if logged_in:
+		# session.headers["Content-Type"] = "text/plain"
+		session.cookies.update({
+			".ROBLOSECURITY": get_roblox_cookie()
+		})
+		session.headers.update({
+			"X-Csrf-Token": util.get_xcrf_token(session)
+		})
+	return session
+
+def get_store() -> "Store":
+	import src.store as store
+	out_path = get_arg("-o")
+	assert out_path is not None, "-o is required"
+
+	codec: Any = get_arg("-codec") or store.get_default_codec()
+	assert codec in store.CODEC_IDS, f"unknown codec {codec}"
+	return store.Store(out_path, codec)
+
+def open_history():
+	import src.history as history
+	if has_flag("-no-history"):
+		return
+	history_path = get_arg("-history")
+	if history_path == None:
+		out_path = get_arg("-o")
+		assert out_path != None
+		history_path = os.path.join(out_path, history.HISTORY_FILE)
+	history.set_history(history_path)
+
+def get_rollup_metrics() -> list[str] | None:
+	import src.rollup as rollup
+	if has_flag("-no-rollup"):
+		return None
+	metrics_arg = get_arg("-rollup-metrics")
+	if metrics_arg is None:
+		return rollup.DEFAULT_METRICS
+	return [metric.strip() for metric in metrics_arg.split(",") if metric.strip()]
+
+def get_place_stores(place_ids: list[int]) -> dict[int, "Store"]:
+	from src.store import Store
+	data_store = get_store()
+	if get_arg("-places") == None and get_arg("-places-file") == None:
+		return {place_ids[0]: data_store}
+
+	# multi-place records go to one store per place under -o
+	return {
+		place_id: Store(os.path.join(data_store.path, str(place_id)), data_store.codec)
+		for place_id in place_ids
+	}
+
+def collect_sections(place_id: int, sections: dict[str, Callable[[], Any]], write: Callable[[str, Any], None]) -> dict:
+	import src.retry as retry
+	# a failing collector only loses its own section, the rest are still written.
+	# each section goes to write as soon as it is finished, only the meta is returned
+	written: list[str] = []
+	failures: dict[tuple[str, int], str] = {}
+	for name, finish in sections.items():
+		try:
+			write(name, finish())
+			written.append(name)
+		except Exception as e:
+			print(f"{name} data failed for {place_id}: {e}")
+			failures[(name, place_id)] = f"{type(e).__name__}: {e}"
+
+	resolved = retry.update_queue(failures, [(name, place_id) for name in written])
+
+	meta: dict = {}
+	if len(failures) > 0:
+		meta["missing"] = {name: error for (name, _), error in failures.items()}
+	if len(resolved) > 0:
+		# sections that fill in for an earlier failed run
+		meta["backfill"] = {name: entry["failed_at"] for (name, _), entry in resolved.items()}
+	return meta
+
+def write_snapshot(snapshot_writer: "SnapshotWriter", data_store: "Store", place_id: int, sections: dict[str, Callable[[], Any]]):
+	spool = snapshot_writer.open(data_store)
+	meta = collect_sections(place_id, sections, spool.write)
+	now = datetime.now()
+	meta["metrics"] = metrics.get_snapshot(place_id, spool.names + list(meta.get("missing", {})))
+	spool.write("meta", meta)
+	spool.write("timestamp", now.strftime("%Yy-%mm-%dd%Hh%Mm"))
+	spool.commit(now.timestamp())
+
+def write_metrics():
+	metrics_path = get_arg("-metrics-file")
+	if metrics_path != None:
+		metrics.write_textfile(metrics_path)
+
 def main():
 
-	try:
+	if "run" == sys.argv[1]:
+		import src.collectors as collectors
+		import src.retry as retry
+		from src.writer import SnapshotWriter
+		from src.planner import Planner
+		place_ids = get_place_ids()
+
+		workers = get_int_arg("-workers", 1)
+		dry_run = has_flag("-dry-run")
+		session = get_session(workers, not dry_run)
+		if not dry_run:
+			open_history()
+
+		interval = int(get_arg("-interval"))
+		assert interval != None
+
+		group_id = int(get_arg("-group"))
+		assert group_id != None
+
+		contexts = collectors.get_contexts(session, place_ids, interval, group_id)
+
+		profile_dir = get_arg("-profile")
+		if profile_dir != None:
+			import src.profiling as profiling
+			place_stores = get_place_stores(place_ids)
+			snapshot_writer = SnapshotWriter(get_rollup_metrics())
+
+			def write_places(profiled_sections: dict[int, dict[str, Callable[[], Any]]]):
+				for place_id, sections in profiled_sections.items():
+					write_snapshot(snapshot_writer, place_stores[place_id], place_id, sections)
+				# the store stage includes the writes it handed off
+				snapshot_writer.flush()
+
+			stages = profiling.profile_run(profile_dir, session, contexts, collectors.RUN_COLLECTORS, write_places)
+			print(profiling.get_report(stages))
+			snapshot_writer.close()
+			save_response_cache(session)
+			write_metrics()
+			return
+
+		# every run is a retry tick, queued collectors outside the usual set ride along
+		queued: dict[int, list[str]] = {}
+		if not dry_run:
+			for entry in retry.get_queued(place_ids, due_only=False):
+				if not entry["collector"] in collectors.RUN_COLLECTORS and entry["collector"] in collectors.COLLECTORS:
+					queued.setdefault(entry["place_id"], []).append(entry["collector"])
+
+		planner = Planner()
+		place_sections = {
+			ctx["place_id"]: collectors.plan_sections(planner, ctx, collectors.RUN_COLLECTORS + queued.get(ctx["place_id"], []))
+			for ctx in contexts
+		}
+		if dry_run:
+			print(f"planned {planner.get_request_count()} requests, {planner.get_unique_count()} unique")
+			return
 
-		if "run" == sys.argv[1]:
-			place_id = get_place_id()
+		place_stores = get_place_stores(place_ids)
+		snapshot_writer = SnapshotWriter(get_rollup_metrics())
 
-			session = requests.Session()
-			# session.headers["Content-Type"] = "text/plain"
-			session.cookies.update({
-				".ROBLOSECURITY": get_roblox_cookie()
-			})
-			session.headers.update({
-				"X-Csrf-Token": util.get_xcrf_token(session)
-			})
+		if has_flag("-async"):
+			import src.aio as aio
+			aio.execute_sync(planner, session, get_int_arg("-host-limit", transport.DEFAULT_HOST_LIMIT))
+		else:
+			planner.execute(session, workers)
 
-			out_path = get_arg("-o")
-			assert out_path != None
+		for place_id, sections in place_sections.items():
+			write_snapshot(snapshot_writer, place_stores[place_id], place_id, sections)
 
-			interval = int(get_arg("-interval"))
-			assert interval != None
+		# the writer drains in the background while the cache and metrics are saved
+		save_response_cache(session, report=True)
+		write_metrics()
+		snapshot_writer.close()
 
-			group_id = int(get_arg("-group"))
-			assert group_id != None
+	elif "daemon" == sys.argv[1]:
+		import src.daemon as daemon
+		import src.collectors as collectors
+		from src.writer import SnapshotWriter
+		place_ids = get_place_ids()
 
-			final_data = {}
-			# try:
-			final_data["dashboard"] = dashboard.record_data(session, place_id, interval)
-			# except:
-				# print("dashboard data failed")
+		workers = get_int_arg("-workers", 1)
+		session = get_session(workers)
+		open_history()
 
-			# try:
-			final_data["dev_stat"] = devstat.get_data(session, place_id)
-			# except:
-				# print("dev stat data failed")	
+		place_stores = get_place_stores(place_ids)
+		snapshot_writer = SnapshotWriter(get_rollup_metrics())
 
-			# try:
-			final_data["info"] = info.get_game_stats(session, place_id)
-			# except:
-				# print("info data failed")	
+		interval = int(get_arg("-interval"))
+		assert interval != None
 
-			# try:
-			final_data["ads"] = ads.get_ads(session, place_id, group_id)
-			# except:
-				# print("ad data failed")	
+		group_id = int(get_arg("-group"))
+		assert group_id != None
 
-			
+		jitter_arg = get_arg("-jitter")
+		jitter = daemon.DEFAULT_JITTER if jitter_arg == None else float(jitter_arg)
 
-			try:
-				final_data["sponsors"] = sponsorships.get_sponsors(session, place_id)
-			except:
-				print("sponsor data failed")	
+		def write_sections(place_id: int, sections: dict[str, Callable[[], Any]]):
+			write_snapshot(snapshot_writer, place_stores[place_id], place_id, sections)
+			save_response_cache(session)
+			write_metrics()
 
-			now = datetime.now()
-			now_txt = now.strftime("%Yy-%mm-%dd%Hh%Mm")
-			final_data["timestamp"] = now_txt
+		metrics_port = get_arg("-metrics-port")
+		if metrics_port != None:
+			metrics.serve(int(metrics_port))
 
-			file_name = now_txt.replace(":","_")+".txt"
+		daemon.run_daemon(
+			session=session,
+			contexts=collectors.get_contexts(session, place_ids, interval, group_id),
+			cadences=get_cadences(),
+			write=write_sections,
+			workers=workers,
+			jitter=jitter,
+		)
+		snapshot_writer.close()
 
-			with open(out_path+"/"+file_name, "wb") as data_file:
-				data_file.write(base64.b64encode(bytes(json.dumps(final_data), "utf-8")))
+	elif "backfill" == sys.argv[1]:
+		import src.backfill as backfill
+		place_ids = get_place_ids()
 
-	except:
-		raise ValueError("something went wrong")
+		workers = get_int_arg("-workers", 1)
+		session = get_session(workers)
+		assert not has_flag("-no-history"), "backfill writes to the history store"
+		open_history()
+
+		start_arg = get_arg("-start")
+		assert start_arg != None
+		start_time = datetime.strptime(start_arg, "%Y-%m-%d")
+
+		end_arg = get_arg("-end")
+		end_time = None if end_arg is None else datetime.strptime(end_arg, "%Y-%m-%d")
+		assert start_time < (backfill.get_default_end() if end_time is None else end_time)
+
+		window = timedelta(hours=get_int_arg("-window-hours", int(backfill.DEFAULT_WINDOW.total_seconds()/3600)))
+		jobs = backfill.get_jobs(util.get_universe_ids(session, place_ids), start_time, end_time, window)
+		points = backfill.run_backfill(
+			session,
+			jobs,
+			checkpoint_path=get_arg("-checkpoint"),
+			workers=workers,
+			batch=get_int_arg("-batch", backfill.DEFAULT_BATCH),
+		)
+		print(f"backfilled {points} points")
+		save_response_cache(session)
+		write_metrics()
+
+	elif "rollup" == sys.argv[1]:
+		import src.rollup as rollup
+		out_path = get_arg("-o")
+		assert out_path != None
+
+		rollup_store = rollup.Rollup(os.path.join(out_path, rollup.ROLLUP_FILE), get_rollup_metrics() or rollup.DEFAULT_METRICS)
+		if has_flag("-rebuild"):
+			print(f"rebuilt {rollup.rebuild(rollup_store, out_path)} rollup points")
+
+		metric = get_arg("-metric")
+		if metric == None:
+			for name in rollup_store.get_metrics():
+				print(name)
+		else:
+			start_arg = get_arg("-start")
+			end_arg = get_arg("-end")
+			rows = rollup_store.query(
+				metric,
+				get_arg("-period") or "1h",
+				None if start_arg == None else datetime.strptime(start_arg, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp(),
+				None if end_arg == None else datetime.strptime(end_arg, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp(),
+			)
+			print(f"{'start':<20} {'count':>7} {'min':>12} {'max':>12} {'avg':>12} {'last':>12}")
+			for row in rows:
+				start = datetime.fromtimestamp(row["start"], timezone.utc).strftime("%Y-%m-%d %H:%M")
+				print(f"{start:<20} {row['count']:>7} {row['min']:>12g} {row['max']:>12g} {row['avg']:>12g} {row['last']:>12g}")
+		rollup_store.close()
+
+	elif "export" == sys.argv[1]:
+		import src.export as export
+		out_path = get_arg("-o")
+		assert out_path != None
+
+		file_arg = get_arg("-file")
+		assert file_arg != None
+		export_format = export.get_format(file_arg, get_arg("-format"))
+		file_path = export.get_export_path(file_arg, export_format)
+
+		start_arg = get_arg("-start")
+		end_arg = get_arg("-end")
+		fields_arg = get_arg("-fields")
+		written = export.export_store(
+			out_path,
+			file_path,
+			export_format,
+			start=0 if start_arg == None else datetime.strptime(start_arg, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp(),
+			end=float("inf") if end_arg == None else datetime.strptime(end_arg, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp(),
+			fields=None if fields_arg == None else fields_arg.split(","),
+			batch=get_int_arg("-batch", export.DEFAULT_BATCH),
+			row_group_bytes=get_int_arg("-row-group-mb", int(export.DEFAULT_ROW_GROUP_BYTES/1024/1024))*1024*1024,
+		)
+		print(f"exported {written} snapshots to {file_path}")
+
+	elif "compact" == sys.argv[1]:
+		import src.compact as compact
+		grace = timedelta(minutes=get_int_arg("-grace", int(compact.DEFAULT_GRACE.total_seconds()/60)))
+		for block_path in compact.compact_store(get_store(), grace):
+			print(f"compacted {block_path}")
 
 # prevent from running twice
 if __name__ == '__main__':
+	import multiprocessing
 	multiprocessing.freeze_support()
-	main()		
-
+	main()
@@ -1,7 +1,10 @@
 from requests import Session
 import json
 import src.util as util
-from typing import TypedDict
+import src.aio as aio
+from src.planner import Planner, Handle, run_plan
+from functools import cache
+from typing import TypedDict, Any
 
 GAME_URL_PREFIX = "https://www.roblox.com/games/"
 
@@ -14,7 +17,8 @@ class FloatCurTotalData(TypedDict):
 
 class AdData(TypedDict):
 	title: str
-	id: int
+	# the data-item-id attribute, lxml attributes are strings
+	id: str
 	type: str
 	is_running: bool
 	clicks: IntCurTotalData
@@ -23,97 +27,113 @@ class AdData(TypedDict):
 	cpc: FloatCurTotalData
 	bid: IntCurTotalData
 
-def get_ads(session: Session, place_id: int, group_id: int) -> list[AdData]:
-	ad_url = ""
+def get_ad_url(group_id: int) -> str:
 	is_in_group = True
 	if is_in_group:
-		ad_url = f"https://www.roblox.com/develop/groups/{group_id}?Page=ads"
+		return f"https://www.roblox.com/develop/groups/{group_id}?Page=ads"
 	else:
-		ad_url = "https://www.roblox.com/develop?Page=ads"
-	
-	response = session.get(ad_url)
-	tree = util.get_html_tree(response.text)
+		return "https://www.roblox.com/develop?Page=ads"
+
+# evaluated relative to each ad table, so each table is only walked once
+AD_XPATHS: dict[str, str] = {
+	"table": "//table[@data-ad-type]",
+	"title": ".//td[@colspan='6']//span[not(@href) and @class='title']",
+	"link": ".//td[@colspan='6']//a/@href",
+	"not_running": ".//*[text()='Not running']",
+	"totals": ".//td[@class='stats-col']//div[@class='totals-label']",
+	"totals_value": ".//span/text()",
+}
+
+@cache
+def get_ad_xpaths() -> dict[str, Any]:
+	# compiled on the first parse, so lxml is not loaded at startup
+	return util.compile_xpaths(AD_XPATHS)
+
+# label prefix, stat key
+AD_STAT_LABELS: list[tuple[str, str]] = [
+	("Clicks", "clicks"),
+	("Bid", "bid"),
+	("CTR", "ctr"),
+	("Impr", "impressions"),
+]
+
+def parse_ad_stats(tabl) -> tuple[dict[str, float], dict[str, float]]:
+	xpaths = get_ad_xpaths()
+	current: dict[str, float] = {}
+	total: dict[str, float] = {}
+	for div in xpaths["totals"](tabl):
+		# totals carry a title tooltip, current values do not
+		stats = current if div.get("title") == None else total
+		label = div.text or ""
+		for span_text in xpaths["totals_value"](div):
+			for prefix, key in AD_STAT_LABELS:
+				if prefix in label:
+					if key == "ctr":
+						stats[key] = float(span_text.replace("%", ""))/100
+					else:
+						stats[key] = int(span_text)
+					break
+	return current, total
+
+def parse_ads(text: str, place_id: int) -> list[AdData]:
+	tree = util.get_html_tree(text)
+	xpaths = get_ad_xpaths()
 
 	ads: list[AdData] = []
 
-	for tabl in tree.xpath('//table[@data-ad-type]'):
-		# get title
-		ad_id = tabl.get("data-item-id")
-		ad_type = tabl.get("data-ad-type")
-		ad_place_id: int
+	for tabl in xpaths["table"](tree):
+		ad_place_id: int | None = None
+		for a_url in xpaths["link"](tabl):
+			if GAME_URL_PREFIX in a_url:
+				ad_place_id = int(a_url.replace(GAME_URL_PREFIX, "").split("/")[0])
+		if place_id != ad_place_id:
+			continue
+
 		ad_title: str
-		for title in tabl.xpath('.//td[@colspan="6"]'):
-		
-			for span in title.xpath(".//span[not(@href) and @class='title']"):
-				ad_title = span.text
-
-			for a in title.xpath('.//a[@href]'):
-				a_url = a.get("href")
-				if GAME_URL_PREFIX in a_url:
-					url_end = a_url.replace(GAME_URL_PREFIX, "")
-					ad_place_id = int(url_end.split("/")[0])
-
-		# get stats
-		clicks: int
-		total_clicks: int
-		ctr: float
-		total_ctr: float
-		bid: int
-		total_bid: int
-		impressions: int
-		total_impressions: int
-		is_running: bool = len(tabl.xpath("//*[text()='Not running']")) == 0
-		for stats in tabl.xpath('.//td[@class="stats-col"]'):
-			for div in stats.xpath(".//div[not(@title) and @class='totals-label']"):
-				for span in div.xpath(".//span"):
-					if "Clicks" in div.text:
-						clicks = int(span.text)
-					elif "Bid" in div.text:
-						bid = int(span.text)
-					elif "CTR" in div.text:
-						ctr = float(span.text.replace("%", ""))/100
-					elif "Impressions" in div.text:
-						impressions = int(span.text)
-
-			for div in stats.xpath(".//div[@title and @class='totals-label']"):
-				for span in div.xpath(".//span"):
-					if "Clicks" in div.text:
-						total_clicks = int(span.text)
-					elif "Bid" in div.text:
-						total_bid = int(span.text)
-					elif "CTR" in div.text:
-						total_ctr = float(span.text.replace("%", ""))/100
-					elif "Impr" in div.text:
-						total_impressions = int(span.text)
+		for span in xpaths["title"](tabl):
+			ad_title = span.text
+
+		current, total = parse_ad_stats(tabl)
+		clicks = int(current["clicks"])
+		total_clicks = int(total["clicks"])
+		bid = int(current["bid"])
+		total_bid = int(total["bid"])
 
 		ad_data: AdData = {
 			"title": ad_title,
-			"id": ad_id,
-			"type": ad_type,
-			"is_running": is_running,
+			"id": tabl.get("data-item-id"),
+			"type": tabl.get("data-ad-type"),
+			"is_running": len(xpaths["not_running"](tabl)) == 0,
 			"clicks": {
 				"current": clicks,
 				"total": total_clicks,
 			},
 			"ctr": {
-				"current": ctr,
-				"total": total_ctr,
+				"current": current["ctr"],
+				"total": total["ctr"],
 			},
 			"bid": {
 				"current": bid,
 				"total": total_bid,
 			},
 			"impressions": {
-				"current": impressions,
-				"total": total_impressions,
+				"current": int(current["impressions"]),
+				"total": int(total["impressions"]),
 			},
 			"cpc": {
 				"current": float(bid)/float(max(clicks,1)),
 				"total": float(total_bid)/float(max(total_clicks,1)),
 			},
 		}
-		if place_id == ad_place_id:
-			ads.append(ad_data)
+		ads.append(ad_data)
 
 	return ads
 
+def plan_ads(planner: Planner, place_id: int, group_id: int) -> Handle[list[AdData]]:
+	return planner.get(get_ad_url(group_id), lambda text: parse_ads(text, place_id))
+
+def get_ads(session: Session, place_id: int, group_id: int) -> list[AdData]:
+	return run_plan(session, lambda planner: plan_ads(planner, place_id, group_id).result)
+
+async def get_ads_async(client: aio.AsyncTransport, place_id: int, group_id: int) -> list[AdData]:
+	return await aio.run_plan(client, lambda planner: plan_ads(planner, place_id, group_id).result)
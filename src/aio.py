@@ -0,0 +1,176 @@
+import time
+from urllib.parse import urlsplit
+from requests import Session
+from requests.models import DEFAULT_REDIRECT_LIMIT
+from typing import Callable, TypeVar, Any
+import src.util as util
+import src.transport as transport
+import src.metrics as metrics
+from src.planner import Planner, RequestSpec
+from src.cache import ResponseCache
+
+# asyncio and httpx are imported where they are used, only -async runs pay for them
+
+def is_http2_available() -> bool:
+	try:
+		import h2
+		return True
+	except ImportError:
+		return False
+
+T = TypeVar("T")
+
+class AsyncTransport:
+	def __init__(
+		self,
+		host_limit: int = transport.DEFAULT_HOST_LIMIT,
+		cookies: dict[str, str] = {},
+		headers: dict[str, str] = {},
+		cache: ResponseCache | None = None
+	):
+		try:
+			import httpx
+		except ImportError:
+			raise AssertionError("install httpx to use the async transport")
+
+		self.host_limit = max(host_limit, 1)
+		self.cache = cache
+		self.slots: dict[str, Any] = {}
+		self.client = httpx.AsyncClient(
+			http2=is_http2_available(),
+			limits=httpx.Limits(
+				max_connections=self.host_limit*len(transport.HOST_RATES),
+				max_keepalive_connections=self.host_limit*len(transport.HOST_RATES),
+			),
+			timeout=transport.DEFAULT_TIMEOUT,
+			# follow redirects the way the requests session does
+			follow_redirects=True,
+			max_redirects=DEFAULT_REDIRECT_LIMIT,
+			cookies=cookies,
+			headers=headers,
+		)
+
+	async def __aenter__(self) -> "AsyncTransport":
+		return self
+
+	async def __aexit__(self, *args):
+		await self.client.aclose()
+
+	def get_slot(self, host: str) -> Any:
+		import asyncio
+		if not host in self.slots:
+			self.slots[host] = asyncio.Semaphore(self.host_limit)
+		return self.slots[host]
+
+	def rotate_csrf_token(self, response: Any) -> bool:
+		old_token = self.client.headers.get("X-Csrf-Token")
+		new_token = response.headers.get("x-csrf-token")
+		if response.status_code != 403 or old_token is None or new_token is None or new_token == old_token:
+			return False
+		self.client.headers["X-Csrf-Token"] = new_token
+		return True
+
+	async def send(self, spec: RequestSpec) -> str:
+		headers: dict[str, str] = {}
+		if spec.content_type is not None:
+			headers["Content-Type"] = spec.content_type
+
+		cache = self.cache
+		if cache is None:
+			return (await self.send_uncached(spec, headers)).text
+
+		key = (spec.method, spec.url, spec.body)
+		entry = cache.lookup(key)
+		if entry is not None and entry.is_fresh():
+			return entry.content.decode(entry.encoding or "utf-8")
+
+		response = await self.send_uncached(spec, {**headers, **cache.get_validators(entry)})
+		if entry is not None and response.status_code == 304:
+			cache.revalidated(key, entry)
+			return entry.content.decode(entry.encoding or "utf-8")
+
+		cache.store(key, response.status_code, response.headers, response.content, response.encoding)
+		return response.text
+
+	async def send_uncached(self, spec: RequestSpec, headers: dict[str, str]) -> Any:
+		import asyncio
+		host = urlsplit(spec.url).netloc
+		bucket = transport.get_bucket(host)
+
+		attempt = 0
+		rotated = False
+		while True:
+			async with self.get_slot(host):
+				wait = bucket.reserve()
+				if wait > 0:
+					await asyncio.sleep(wait)
+				sent_at = time.perf_counter()
+				response = await self.client.request(spec.method, transport.get_redirect_url(spec.url), content=spec.body, headers=headers)
+				metrics.observe_request(spec.url, response.status_code, time.perf_counter() - sent_at, len(response.content), attempt > 0 or rotated)
+
+			if not rotated and self.rotate_csrf_token(response):
+				rotated = True
+				continue
+
+			delay = transport.get_retry_delay(response.status_code, response.headers, attempt)
+			if response.status_code == 429:
+				bucket.on_throttle(transport.get_retry_after(response.headers))
+			elif response.status_code < 400:
+				bucket.on_success()
+
+			if delay is None:
+				if response.status_code != 304:
+					response.raise_for_status()
+				return response
+
+			await asyncio.sleep(delay)
+			attempt += 1
+
+def from_session(session: Session, host_limit: int = transport.DEFAULT_HOST_LIMIT) -> AsyncTransport:
+	headers = {}
+	if "X-Csrf-Token" in session.headers:
+		headers["X-Csrf-Token"] = str(session.headers["X-Csrf-Token"])
+	return AsyncTransport(host_limit, session.cookies.get_dict(), headers, transport.get_cache(session))
+
+async def execute(planner: Planner, client: AsyncTransport):
+	import asyncio
+
+	async def fetch(spec: RequestSpec):
+		# each gathered task runs in its own copy of the context
+		metrics.owner_var.set(planner.get_owner(spec))
+		try:
+			planner.resolve(spec, await client.send(spec), None)
+		except Exception as e:
+			planner.resolve(spec, None, e)
+
+	await asyncio.gather(*(fetch(spec) for spec in planner.take_pending()))
+
+async def run_plan(client: AsyncTransport, build: Callable[[Planner], Callable[[], T]]) -> T:
+	planner = Planner()
+	finish = build(planner)
+	await execute(planner, client)
+	return finish()
+
+async def get_universe_ids(client: AsyncTransport, place_ids: list[int]) -> dict[int, int]:
+	missing = util.take_cached_universe_ids(place_ids)
+	if len(missing) > 0:
+		resolved: dict[int, int] = {}
+		for i in range(0, len(missing), util.PLACE_BATCH_SIZE):
+			batch = missing[i:i+util.PLACE_BATCH_SIZE]
+			text = await client.send(RequestSpec("GET", util.get_multiget_url(batch)))
+			resolved.update(util.parse_universe_ids(batch, text))
+		util.save_universe_ids(resolved)
+
+	return {place_id: util.universe_ids[place_id] for place_id in place_ids}
+
+async def get_universe_id(client: AsyncTransport, place_id: int) -> int:
+	return (await get_universe_ids(client, [place_id]))[place_id]
+
+def execute_sync(planner: Planner, session: Session, host_limit: int = transport.DEFAULT_HOST_LIMIT):
+	import asyncio
+
+	async def execute_all():
+		async with from_session(session, host_limit) as client:
+			await execute(planner, client)
+
+	asyncio.run(execute_all())
@@ -0,0 +1,183 @@
+import os
+import json
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from requests import Session
+from typing import Callable
+import src.util as util
+import src.dashboard as dashboard
+import src.devstat as devstat
+import src.history as history
+from src.devstat import GranularityType, StatType
+from src.planner import Planner, Handle
+
+CHECKPOINT_FILE = "backfill-checkpoint.json"
+DEFAULT_WINDOW = timedelta(hours=24)
+# jobs planned into one execution, progress is checkpointed between batches
+DEFAULT_BATCH = 8
+DEV_STAT_GRANULARITIES: list[GranularityType] = ["Hourly", "Daily", "Monthly"]
+
+# a job plans its requests and returns a finisher that stores them, giving the point count
+BackfillPlan = Callable[[Planner], Callable[[], int]]
+
+def get_windows(start_time: datetime, end_time: datetime, window: timedelta) -> list[tuple[datetime, datetime]]:
+	windows = []
+	while start_time < end_time:
+		windows.append((start_time, min(start_time + window, end_time)))
+		start_time += window
+	return windows
+
+def get_dev_stat_metric(stat_type: StatType, granularity_type: GranularityType) -> str:
+	# hourly points share a series with the collector, coarser ones get their own
+	if granularity_type == "Hourly":
+		return stat_type
+	return f"{stat_type}/{granularity_type}"
+
+def store_points(history_store: history.History, finishers: list[Callable[[history.History], int]]) -> int:
+	return sum(finish(history_store) for finish in finishers)
+
+def store_dashboard_series(universe_id: int, kpi_type: str, break_down_type: str, handle: Handle, history_store: history.History) -> int:
+	return history_store.upsert_series(
+		"dashboard", universe_id, kpi_type, break_down_type,
+		((value_data["dataDivisionTargetValue"].lower(), value_data["data"]) for value_data in handle.result()["values"])
+	)
+
+def store_aquisition_series(universe_id: int, metric_type: str, platform_filter: str, handle: Handle, history_store: history.History) -> int:
+	return history_store.upsert_series(
+		"acquisition", universe_id, metric_type, platform_filter,
+		(
+			(value_data["breakdowns"][0]["value"].lower(), {point["timestamp"]: point["value"] for point in value_data["datapoints"]})
+			for value_data in handle.result()["values"]
+		),
+		history.iso_to_ts,
+	)
+
+def store_dev_stat_series(place_id: int, metric: str, division_type: str, handle: Handle, history_store: history.History) -> int:
+	return history_store.upsert_series(
+		"dev_stat", place_id, metric, division_type,
+		((name, data_table["data"]) for name, data_table in handle.result()["data"].items()),
+		history.tick_to_ts,
+	)
+
+def plan_dashboard_window(planner: Planner, universe_id: int, start_time: datetime, end_time: datetime) -> Callable[[], int]:
+	finishers: list[Callable[[history.History], int]] = []
+
+	for kpi_type in dashboard.KPI_KEYS.values():
+		for break_down_type in dashboard.BREAKDOWN_KEYS.values():
+			handle = planner.post_json(
+				dashboard.get_breakdown_url(universe_id),
+				dashboard.get_data_payload(universe_id, break_down_type, kpi_type, start_time, end_time),
+			)
+			finishers.append(partial(store_dashboard_series, universe_id, kpi_type, break_down_type, handle))
+
+	for metric_type in dashboard.AQUISITION_KEYS.values():
+		for platform_filter in dashboard.PLATFORM_FILTERS:
+			handle = dashboard.plan_aquisition_data(
+				planner=planner,
+				universe_id=universe_id,
+				metric=metric_type,
+				start_time=start_time,
+				end_time=end_time,
+				filters=["Organic", "Home"],
+				platform=platform_filter,
+			)
+			finishers.append(partial(store_aquisition_series, universe_id, metric_type, platform_filter, handle))
+
+	return lambda: store_points(get_history_store(), finishers)
+
+def plan_dev_stats(planner: Planner, place_id: int) -> Callable[[], int]:
+	# the stats endpoints take no range, each granularity serves the span roblox keeps for it
+	finishers: list[Callable[[history.History], int]] = []
+	for stat_type in devstat.STAT_KEYS.values():
+		for division_type in devstat.DIVISION_KEYS.values():
+			for granularity_type in DEV_STAT_GRANULARITIES:
+				handle = devstat.plan_dev_stat_data(planner, place_id, stat_type, granularity_type, division_type)
+				finishers.append(partial(store_dev_stat_series, place_id, get_dev_stat_metric(stat_type, granularity_type), division_type, handle))
+
+	return lambda: store_points(get_history_store(), finishers)
+
+def get_history_store() -> history.History:
+	history_store = history.get_history()
+	assert history_store is not None, "backfill needs a history store"
+	return history_store
+
+def get_default_end() -> datetime:
+	# the current hour is still filling in, it is left to the collectors
+	return datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+
+def get_jobs(
+	universe_ids: dict[int, int],
+	start_time: datetime,
+	end_time: datetime | None = None,
+	window: timedelta = DEFAULT_WINDOW,
+) -> dict[str, BackfillPlan]:
+	# keys only use the explicit range, so a resumed backfill matches its checkpoint in a later hour
+	fetch_end = get_default_end() if end_time is None else end_time
+	range_key = start_time.strftime(history.TS_FORMAT)
+	if end_time is not None:
+		range_key += "/"+end_time.strftime(history.TS_FORMAT)
+
+	jobs: dict[str, BackfillPlan] = {}
+	# places of one universe share its dashboard, so each universe is fetched once
+	for universe_id in sorted(set(universe_ids.values())):
+		for window_start, window_end in get_windows(start_time, fetch_end, window):
+			key_end = window_start + window if end_time is None else min(window_start + window, end_time)
+			key = f"dashboard/{universe_id}/{window_start.strftime(history.TS_FORMAT)}/{key_end.strftime(history.TS_FORMAT)}"
+			jobs[key] = partial(plan_dashboard_window, universe_id=universe_id, start_time=window_start, end_time=window_end)
+
+	for place_id in universe_ids:
+		jobs[f"dev_stat/{place_id}/{range_key}"] = partial(plan_dev_stats, place_id=place_id)
+
+	return jobs
+
+def read_checkpoint(path: str) -> set[str]:
+	if not os.path.exists(path):
+		return set()
+	try:
+		with open(path) as checkpoint_file:
+			return set(json.load(checkpoint_file))
+	except ValueError:
+		return set()
+
+def write_checkpoint(path: str, done: set[str]):
+	with open(path+".tmp", "w") as checkpoint_file:
+		json.dump(sorted(done), checkpoint_file, indent=1)
+	os.replace(path+".tmp", path)
+
+def run_backfill(
+	session: Session,
+	jobs: dict[str, BackfillPlan],
+	checkpoint_path: str | None = None,
+	workers: int = 1,
+	batch: int = DEFAULT_BATCH,
+) -> int:
+	if checkpoint_path is None:
+		checkpoint_path = util.get_cache_path(CHECKPOINT_FILE)
+
+	done = read_checkpoint(checkpoint_path)
+	pending = [key for key in jobs if not key in done]
+	print(f"backfill has {len(pending)} of {len(jobs)} jobs left")
+
+	points = 0
+	failed = 0
+	for i in range(0, len(pending), batch):
+		# the whole batch runs as one plan, so its windows share the worker pool and host limits
+		planner = Planner()
+		finishers = {key: jobs[key](planner) for key in pending[i:i+batch]}
+		planner.execute(session, workers)
+
+		for key, finish in finishers.items():
+			try:
+				points += finish()
+				done.add(key)
+			except Exception as e:
+				# left out of the checkpoint, so the next backfill tries it again
+				print(f"backfill {key} failed: {e}")
+				failed += 1
+
+		write_checkpoint(checkpoint_path, done)
+		print(f"backfilled {min(i+batch, len(pending))}/{len(pending)} jobs, {points} points")
+
+	if failed > 0:
+		print(f"{failed} jobs failed, run backfill again to retry them")
+	return points
@@ -0,0 +1,198 @@
+import os
+import json
+import zlib
+import struct
+from typing import Any, Iterator, Literal
+
+ColumnKind = Literal["i", "f"]
+ColumnKey = tuple[tuple[str | int, ...], ColumnKind]
+
+BLOCK_MAGIC = b"MIDBK\x00"
+BLOCK_VERSION = 1
+BLOCK_SUFFIX = ".blk"
+
+# magic, version, record count
+BLOCK_HEADER = struct.Struct("<6sHI")
+LENGTH = struct.Struct("<I")
+DOUBLE = struct.Struct("<d")
+BITS = struct.Struct("<Q")
+
+RECORDED_AT_PATH: tuple[str | int, ...] = ("__recorded_at__",)
+
+def encode_varint(val: int, out: bytearray):
+	while val >= 0x80:
+		out.append((val & 0x7f) | 0x80)
+		val >>= 7
+	out.append(val)
+
+def decode_varint(data: bytes, offset: int) -> tuple[int, int]:
+	val = 0
+	shift = 0
+	while True:
+		byte = data[offset]
+		offset += 1
+		val |= (byte & 0x7f) << shift
+		if byte < 0x80:
+			return val, offset
+		shift += 7
+
+def zigzag(val: int) -> int:
+	return val*2 if val >= 0 else -val*2 - 1
+
+def unzigzag(val: int) -> int:
+	return val//2 if val % 2 == 0 else -(val+1)//2
+
+def get_float_bits(val: float) -> int:
+	return BITS.unpack(DOUBLE.pack(val))[0]
+
+def get_bits_float(bits: int) -> float:
+	return DOUBLE.unpack(BITS.pack(bits))[0]
+
+def get_kind(val: Any) -> ColumnKind | None:
+	# bools are ints in python but stay in the skeleton
+	if isinstance(val, bool):
+		return None
+	if isinstance(val, int):
+		return "i"
+	if isinstance(val, float):
+		return "f"
+	return None
+
+class Column:
+	def __init__(self, kind: ColumnKind):
+		self.kind = kind
+		self.presence = bytearray()
+		self.data = bytearray()
+		self.prev = 0
+
+	def add(self, row: int, val: Any):
+		byte_index = row // 8
+		while len(self.presence) <= byte_index:
+			self.presence.append(0)
+		self.presence[byte_index] |= 1 << (row % 8)
+
+		if self.kind == "i":
+			encode_varint(zigzag(val - self.prev), self.data)
+			self.prev = val
+		else:
+			bits = get_float_bits(val)
+			encode_varint(bits ^ self.prev, self.data)
+			self.prev = bits
+
+	def decode(self, row_count: int) -> Iterator[tuple[int, Any]]:
+		prev = 0
+		offset = 0
+		for row in range(row_count):
+			byte_index = row // 8
+			if byte_index >= len(self.presence) or not self.presence[byte_index] & (1 << (row % 8)):
+				continue
+			encoded, offset = decode_varint(self.data, offset)
+			if self.kind == "i":
+				prev += unzigzag(encoded)
+				yield row, prev
+			else:
+				prev ^= encoded
+				yield row, get_bits_float(prev)
+
+def split_leaves(val: Any, path: tuple[str | int, ...], row: int, columns: dict[ColumnKey, Column]) -> Any:
+	if isinstance(val, dict):
+		return {key: split_leaves(child, path+(key,), row, columns) for key, child in val.items()}
+	elif isinstance(val, list):
+		return [
+			child if get_kind(child) else split_leaves(child, path+(i,), row, columns)
+			for i, child in enumerate(val)
+		]
+
+	kind = get_kind(val)
+	if kind is None:
+		return val
+
+	column_key = (path, kind)
+	if not column_key in columns:
+		columns[column_key] = Column(kind)
+	columns[column_key].add(row, val)
+	# the skeleton keeps a placeholder so key order survives the round trip
+	return None
+
+def set_leaf(data: Any, path: tuple[str | int, ...], val: Any):
+	for key in path[:-1]:
+		data = data[key]
+	data[path[-1]] = val
+
+def encode_block(records: list[tuple[float, dict]]) -> bytes:
+	columns: dict[ColumnKey, Column] = {}
+	skeleton_ids: dict[str, int] = {}
+	row_skeletons: list[int] = []
+
+	for row, (recorded_at, sections) in enumerate(records):
+		split_leaves(recorded_at, RECORDED_AT_PATH, row, columns)
+		skeleton = json.dumps(split_leaves(sections, (), row, columns))
+		if not skeleton in skeleton_ids:
+			skeleton_ids[skeleton] = len(skeleton_ids)
+		row_skeletons.append(skeleton_ids[skeleton])
+
+	meta = json.dumps({
+		"columns": [[list(path), kind] for path, kind in columns],
+		"skeletons": list(skeleton_ids),
+		"rows": row_skeletons,
+	}).encode("utf-8")
+
+	body = bytearray()
+	body += LENGTH.pack(len(meta)) + meta
+	for column in columns.values():
+		body += LENGTH.pack(len(column.presence)) + column.presence
+		body += LENGTH.pack(len(column.data)) + column.data
+
+	return BLOCK_HEADER.pack(BLOCK_MAGIC, BLOCK_VERSION, len(records)) + zlib.compress(bytes(body), 9)
+
+def decode_block(block_data: bytes) -> list[tuple[float, dict]]:
+	magic, version, row_count = BLOCK_HEADER.unpack_from(block_data, 0)
+	if magic != BLOCK_MAGIC or version != BLOCK_VERSION:
+		raise ValueError("not a midas block")
+
+	body = zlib.decompress(block_data[BLOCK_HEADER.size:])
+	meta_len = LENGTH.unpack_from(body, 0)[0]
+	offset = LENGTH.size
+	meta = json.loads(body[offset:offset+meta_len])
+	offset += meta_len
+
+	skeletons = meta["skeletons"]
+	rows: list[list] = [[0.0, json.loads(skeletons[skeleton_id])] for skeleton_id in meta["rows"]]
+
+	for path, kind in meta["columns"]:
+		column = Column(kind)
+		presence_len = LENGTH.unpack_from(body, offset)[0]
+		offset += LENGTH.size
+		column.presence = bytearray(body[offset:offset+presence_len])
+		offset += presence_len
+		data_len = LENGTH.unpack_from(body, offset)[0]
+		offset += LENGTH.size
+		column.data = bytearray(body[offset:offset+data_len])
+		offset += data_len
+
+		for row, val in column.decode(row_count):
+			if tuple(path) == RECORDED_AT_PATH:
+				rows[row][0] = val
+			else:
+				set_leaf(rows[row][1], tuple(path), val)
+
+	return [(recorded_at, sections) for recorded_at, sections in rows]
+
+def get_block_path(path: str, day: str) -> str:
+	return os.path.join(path, day+BLOCK_SUFFIX)
+
+def list_blocks(path: str) -> list[str]:
+	if not os.path.exists(path):
+		return []
+	return sorted(name for name in os.listdir(path) if name.endswith(BLOCK_SUFFIX))
+
+def read_block(block_path: str) -> list[tuple[float, dict]]:
+	with open(block_path, "rb") as block_file:
+		return decode_block(block_file.read())
+
+def write_block(block_path: str, block_data: bytes):
+	with open(block_path+".tmp", "wb") as block_file:
+		block_file.write(block_data)
+		block_file.flush()
+		os.fsync(block_file.fileno())
+	os.replace(block_path+".tmp", block_path)
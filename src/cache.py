@@ -0,0 +1,172 @@
+import os
+import re
+import json
+import time
+import base64
+from dataclasses import dataclass
+from collections import OrderedDict
+from threading import Lock
+from typing import TypedDict, Mapping, Literal
+
+CacheKey = tuple[str, str, str | None]
+CacheStat = Literal["hits", "misses", "revalidated"]
+
+DEFAULT_MAX_BYTES = 32*1024*1024
+RESPONSE_CACHE_FILE = "responses.json"
+
+# seconds a response stays fresh, first matching url pattern wins
+DEFAULT_TTLS: list[tuple[str, float]] = [
+	(r"/multiget-place-details", 60*60*24),
+	(r"/favorites/count", 60*5),
+	(r"/compatibilities", 60*60),
+	(r"/stats/\w+\?granularity=Monthly", 60*60*6),
+	(r"/stats/\w+\?granularity=Daily", 60*60),
+	(r"/stats/\w+\?granularity=Hourly", 60*5),
+	(r"Page=ads", 60*5),
+	(r"/sponsored-games", 60*5),
+]
+
+def get_endpoint_template(url: str) -> str:
+	path = url.split("?")[0]
+	return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+@dataclass
+class CachedResponse:
+	url: str
+	status: int
+	headers: dict[str, str]
+	content: bytes
+	encoding: str | None
+	expires_at: float
+	etag: str | None = None
+	last_modified: str | None = None
+
+	def get_size(self) -> int:
+		return len(self.content) + len(self.url)
+
+	def is_fresh(self) -> bool:
+		return time.time() < self.expires_at
+
+class EndpointStats(TypedDict):
+	hits: int
+	misses: int
+	revalidated: int
+
+class ResponseCache:
+	def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttls: list[tuple[str, float]] = DEFAULT_TTLS, disk_path: str | None = None):
+		self.max_bytes = max_bytes
+		self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+		self.disk_path = disk_path
+		self.entries: OrderedDict[CacheKey, CachedResponse] = OrderedDict()
+		self.size = 0
+		self.stats: dict[str, EndpointStats] = {}
+		self.lock = Lock()
+		if disk_path != None:
+			self.load()
+
+	def get_ttl(self, url: str) -> float | None:
+		for pattern, ttl in self.ttls:
+			if pattern.search(url):
+				return ttl
+		return None
+
+	def count(self, url: str, stat: CacheStat):
+		template = get_endpoint_template(url)
+		if not template in self.stats:
+			self.stats[template] = {"hits": 0, "misses": 0, "revalidated": 0}
+		self.stats[template][stat] += 1
+
+	def lookup(self, key: CacheKey) -> CachedResponse | None:
+		if self.get_ttl(key[1]) == None:
+			return None
+
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None:
+				return None
+			self.entries.move_to_end(key)
+			if entry.is_fresh():
+				self.count(key[1], "hits")
+			return entry
+
+	def get_validators(self, entry: CachedResponse | None) -> dict[str, str]:
+		headers: dict[str, str] = {}
+		if entry is not None:
+			if entry.etag is not None:
+				headers["If-None-Match"] = entry.etag
+			if entry.last_modified is not None:
+				headers["If-Modified-Since"] = entry.last_modified
+		return headers
+
+	def revalidated(self, key: CacheKey, entry: CachedResponse):
+		ttl = self.get_ttl(key[1]) or 0
+		with self.lock:
+			entry.expires_at = time.time() + ttl
+			self.count(key[1], "revalidated")
+
+	def store(self, key: CacheKey, status: int, headers: Mapping[str, str], content: bytes, encoding: str | None):
+		ttl = self.get_ttl(key[1])
+		if ttl is None:
+			return
+
+		with self.lock:
+			self.count(key[1], "misses")
+
+		if status != 200 or "no-store" in headers.get("Cache-Control", ""):
+			return
+
+		entry = CachedResponse(
+			url=key[1],
+			status=status,
+			headers={k: v for k, v in headers.items() if k.lower() in ["content-type", "etag", "last-modified"]},
+			content=content,
+			encoding=encoding,
+			expires_at=time.time() + ttl,
+			etag=headers.get("ETag"),
+			last_modified=headers.get("Last-Modified"),
+		)
+
+		with self.lock:
+			if key in self.entries:
+				self.size -= self.entries.pop(key).get_size()
+			if entry.get_size() > self.max_bytes:
+				return
+			self.entries[key] = entry
+			self.size += entry.get_size()
+			while self.size > self.max_bytes:
+				old_key, old_entry = self.entries.popitem(last=False)
+				self.size -= old_entry.get_size()
+
+	def load(self):
+		assert self.disk_path != None
+		if not os.path.exists(self.disk_path):
+			return
+		try:
+			with open(self.disk_path) as cache_file:
+				disk_data = json.load(cache_file)
+		except ValueError:
+			return
+
+		for method, url, body, entry_data in disk_data:
+			entry_data["content"] = base64.b64decode(entry_data["content"])
+			entry = CachedResponse(**entry_data)
+			self.entries[(method, url, body)] = entry
+			self.size += entry.get_size()
+
+	def save(self):
+		if self.disk_path == None:
+			return
+		with self.lock:
+			disk_data = [
+				[method, url, body, {**entry.__dict__, "content": base64.b64encode(entry.content).decode("ascii")}]
+				for (method, url, body), entry in self.entries.items()
+			]
+		with open(self.disk_path+".tmp", "w") as cache_file:
+			json.dump(disk_data, cache_file)
+		os.replace(self.disk_path+".tmp", self.disk_path)
+
+	def get_report(self) -> str:
+		lines = [f"{'endpoint':<80} {'hits':>6} {'misses':>6} {'revalidated':>11}"]
+		for template, stats in sorted(self.stats.items()):
+			lines.append(f"{template:<80} {stats['hits']:>6} {stats['misses']:>6} {stats['revalidated']:>11}")
+		return "\n".join(lines)
@@ -0,0 +1,93 @@
+import time
+import importlib
+from requests import Session
+from typing import TypedDict, Callable, Any
+import src.util as util
+import src.metrics as metrics
+from src.planner import Planner, run_plan
+
+class CollectorContext(TypedDict):
+	place_id: int
+	universe_id: int
+	# every universe recorded alongside this one, for batched endpoints
+	universe_ids: list[int]
+	interval: int
+	group_id: int
+
+CollectorPlan = Callable[[Planner, CollectorContext], Callable[[], Any]]
+
+def get_module(name: str) -> Any:
+	# collector modules load on their first plan, so naming a collector imports nothing
+	return importlib.import_module(f"src.{name}")
+
+COLLECTORS: dict[str, CollectorPlan] = {
+	"dashboard": lambda planner, ctx: get_module("dashboard").plan_record_data(planner, ctx["universe_id"], ctx["interval"]),
+	"dev_stat": lambda planner, ctx: get_module("devstat").plan_data(planner, ctx["place_id"]),
+	"info": lambda planner, ctx: get_module("info").plan_game_stats(planner, ctx["universe_id"], ctx["place_id"], ctx["universe_ids"]),
+	"ads": lambda planner, ctx: get_module("ads").plan_ads(planner, ctx["place_id"], ctx["group_id"]).result,
+	"sponsors": lambda planner, ctx: get_module("sponsorships").plan_sponsors(planner, ctx["universe_id"]),
+	"live": lambda planner, ctx: get_module("devstat").plan_live_stat_data(planner, ctx["universe_id"]).result,
+}
+
+# sections written by a one-shot run
+RUN_COLLECTORS = ["dashboard", "dev_stat", "info", "ads", "sponsors"]
+
+# seconds between daemon collections
+DEFAULT_CADENCES: dict[str, int] = {
+	"live": 60,
+	"info": 60*5,
+	"ads": 60*15,
+	"sponsors": 60*15,
+	"dev_stat": 60*60,
+	"dashboard": 60*60,
+}
+
+def get_contexts(session: Session, place_ids: list[int], interval: int, group_id: int) -> list[CollectorContext]:
+	resolved = util.get_universe_ids(session, place_ids)
+	return [
+		{
+			"place_id": place_id,
+			"universe_id": resolved[place_id],
+			"universe_ids": sorted(set(resolved.values())),
+			"interval": interval,
+			"group_id": group_id,
+		} for place_id in place_ids
+	]
+
+def get_context(session: Session, place_id: int, interval: int, group_id: int) -> CollectorContext:
+	return get_contexts(session, [place_id], interval, group_id)[0]
+
+def plan_collector(planner: Planner, ctx: CollectorContext, name: str) -> Callable[[], Any]:
+	owner = (name, ctx["place_id"])
+	token = metrics.owner_var.set(owner)
+	try:
+		finish = COLLECTORS[name](planner, ctx)
+	finally:
+		metrics.owner_var.reset(token)
+
+	def timed_finish() -> Any:
+		finish_start = time.monotonic()
+		# collectors share one execution, so wall time runs from its start to this collector's last response
+		last_response = planner.finished_at.get(owner, planner.started_at or finish_start)
+		fetch_time = last_response - (planner.started_at or last_response)
+		ok = False
+		try:
+			out = finish()
+			ok = True
+			return out
+		finally:
+			metrics.observe_collector(name, ctx["place_id"], fetch_time + time.monotonic() - finish_start, ok)
+
+	return timed_finish
+
+def plan_sections(planner: Planner, ctx: CollectorContext, names: list[str]) -> dict[str, Callable[[], Any]]:
+	return {name: plan_collector(planner, ctx, name) for name in names}
+
+def collect(session: Session, name: str, ctx: CollectorContext, workers: int = 1) -> Any:
+	return run_plan(session, lambda planner: plan_collector(planner, ctx, name), workers)
+
+def collect_places(session: Session, name: str, contexts: list[CollectorContext], workers: int = 1) -> dict[int, Any]:
+	planner = Planner()
+	finishers = {ctx["place_id"]: plan_collector(planner, ctx, name) for ctx in contexts}
+	planner.execute(session, workers)
+	return {place_id: finish() for place_id, finish in finishers.items()}
@@ -0,0 +1,67 @@
+import os
+import json
+import time
+from datetime import datetime, timedelta, timezone
+import src.store as store
+import src.reader as reader
+import src.block as block
+from src.store import Store
+
+DEFAULT_GRACE = timedelta(hours=1)
+
+def is_sealed(day: str, now: float, grace: timedelta) -> bool:
+	day_end = datetime.strptime(day, store.DAY_FORMAT).replace(tzinfo=timezone.utc) + timedelta(days=1)
+	return (day_end + grace).timestamp() <= now
+
+def is_lossless(records: list[tuple[float, dict]], block_data: bytes) -> bool:
+	# compared serialized, NaN leaves never equal themselves but serialize the same
+	return json.dumps(block.decode_block(block_data)) == json.dumps(records)
+
+def get_file_state(file_path: str) -> tuple[int, int]:
+	stat = os.stat(file_path)
+	return stat.st_size, stat.st_mtime_ns
+
+def compact_segment(data_store: Store, day: str) -> str:
+	segment_path = data_store.get_segment_path(day)
+	index_path = store.get_index_path(segment_path)
+	block_path = block.get_block_path(data_store.path, day)
+
+	segment_state = get_file_state(segment_path)
+	records = sorted(reader.iter_segment(segment_path, 0, float("inf"), None), key=reader.get_recorded_at)
+	if os.path.exists(block_path):
+		# records appended after the day was compacted are merged into its block, never dropped
+		held = sorted(block.read_block(block_path), key=reader.get_recorded_at)
+		records = list(reader.merge_records([held, records]))
+
+	block_data = block.encode_block(records)
+	if not is_lossless(records, block_data):
+		raise ValueError(f"compacted block for {day} does not round trip")
+	block.write_block(block_path, block_data)
+
+	with data_store.lock:
+		if get_file_state(segment_path) != segment_state:
+			# appended to while compacting, the next compaction merges what the block is missing
+			print(f"kept segment for {day}, it changed while compacting")
+			return block_path
+		os.remove(segment_path)
+		if os.path.exists(index_path):
+			os.remove(index_path)
+		data_store.last_indexed.pop(index_path, None)
+	return block_path
+
+def compact_store(data_store: Store, grace: timedelta = DEFAULT_GRACE, now: float | None = None) -> list[str]:
+	if now is None:
+		now = time.time()
+
+	# only days the recorder can no longer append to are compacted
+	compacted = []
+	for segment_name in store.list_segments(data_store.path):
+		day = segment_name[:-len(store.SEGMENT_SUFFIX)]
+		if not is_sealed(day, now, grace):
+			continue
+		try:
+			compacted.append(compact_segment(data_store, day))
+		except Exception as e:
+			# the segment is left in place, so the next compaction tries the day again
+			print(f"compacting {day} failed: {e}")
+	return compacted
@@ -0,0 +1,104 @@
+import time
+import random
+from threading import Thread, Event
+from requests import Session
+from typing import Callable, Any
+import src.util as util
+import src.collectors as collectors
+import src.retry as retry
+from src.collectors import CollectorContext
+from src.planner import Planner
+
+DEFAULT_JITTER = 0.1
+CSRF_REFRESH_INTERVAL = 60*30
+RETRY_CHECK_INTERVAL = 30
+
+def get_next_time(prev_time: float, cadence: float, jitter: float) -> float:
+	next_time = prev_time + cadence + random.uniform(-jitter, jitter)*cadence
+	# skip missed ticks rather than bursting to catch up
+	return max(next_time, time.monotonic())
+
+def run_schedule(
+	stop: Event,
+	name: str,
+	cadence: float,
+	jitter: float,
+	job: Callable[[], Any],
+	delay: float = 0
+):
+	next_time = time.monotonic() + delay + random.uniform(0, jitter)*cadence
+	while not stop.wait(max(next_time - time.monotonic(), 0)):
+		try:
+			job()
+		except Exception as e:
+			print(f"{name} data failed: {e}")
+		next_time = get_next_time(next_time, cadence, jitter)
+
+def run_daemon(
+	session: Session,
+	contexts: list[CollectorContext],
+	cadences: dict[str, int],
+	write: Callable[[int, dict[str, Callable[[], Any]]], None],
+	workers: int = 1,
+	jitter: float = DEFAULT_JITTER,
+	stop: Event | None = None,
+):
+	if stop is None:
+		stop = Event()
+
+	def collect(name: str, job_contexts: list[CollectorContext]):
+		planner = Planner()
+		finishers = {ctx["place_id"]: collectors.plan_collector(planner, ctx, name) for ctx in job_contexts}
+		planner.execute(session, workers)
+		# finishing happens in write, so one place failing does not drop the others
+		for place_id, finish in finishers.items():
+			write(place_id, {name: finish})
+
+	def get_job(name: str) -> Callable[[], None]:
+		return lambda: collect(name, contexts)
+
+	def retry_failed():
+		# failed collectors come back after a backoff, not at their next full cadence
+		queued = retry.get_queued([ctx["place_id"] for ctx in contexts])
+		for name in sorted({entry["collector"] for entry in queued}):
+			if not name in collectors.COLLECTORS:
+				continue
+			place_ids = {entry["place_id"] for entry in queued if entry["collector"] == name}
+			collect(name, [ctx for ctx in contexts if ctx["place_id"] in place_ids])
+
+	def refresh_token():
+		# the probe must not carry the token in use, posting a valid one to /v2/logout signs the session out
+		session.headers["X-Csrf-Token"] = util.get_xcrf_token(session)
+
+	threads = [
+		Thread(
+			target=run_schedule,
+			args=(stop, name, cadence, jitter, get_job(name)),
+			name=name,
+			daemon=True
+		) for name, cadence in cadences.items()
+	]
+	threads.append(Thread(
+		target=run_schedule,
+		args=(stop, "csrf", CSRF_REFRESH_INTERVAL, 0, refresh_token, CSRF_REFRESH_INTERVAL),
+		name="csrf",
+		daemon=True
+	))
+	threads.append(Thread(
+		target=run_schedule,
+		args=(stop, "retry", RETRY_CHECK_INTERVAL, 0, retry_failed, RETRY_CHECK_INTERVAL),
+		name="retry",
+		daemon=True
+	))
+
+	for thread in threads:
+		thread.start()
+
+	try:
+		while not stop.wait(1):
+			pass
+	except KeyboardInterrupt:
+		stop.set()
+
+	for thread in threads:
+		thread.join(timeout=5)
@@ -1,11 +1,19 @@
+import os
 import sys
 import json
 from requests import Session
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from threading import Lock
 import src.util as util
+import src.engine as engine
+import src.series as series
+import src.history as history
+import src.aio as aio
+from src.planner import Planner, Handle, run_plan
 from src.devstat import GranularityType
-from typing import TypedDict, Literal, Any
+from typing import TypedDict, Literal, Any, Callable
 
 
 # 2023-06-24T12%3A53%3A48.000Z
@@ -75,18 +83,85 @@ class DashboardData(TypedDict):
 	values: list[DashboardValueSet]
 	topLevelMetrics: DashboardTopLevelMetricData
 
-def get_data(
-	session: Session, 
-	place_id: int, 
+def reduce_data(dashboard_data: DashboardData) -> dict:
+	return series.reduce_latest_iso(
+		(value_data["dataDivisionTargetValue"].lower(), value_data["data"])
+		for value_data in dashboard_data["values"]
+	)
+
+def parse_data(text: str) -> dict:
+	return reduce_data(json.loads(text))
+
+def get_last_timestamp(dashboard_data: DashboardData) -> str | None:
+	last_ts: str | None = None
+	for value_data in dashboard_data["values"]:
+		for ts, val in value_data["data"].items():
+			# trailing hours roblox has not filled yet come back null, the mark stays before them
+			# so they are fetched again. iso timestamps sort lexicographically
+			if val is not None and (last_ts is None or ts > last_ts):
+				last_ts = ts
+	return last_ts
+
+MARK_FILE = "dashboard-marks.json"
+MARK_OVERLAP = timedelta(hours=2)
+MAX_WINDOW = timedelta(hours=24)
+mark_lock = Lock()
+
+class DashboardMark(TypedDict):
+	timestamp: str
+	values: dict
+
+def get_mark_key(universe_id: int, kpi_type: KPIType, break_down_type: BreakdownType) -> str:
+	return f"{universe_id}/{kpi_type}/{break_down_type}"
+
+def read_marks() -> dict[str, DashboardMark]:
+	path = util.get_cache_path(MARK_FILE)
+	if not os.path.exists(path):
+		return {}
+	try:
+		with open(path) as mark_file:
+			return json.load(mark_file)
+	except ValueError:
+		return {}
+
+def write_marks(updated: dict[str, DashboardMark]):
+	# merge so universes recorded in the same process keep each other's marks
+	with mark_lock:
+		marks = read_marks()
+		marks.update(updated)
+		path = util.get_cache_path(MARK_FILE)
+		with open(path+".tmp", "w") as mark_file:
+			json.dump(marks, mark_file)
+		os.replace(path+".tmp", path)
+
+def get_window_start(held_ts: str | None, end_time: datetime) -> datetime:
+	start_time = end_time - MAX_WINDOW
+	if held_ts is not None:
+		held_time = datetime.strptime(held_ts, "%Y-%m-%dT%H:%M:%SZ") - MARK_OVERLAP
+		start_time = max(start_time, held_time)
+	return start_time
+
+def get_held_ts(mark: DashboardMark | None, universe_id: int, kpi_type: KPIType, break_down_type: BreakdownType) -> str | None:
+	# the newest point already recorded, from the marks or the history store
+	held = [] if mark is None else [mark["timestamp"]]
+	history_store = history.get_history()
+	if history_store is not None:
+		history_ts = history_store.get_latest_ts("dashboard", universe_id, kpi_type, break_down_type)
+		if history_ts is not None:
+			held.append(history_ts)
+	return max(held) if len(held) > 0 else None
+
+def get_breakdown_url(universe_id: int) -> str:
+	return f"https://apis.roblox.com/developer-analytics-aggregations/v1/universes/{universe_id}/breakdown"
+
+def get_data_payload(
+	universe_id: int, 
 	break_down_type: BreakdownType, 
 	kpi_type: KPIType, 
 	start_time: datetime, 
 	end_time: datetime
 ) -> dict:
-	universe_id = util.get_universe_id(session, place_id)
-	session.headers["Content-Type"] = "application/json-patch+json"
-
-	payload = {
+	return {
 		"universeId": universe_id,
 		"kpiType": kpi_type,
 		"queryFilter": {
@@ -96,56 +171,60 @@ def get_data(
 		"aggregationEndDateTime": end_time.strftime(TIME_FORMAT),
 	}
 
-	path_url = f"https://apis.roblox.com/developer-analytics-aggregations/v1/universes/{universe_id}/breakdown"
-	# print("\n", path_url)
-	# print(payload)
+def plan_data(
+	planner: Planner, 
+	universe_id: int, 
+	break_down_type: BreakdownType, 
+	kpi_type: KPIType, 
+	start_time: datetime, 
+	end_time: datetime
+) -> Handle[dict]:
+	payload = get_data_payload(universe_id, break_down_type, kpi_type, start_time, end_time)
+	return planner.post_json(get_breakdown_url(universe_id), payload, parse_data)
 
-	response = session.post(
-		url = path_url,
-		data=json.dumps(payload),
+def get_data(
+	session: Session, 
+	place_id: int, 
+	break_down_type: BreakdownType, 
+	kpi_type: KPIType, 
+	start_time: datetime, 
+	end_time: datetime
+) -> dict:
+	universe_id = util.get_universe_id(session, place_id)
+	return run_plan(
+		session, 
+		lambda planner: plan_data(planner, universe_id, break_down_type, kpi_type, start_time, end_time).result
 	)
-	session.headers.pop("Content-Type")
-
-	dashboard_data: DashboardData = json.loads(response.text)
 
-	out = {}
-
-	for value_data in dashboard_data["values"]:
-		key = value_data["dataDivisionTargetValue"]
-		max_datetime: datetime | None = None
-		max_val: float | None = None
-		for ts, val in value_data["data"].items():
-			ts_datetime = datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ")
-			if max_datetime == None:
-				max_datetime = ts_datetime
-				max_val = val
-			else:
-				assert max_datetime != None
-				certified_datetime: Any = max_datetime
-				if certified_datetime > ts_datetime:
-					max_datetime = ts_datetime
-					max_val = val
-
-		out[key.lower()] = max_val
-	
-	return out
+async def get_data_async(
+	client: aio.AsyncTransport, 
+	place_id: int, 
+	break_down_type: BreakdownType, 
+	kpi_type: KPIType, 
+	start_time: datetime, 
+	end_time: datetime
+) -> dict:
+	universe_id = await aio.get_universe_id(client, place_id)
+	return await aio.run_plan(
+		client, 
+		lambda planner: plan_data(planner, universe_id, break_down_type, kpi_type, start_time, end_time).result
+	)
 
 PlatformFilter = Literal["Computer", "Phone", "Tablet"]
 AcquisitionMetric = Literal["GameDetails", "Impressions", "DirectJoins", "GameDetailsJoins", "PlaySessions", "NewUsers", "ImpressionUniqueSessions", "GameDetailsUniqueSessions", "UniqueSessions"]
 AcquisitionFilterValue = Literal["Organic", "Home"]
 AcquisitionGranularity = Literal["OneDay"]
 
-def get_aquisition_data(
-	session: Session, 
-	place_id: int,
+def plan_aquisition_data(
+	planner: Planner, 
+	universe_id: int,
 	metric: AcquisitionMetric,
 	start_time: datetime, 
 	end_time: datetime,
 	filters: list[AcquisitionFilterValue] = [],
 	platform: PlatformFilter | None = None,
 	granularity: AcquisitionGranularity = "OneDay"
-) -> QueryResponseData:
-
+) -> Handle[QueryResponseData]:
 
 	filter_data: list[dict] = []
 
@@ -174,169 +253,173 @@ def get_aquisition_data(
 		"filters": filter_data
 	}
 
-	# print(json.dumps(body_data, indent=5))
+	return planner.post_json(
+		f"https://apis.roblox.com/developer-analytics-aggregations/v1/metrics/user-acquisition/universes/{universe_id}",
+		body_data,
+	)
 
+def get_aquisition_data(
+	session: Session, 
+	place_id: int,
+	metric: AcquisitionMetric,
+	start_time: datetime, 
+	end_time: datetime,
+	filters: list[AcquisitionFilterValue] = [],
+	platform: PlatformFilter | None = None,
+	granularity: AcquisitionGranularity = "OneDay"
+) -> QueryResponseData:
 	universe_id = util.get_universe_id(session, place_id)
-	session.headers["Content-Type"] = "application/json-patch+json"
-	response = session.post(
-		url = f"https://apis.roblox.com/developer-analytics-aggregations/v1/metrics/user-acquisition/universes/{universe_id}",
-		data=json.dumps(body_data),
+	return run_plan(
+		session,
+		lambda planner: plan_aquisition_data(planner, universe_id, metric, start_time, end_time, filters, platform, granularity).result
 	)
-	session.headers.pop("Content-Type")
-	return json.loads(response.text)
-
-def record_data(session: Session, place_id: int, interval: int) -> dict:
-	end_time: datetime = datetime.now()
-	start_time: datetime = end_time - timedelta(minutes=60*24) #interval)
-
-	def dump_kpi_data(kpi_type: KPIType) -> dict:
-		out = {
-			"device_type": get_data(
-				session=session,
-				place_id=place_id,
-				break_down_type="DeviceType",
-				kpi_type=kpi_type,
-				start_time=start_time,
-				end_time=end_time,
-			),
-			"os": get_data(
-				session=session,
-				place_id=place_id,
-				break_down_type="OperatingSystem",
-				kpi_type=kpi_type,
-				start_time=start_time,
-				end_time=end_time,
-			),
-			"age_group": get_data(
-				session=session,
-				place_id=place_id,
-				break_down_type="AgeGroup",
+
+async def get_aquisition_data_async(
+	client: aio.AsyncTransport, 
+	place_id: int,
+	metric: AcquisitionMetric,
+	start_time: datetime, 
+	end_time: datetime,
+	filters: list[AcquisitionFilterValue] = [],
+	platform: PlatformFilter | None = None,
+	granularity: AcquisitionGranularity = "OneDay"
+) -> QueryResponseData:
+	universe_id = await aio.get_universe_id(client, place_id)
+	return await aio.run_plan(
+		client,
+		lambda planner: plan_aquisition_data(planner, universe_id, metric, start_time, end_time, filters, platform, granularity).result
+	)
+
+KPI_KEYS: dict[str, KPIType] = {
+	"w1_rr": "W1Retention",
+	"d1_rr": "D1Retention",
+	"d7_rr": "D7Retention",
+	"d30_rr": "D30Retention",
+	"d1_stick": "D1Stickyness",
+	"d7_stick": "D7Stickyness",
+	"d30_stick": "D30Stickyness",
+	"visits": "Visits",
+	"mau": "MonthlyActiveUsers",
+	"total_hours": "TotalHours",
+	"avg_play_time": "AveragePlayTime",
+	"new_users": "NewUsers",
+	"dau": "DailyActiveUsers",
+	"robux": "Robux",
+	"conversion_rate": "ConversionRate",
+	"paying_users": "PayingUsers",
+	"arppu": "ARPPU",
+	"arpu": "ARPU",
+}
+
+BREAKDOWN_KEYS: dict[str, BreakdownType] = {
+	"device_type": "DeviceType",
+	"os": "OperatingSystem",
+	"age_group": "AgeGroup",
+	"country": "Country",
+	"locale": "Locale",
+	"total": "Total",
+}
+
+AQUISITION_KEYS: dict[tuple[str, ...], AcquisitionMetric] = {
+	("game_details",): "GameDetails",
+	("impressions",): "Impressions",
+	("play_sessions",): "PlaySessions",
+	("new_users",): "NewUsers",
+	("joins", "direct"): "DirectJoins",
+	("joins", "game_detail"): "GameDetailsJoins",
+	("unique_sessions", "impression"): "ImpressionUniqueSessions",
+	("unique_sessions", "game_details"): "GameDetailsUniqueSessions",
+	("unique_sessions", "total"): "UniqueSessions",
+}
+
+PLATFORM_FILTERS: list[PlatformFilter] = ["Computer", "Phone", "Tablet"]
+
+def get_source_values(aquisition_data: QueryResponseData) -> dict:
+	src_data = {}
+	for value_data in aquisition_data["values"]:
+		breakdown_value = value_data["breakdowns"][0]["value"]
+		src_data[breakdown_value.lower()] = value_data["datapoints"][0]["value"]
+	return src_data
+
+def get_handle_source_values(handle: Handle[QueryResponseData]) -> dict:
+	return get_source_values(handle.result())
+
+def plan_record_data(planner: Planner, universe_id: int, interval: int, incremental: bool = True) -> Callable[[], dict]:
+	end_time: datetime = datetime.now(timezone.utc).replace(tzinfo=None)
+	start_time: datetime = end_time - MAX_WINDOW #interval)
+
+	marks = read_marks() if incremental else {}
+	updated: dict[str, DashboardMark] = {}
+
+	def dump_kpi_data(kpi_type: KPIType, break_down_type: BreakdownType) -> engine.Task:
+		mark_key = get_mark_key(universe_id, kpi_type, break_down_type)
+		handle = planner.post_json(
+			get_breakdown_url(universe_id),
+			get_data_payload(
+				universe_id=universe_id,
+				break_down_type=break_down_type,
 				kpi_type=kpi_type,
-				start_time=start_time,
+				start_time=get_window_start(get_held_ts(marks.get(mark_key), universe_id, kpi_type, break_down_type), end_time),
 				end_time=end_time,
 			),
-			"country": get_data(
-				session=session,
-				place_id=place_id,
-				break_down_type="Country",
-				kpi_type=kpi_type,
-				start_time=start_time,
-				end_time=end_time,
-			),		
-			"locale": get_data(
-				session=session,
-				place_id=place_id,
-				break_down_type="Locale",
-				kpi_type=kpi_type,
-				start_time=start_time,
-				end_time=end_time,
-			),	
-			"total": get_data(
-				session=session,
-				place_id=place_id,
-				break_down_type="Total",
-				kpi_type=kpi_type,
-				start_time=start_time,
-				end_time=end_time,
-			),	
-		}
-		return out
-
-	# def dump_benchmark_data(kpi_type: KPIType) -> Any:
-	# 	# out = {}
-	# 	# for granularity_type in ["OneDay"]:
-	# 	# 	out[granularity_type] = 
-	# 	return get_benchmark_data(
-	# 		session=session,
-	# 		place_id=place_id, 
-	# 		granularity_type="Daily", 
-	# 		kpi_type=kpi_type,
-	# 		start_time=end_time - timedelta(minutes=60*24),
-	# 		end_time=end_time,
-	# 	)
-
-	def dump_aquisition_data(metric_type: AcquisitionMetric) -> dict:
-		out = {}
-
-		for platform_filter in ["Computer", "Phone", "Tablet"]:
-			p_filter: Any = platform_filter
-			aquisition_data = get_aquisition_data(
-				session=session,
-				place_id=place_id, 
+		)
+
+		def finish() -> dict:
+			dashboard_data: DashboardData = handle.result()
+			history_store = history.get_history()
+			if history_store is not None:
+				history_store.upsert_series(
+					"dashboard", universe_id, kpi_type, break_down_type,
+					((value_data["dataDivisionTargetValue"].lower(), value_data["data"]) for value_data in dashboard_data["values"])
+				)
+			out = reduce_data(dashboard_data)
+			last_ts = get_last_timestamp(dashboard_data)
+			held_values: dict | None = None
+			if mark_key in marks:
+				held_values = marks[mark_key]["values"]
+				if last_ts is None or last_ts < marks[mark_key]["timestamp"]:
+					last_ts = marks[mark_key]["timestamp"]
+			elif history_store is not None:
+				held_values = history_store.get_latest_values("dashboard", universe_id, kpi_type, break_down_type)
+			if held_values is not None:
+				# series with no points in the window keep the value seen last time
+				out = {**held_values, **{key: val for key, val in out.items() if val != None}}
+			if last_ts is not None:
+				updated[mark_key] = {
+					"timestamp": last_ts,
+					"values": out,
+				}
+			return out
+
+		return finish
+
+	results: dict[engine.TaskPath, engine.Task] = {}
+	for kpi_key, kpi_type in KPI_KEYS.items():
+		for break_down_key, break_down_type in BREAKDOWN_KEYS.items():
+			results[("kpi", kpi_key, break_down_key)] = dump_kpi_data(kpi_type, break_down_type)
+
+	for aquisition_path, metric_type in AQUISITION_KEYS.items():
+		for platform_filter in PLATFORM_FILTERS:
+			handle = plan_aquisition_data(
+				planner=planner,
+				universe_id=universe_id, 
 				start_time=start_time,
 				end_time=end_time,
 				metric=metric_type,
 				granularity = "OneDay",
 				filters=["Organic", "Home"],
-				platform=p_filter,
-
+				platform=platform_filter,
 			)
-			src_data = {}
-			for value_data in aquisition_data["values"]:
-				breakdown_value = value_data["breakdowns"][0]["value"]
-				src_data[breakdown_value.lower()] = value_data["datapoints"][0]["value"]
+			results[("aquisition",) + aquisition_path + (platform_filter.lower(),)] = partial(get_handle_source_values, handle)
 
-			out[platform_filter.lower()] = src_data
+	def finish() -> dict:
+		out = engine.nest({path: result() for path, result in results.items()})
+		if incremental:
+			write_marks(updated)
 		return out
 
-	return {
-		"kpi": {
-			"w1_rr": dump_kpi_data("W1Retention"),
-			"d1_rr": dump_kpi_data("D1Retention"),
-			"d7_rr": dump_kpi_data("D7Retention"),
-			"d30_rr": dump_kpi_data("D30Retention"),
-			"d1_stick": dump_kpi_data("D1Stickyness"),
-			"d7_stick": dump_kpi_data("D7Stickyness"),
-			"d30_stick": dump_kpi_data("D30Stickyness"),
-			"visits": dump_kpi_data("Visits"),
-			"mau": dump_kpi_data("MonthlyActiveUsers"),
-			"total_hours": dump_kpi_data("TotalHours"),
-			"avg_play_time": dump_kpi_data("AveragePlayTime"),
-			"new_users": dump_kpi_data("NewUsers"),
-			"avg_play_time": dump_kpi_data("AveragePlayTime"),
-			"dau": dump_kpi_data("DailyActiveUsers"),
-			"robux": dump_kpi_data("Robux"),
-			"conversion_rate": dump_kpi_data("ConversionRate"),
-			"paying_users": dump_kpi_data("PayingUsers"),
-			"arppu": dump_kpi_data("ARPPU"),
-			"paying_users": dump_kpi_data("PayingUsers"),
-			"arpu": dump_kpi_data("ARPU"),
-		},
-		# "benchmarks": {
-		# 	"w1_rr": dump_benchmark_data("W1Retention"),
-		# 	"d1_rr": dump_benchmark_data("D1Retention"),
-		# 	"d7_rr": dump_benchmark_data("D7Retention"),
-		# 	"d30_rr": dump_benchmark_data("D30Retention"),
-		# 	"d1_stick": dump_benchmark_data("D1Stickyness"),
-		# 	"d7_stick": dump_benchmark_data("D7Stickyness"),
-		# 	"d30_stick": dump_benchmark_data("D30Stickyness"),
-		# 	"visits": dump_benchmark_data("Visits"),
-		# 	"mau": dump_benchmark_data("MonthlyActiveUsers"),
-		# 	"total_hours": dump_benchmark_data("TotalHours"),
-		# 	"avg_play_time": dump_benchmark_data("AveragePlayTime"),
-		# 	"new_users": dump_benchmark_data("NewUsers"),
-		# 	"avg_play_time": dump_benchmark_data("AveragePlayTime"),
-		# 	"dau": dump_benchmark_data("DailyActiveUsers"),
-		# 	"robux": dump_benchmark_data("Robux"),
-		# 	"conversion_rate": dump_benchmark_data("ConversionRate"),
-		# 	"paying_users": dump_benchmark_data("PayingUsers"),
-		# 	"arppu": dump_benchmark_data("ARPPU"),
-		# 	"paying_users": dump_benchmark_data("PayingUsers"),
-		# 	"arpu": dump_benchmark_data("ARPU"),
-		# },
-		"aquisition": {
-			"game_details": dump_aquisition_data("GameDetails"), 
-			"impressions": dump_aquisition_data("Impressions"), 
-			"play_sessions": dump_aquisition_data("PlaySessions"), 
-			"new_users": dump_aquisition_data("NewUsers"), 
-			"joins": {
-				"direct": dump_aquisition_data("DirectJoins"),  
-				"game_detail": dump_aquisition_data("GameDetailsJoins"), 
-			},
-			"unique_sessions": {
-				"impression": dump_aquisition_data("ImpressionUniqueSessions"), 
-				"game_details": dump_aquisition_data("GameDetailsUniqueSessions"), 
-				"total": dump_aquisition_data("UniqueSessions"), 
-			},
-		},
-	}
\ No newline at end of file
+	return finish
+
+def record_data(session: Session, place_id: int, interval: int, workers: int = 1) -> dict:
+	universe_id = util.get_universe_id(session, place_id)
+	return run_plan(session, lambda planner: plan_record_data(planner, universe_id, interval), workers)
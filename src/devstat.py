@@ -1,8 +1,13 @@
 import json
 from datetime import datetime, timedelta
 from requests import Session
-from typing import TypedDict, Literal, Any
+from typing import TypedDict, Literal, Any, Callable
 import src.util as util
+import src.engine as engine
+import src.series as series
+import src.history as history
+import src.aio as aio
+from src.planner import Planner, Handle, run_plan
 
 StatType = Literal["Visits", "PremiumVisits", "PremiumPayout"]
 GranularityType = Literal["Hourly", "Daily","Monthly"]
@@ -19,10 +24,12 @@ class LiveStatData(TypedDict):
 	playerCountsByDeviceType:LivePlayerDeviceData
 	gameCount:int
 
+def plan_live_stat_data(planner: Planner, universe_id: int) -> Handle[LiveStatData]:
+	return planner.get(f"https://develop.roblox.com/v1/universes/{universe_id}/live-stats")
+
 def get_live_stat_data(session: Session, place_id: int) -> LiveStatData:
 	universe_id = util.get_universe_id(session, place_id)
-	response = session.get(f"https://develop.roblox.com/v1/universes/{universe_id}/live-stats")
-	return json.loads(response.text)
+	return run_plan(session, lambda planner: plan_live_stat_data(planner, universe_id).result)
 
 DeviceStatusType = Literal["Unknown", "Good", "Bad"]
 
@@ -34,10 +41,12 @@ class DeviceCompatData(TypedDict):
 class CompatibilityData(TypedDict):
 	Compatibilities: list[DeviceCompatData]
 
+def plan_compatibility_data(planner: Planner, universe_id: int) -> Handle[CompatibilityData]:
+	return planner.get(f"https://develop.roblox.com/v1/universes/{universe_id}/compatibilities")
+
 def get_compatibility_data(session: Session, place_id: int) -> CompatibilityData:
 	universe_id = util.get_universe_id(session, place_id)
-	response = session.get(f"https://develop.roblox.com/v1/universes/{universe_id}/compatibilities")
-	return json.loads(response.text)
+	return run_plan(session, lambda planner: plan_compatibility_data(planner, universe_id).result)
 
 class DevStatDataSection(TypedDict):
 	type: str
@@ -51,6 +60,15 @@ class DevStatData(TypedDict):
 	endTime: str
 	data: dict[str, DevStatDataSection]
 
+def plan_dev_stat_data(
+	planner: Planner, 
+	place_id: int, 
+	stat_type: StatType, 
+	granularity_type: GranularityType, 
+	division_type: DivisionType
+) -> Handle[DevStatData]:
+	return planner.get(f"https://develop.roblox.com/v1/places/{place_id}/stats/{stat_type}?granularity={granularity_type}&divisionType={division_type}")
+
 def get_dev_stat_data(
 	session: Session, 
 	place_id: int, 
@@ -58,71 +76,69 @@ def get_dev_stat_data(
 	granularity_type: GranularityType, 
 	division_type: DivisionType
 ) -> DevStatData:
-	response = session.get(f"https://develop.roblox.com/v1/places/{place_id}/stats/{stat_type}?granularity={granularity_type}&divisionType={division_type}")
-	return json.loads(response.text)
-
+	return run_plan(
+		session, 
+		lambda planner: plan_dev_stat_data(planner, place_id, stat_type, granularity_type, division_type).result
+	)
 
-def get_data(session: Session, place_id: int) -> dict:
+async def get_dev_stat_data_async(
+	client: aio.AsyncTransport, 
+	place_id: int, 
+	stat_type: StatType, 
+	granularity_type: GranularityType, 
+	division_type: DivisionType
+) -> DevStatData:
+	return await aio.run_plan(
+		client, 
+		lambda planner: plan_dev_stat_data(planner, place_id, stat_type, granularity_type, division_type).result
+	)
+
+STAT_KEYS: dict[tuple[str, ...], StatType] = {
+	("visits",): "Visits",
+	("premium", "visits"): "PremiumVisits",
+	("premium", "payout"): "PremiumPayout",
+}
+
+DIVISION_KEYS: dict[str, DivisionType] = {
+	"age": "Age",
+	"platform": "Platform",
+}
+
+def plan_data(planner: Planner, place_id: int) -> Callable[[], dict]:
 	end_time: datetime = datetime.now()
 	start_time: datetime = end_time - timedelta(minutes=60) #interval)
 
-	def get_final_data_point(stat_type: StatType, division_type: DivisionType) -> Any:
-		data = get_dev_stat_data(
-			session=session,
+	def get_final_data_point(stat_type: StatType, division_type: DivisionType) -> Callable[[], Any]:
+		handle = plan_dev_stat_data(
+			planner=planner,
 			place_id=place_id,
 			stat_type=stat_type,
 			granularity_type="Hourly",
 			division_type=division_type
 		)
+		return lambda: get_final_values(handle.result(), stat_type, division_type)
+
+	def get_final_values(data: DevStatData, stat_type: StatType, division_type: DivisionType) -> dict:
+		history_store = history.get_history()
+		if history_store is not None:
+			history_store.upsert_series(
+				"dev_stat", place_id, stat_type, division_type,
+				((name, data_table["data"]) for name, data_table in data["data"].items()),
+				history.tick_to_ts,
+			)
+		return series.reduce_latest_tick(
+			(name, data_table["data"]) for name, data_table in data["data"].items()
+		)
+
+	results: dict[engine.TaskPath, engine.Task] = {}
+	for stat_path, stat_type in STAT_KEYS.items():
+		for division_key, division_type in DIVISION_KEYS.items():
+			results[stat_path + (division_key,)] = get_final_data_point(
+				division_type=division_type,
+				stat_type=stat_type,
+			)
+
+	return lambda: engine.nest({path: result() for path, result in results.items()})
 
-		out = {
-			# "data": data
-		}
-		for name, data_table in data["data"].items():
-			max_tick = 0
-			final_val: Any | None = None
-			for tick, val in data_table["data"].items():
-				tick_val = int(tick)
-				if tick_val > max_tick:
-					max_tick = tick_val
-					final_val = val
-
-			out[name] = final_val
-
-		return out
-	
-	out = {
-		"visits": {
-			"age": get_final_data_point(
-				division_type="Age",
-				stat_type="Visits",
-			),
-			"platform": get_final_data_point(
-				division_type="Platform",
-				stat_type="Visits",
-			),
-		},
-		"premium": {
-			"visits": {
-				"age": get_final_data_point(
-					division_type="Age",
-					stat_type="PremiumVisits",
-				),
-				"platform": get_final_data_point(
-					division_type="Platform",
-					stat_type="PremiumVisits",
-				),
-			},
-			"payout": {
-				"age": get_final_data_point(
-					division_type="Age",
-					stat_type="PremiumPayout",
-				),
-				"platform": get_final_data_point(
-					division_type="Platform",
-					stat_type="PremiumPayout",
-				),
-			},
-		},
-	}
-	return out
+def get_data(session: Session, place_id: int, workers: int = 1) -> dict:
+	return run_plan(session, lambda planner: plan_data(planner, place_id), workers)
@@ -0,0 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any
+
+TaskPath = tuple[str, ...]
+Task = Callable[[], Any]
+
+def nest(flat_data: dict[TaskPath, Any]) -> dict:
+	out: dict = {}
+	for path, val in flat_data.items():
+		branch = out
+		for key in path[:-1]:
+			branch = branch.setdefault(key, {})
+		branch[path[-1]] = val
+	return out
+
+def run_all(tasks: list[Task], workers: int = 1) -> list:
+	if workers <= 1:
+		return [task() for task in tasks]
+
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		futures = [pool.submit(task) for task in tasks]
+		return [future.result() for future in futures]
@@ -0,0 +1,261 @@
+import os
+import csv
+import json
+import base64
+import itertools
+from datetime import datetime, timezone
+from typing import Literal, Iterator, Any
+import src.reader as reader
+from src.rollup import get_child_key
+
+ExportFormat = Literal["parquet", "arrow", "csv"]
+ColumnKind = Literal["bool", "int", "float", "str"]
+
+# rows are flattened and converted this many at a time
+DEFAULT_BATCH = 250
+# parquet keeps metadata for every column of every row group until it closes,
+# so batches are gathered into row groups of about this many bytes
+DEFAULT_ROW_GROUP_BYTES = 128*1024*1024
+TIME_COLUMN = "recorded_at"
+LEGACY_SUFFIX = ".txt"
+LEGACY_FORMAT = "%Yy-%mm-%dd%Hh%Mm"
+
+FORMAT_SUFFIXES: dict[ExportFormat, str] = {
+	"parquet": ".parquet",
+	"arrow": ".arrow",
+	"csv": ".csv",
+}
+
+# pyarrow is optional, it is imported where it is used
+def is_arrow_available() -> bool:
+	try:
+		import pyarrow  # type: ignore[import]
+		return True
+	except ImportError:
+		return False
+
+def get_format(file_path: str, format_arg: str | None) -> ExportFormat:
+	export_format: Any = format_arg
+	if export_format == None:
+		export_format = "csv"
+		for name, suffix in FORMAT_SUFFIXES.items():
+			if file_path.endswith(suffix):
+				export_format = name
+	assert export_format in FORMAT_SUFFIXES, f"unknown export format {export_format}"
+	if export_format != "csv" and not is_arrow_available():
+		print(f"pyarrow is not installed, writing csv instead of {export_format}")
+		return "csv"
+	return export_format
+
+def get_export_path(file_path: str, export_format: ExportFormat) -> str:
+	root, ext = os.path.splitext(file_path)
+	if ext in FORMAT_SUFFIXES.values() and ext != FORMAT_SUFFIXES[export_format]:
+		return root + FORMAT_SUFFIXES[export_format]
+	return file_path
+
+def flatten(data: Any, prefix: str, out: dict[str, Any]):
+	# dicts and lists of dicts become dotted columns, list entries are keyed by their id
+	if isinstance(data, dict):
+		for key, child in data.items():
+			flatten(child, f"{prefix}.{key}" if prefix else str(key), out)
+	elif isinstance(data, list) and any(isinstance(child, dict) for child in data):
+		for i, child in enumerate(data):
+			key = get_child_key(i, child)
+			flatten(child, f"{prefix}.{key}" if prefix else key, out)
+	elif isinstance(data, list):
+		# lists of plain values, like sponsor targeting, stay one cell
+		out[prefix] = json.dumps(data)
+	elif data != None:
+		out[prefix] = data
+
+def get_kind(val: Any) -> ColumnKind:
+	if isinstance(val, bool):
+		return "bool"
+	if isinstance(val, int):
+		return "int"
+	if isinstance(val, float):
+		return "float"
+	return "str"
+
+def merge_kind(kind: ColumnKind | None, val_kind: ColumnKind) -> ColumnKind:
+	if kind == None or kind == val_kind:
+		return val_kind
+	if {kind, val_kind} == {"int", "float"}:
+		return "float"
+	return "str"
+
+def iter_legacy(path: str, start: float, end: float, field_paths: list[list[str]] | None) -> Iterator[tuple[float, dict]]:
+	# the base64 json files written before the store, one per snapshot named by local time
+	if not os.path.isdir(path):
+		return
+	for name in sorted(os.listdir(path)):
+		if not name.endswith(LEGACY_SUFFIX):
+			continue
+		try:
+			recorded_at = datetime.strptime(name[:-len(LEGACY_SUFFIX)], LEGACY_FORMAT).timestamp()
+		except ValueError:
+			continue
+		if not start <= recorded_at < end:
+			continue
+		with open(os.path.join(path, name), "rb") as legacy_file:
+			text = legacy_file.read()
+		if len(text) == 0:
+			print(f"skipping empty snapshot {name}")
+			continue
+		try:
+			sections = json.loads(base64.b64decode(text))
+		except ValueError:
+			print(f"skipping unreadable snapshot {name}")
+			continue
+		if field_paths is not None:
+			sections = reader.project(sections, field_paths)
+		yield recorded_at, sections
+
+def iter_rows(path: str, start: float, end: float, fields: list[str] | None) -> Iterator[dict[str, Any]]:
+	field_paths = None if fields is None else [field.split(".") for field in fields]
+	snapshots = itertools.chain(
+		iter_legacy(path, start, end, field_paths),
+		reader.iter_snapshots(path, start, end, fields),
+	)
+	for recorded_at, sections in snapshots:
+		row: dict[str, Any] = {}
+		flatten(sections, "", row)
+		row[TIME_COLUMN] = datetime.fromtimestamp(recorded_at, timezone.utc)
+		yield row
+
+def scan_columns(path: str, start: float, end: float, fields: list[str] | None) -> tuple[dict[str, ColumnKind], int]:
+	# first pass, only the column names and kinds are kept, never the rows
+	columns: dict[str, ColumnKind] = {}
+	count = 0
+	for row in iter_rows(path, start, end, fields):
+		count += 1
+		for column, val in row.items():
+			if column != TIME_COLUMN:
+				columns[column] = merge_kind(columns.get(column), get_kind(val))
+	return columns, count
+
+def get_arrow_schema(columns: dict[str, ColumnKind]) -> Any:
+	import pyarrow as pa
+	types = {
+		"bool": pa.bool_(),
+		"int": pa.int64(),
+		"float": pa.float64(),
+		"str": pa.string(),
+	}
+	return pa.schema(
+		[pa.field(TIME_COLUMN, pa.timestamp("ms", tz="UTC"), nullable=False)]
+		+ [pa.field(column, types[kind]) for column, kind in columns.items()]
+	)
+
+def get_cell(val: Any, kind: ColumnKind) -> Any:
+	if val == None:
+		return None
+	if kind == "str" and not isinstance(val, str):
+		return json.dumps(val)
+	if kind == "float":
+		return float(val)
+	return val
+
+class ArrowSink:
+	def __init__(self, file_path: str, export_format: ExportFormat, columns: dict[str, ColumnKind], row_group_bytes: int = DEFAULT_ROW_GROUP_BYTES):
+		import pyarrow.parquet as pq  # type: ignore[import]
+		import pyarrow.ipc as ipc  # type: ignore[import]
+		self.columns = columns
+		self.schema = get_arrow_schema(columns)
+		self.is_parquet = export_format == "parquet"
+		self.row_group_bytes = row_group_bytes
+		self.pending: list[Any] = []
+		self.pending_bytes = 0
+		if self.is_parquet:
+			self.writer = pq.ParquetWriter(file_path, self.schema)
+		else:
+			self.writer = ipc.new_file(file_path, self.schema)
+
+	def write(self, rows: list[dict[str, Any]]):
+		import pyarrow as pa
+		data = {TIME_COLUMN: [row[TIME_COLUMN] for row in rows]}
+		for column, kind in self.columns.items():
+			data[column] = [get_cell(row.get(column), kind) for row in rows]
+		record_batch = pa.RecordBatch.from_pydict(data, schema=self.schema)
+		if not self.is_parquet:
+			self.writer.write_batch(record_batch)
+			return
+
+		self.pending.append(record_batch)
+		self.pending_bytes += record_batch.nbytes
+		if self.pending_bytes >= self.row_group_bytes:
+			self.flush()
+
+	def flush(self):
+		import pyarrow as pa
+		if len(self.pending) > 0:
+			table = pa.Table.from_batches(self.pending, schema=self.schema)
+			self.writer.write_table(table, row_group_size=table.num_rows)
+			self.pending = []
+			self.pending_bytes = 0
+
+	def close(self):
+		self.flush()
+		self.writer.close()
+
+class CsvSink:
+	def __init__(self, file_path: str, columns: dict[str, ColumnKind]):
+		self.columns = columns
+		self.file = open(file_path, "w", newline="")
+		self.writer = csv.writer(self.file)
+		self.writer.writerow([TIME_COLUMN] + list(columns))
+
+	def write(self, rows: list[dict[str, Any]]):
+		for row in rows:
+			self.writer.writerow(
+				[row[TIME_COLUMN].strftime("%Y-%m-%dT%H:%M:%S.%fZ")]
+				+ ["" if row.get(column) == None else get_cell(row[column], kind) for column, kind in self.columns.items()]
+			)
+
+	def close(self):
+		self.file.close()
+
+def export_store(
+	path: str,
+	file_path: str,
+	export_format: ExportFormat,
+	start: float = 0,
+	end: float = float("inf"),
+	fields: list[str] | None = None,
+	batch: int = DEFAULT_BATCH,
+	row_group_bytes: int = DEFAULT_ROW_GROUP_BYTES,
+) -> int:
+	columns, count = scan_columns(path, start, end, fields)
+	print(f"exporting {count} snapshots with {len(columns)} columns")
+
+	# written under a temporary name so a failed export never looks finished
+	tmp_path = file_path+".tmp"
+	written = 0
+	rows: list[dict[str, Any]] = []
+	try:
+		sink: ArrowSink | CsvSink
+		if export_format == "csv":
+			sink = CsvSink(tmp_path, columns)
+		else:
+			sink = ArrowSink(tmp_path, export_format, columns, row_group_bytes)
+
+		try:
+			for row in iter_rows(path, start, end, fields):
+				rows.append(row)
+				if len(rows) >= batch:
+					sink.write(rows)
+					written += len(rows)
+					rows = []
+			if len(rows) > 0:
+				sink.write(rows)
+				written += len(rows)
+		finally:
+			sink.close()
+	except BaseException:
+		# a failed export can leave up to a row group of buffered output behind
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+		raise
+
+	os.replace(tmp_path, file_path)
+	return written
@@ -0,0 +1,149 @@
+import os
+import time
+import sqlite3
+from threading import Lock
+from datetime import datetime, timezone
+from typing import Literal, Iterable, Iterator, Callable, Any
+
+HISTORY_FILE = "history.sqlite"
+TS_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+Source = Literal["dashboard", "acquisition", "dev_stat"]
+
+# target_id is the universe for dashboard and acquisition series and the place for dev_stat series
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+	source TEXT NOT NULL,
+	target_id INTEGER NOT NULL,
+	metric TEXT NOT NULL,
+	breakdown TEXT NOT NULL,
+	key TEXT NOT NULL,
+	ts TEXT NOT NULL,
+	value REAL NOT NULL,
+	updated_at REAL NOT NULL,
+	PRIMARY KEY (source, target_id, metric, breakdown, key, ts)
+) WITHOUT ROWID
+"""
+
+# a point seen again replaces the old value, roblox revises recent hours after the fact
+UPSERT = """
+INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (source, target_id, metric, breakdown, key, ts) DO UPDATE SET
+	value = excluded.value,
+	updated_at = excluded.updated_at
+WHERE value != excluded.value
+"""
+
+def tick_to_ts(tick: str) -> str:
+	return datetime.fromtimestamp(int(tick)/1000, timezone.utc).strftime(TS_FORMAT)
+
+def iso_to_ts(iso: str) -> str:
+	# fromisoformat only accepts a trailing Z from python 3.11, releases build on 3.10
+	if iso.endswith("Z"):
+		iso = iso[:-1]+"+00:00"
+	point_time = datetime.fromisoformat(iso)
+	if point_time.tzinfo == None:
+		point_time = point_time.replace(tzinfo=timezone.utc)
+	return point_time.astimezone(timezone.utc).strftime(TS_FORMAT)
+
+class History:
+	def __init__(self, path: str):
+		self.path = path
+		self.lock = Lock()
+		parent = os.path.dirname(path)
+		if parent:
+			os.makedirs(parent, exist_ok=True)
+		# collectors finish on whichever thread ran them, writes are serialised by the lock
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("PRAGMA synchronous=NORMAL")
+		self.connection.execute(SCHEMA)
+		self.connection.commit()
+
+	def upsert_series(
+		self,
+		source: Source,
+		target_id: int,
+		metric: str,
+		breakdown: str,
+		series: Iterable[tuple[str, dict[str, Any]]],
+		to_ts: Callable[[str], str] | None = None,
+	) -> int:
+		now = time.time()
+		rows = [
+			(source, target_id, metric, breakdown, key, ts if to_ts is None else to_ts(ts), float(val), now)
+			for key, points in series
+			for ts, val in points.items()
+			if val is not None
+		]
+		with self.lock, self.connection:
+			self.connection.executemany(UPSERT, rows)
+		return len(rows)
+
+	def get_latest_ts(self, source: Source, target_id: int, metric: str, breakdown: str) -> str | None:
+		with self.lock:
+			row = self.connection.execute(
+				"SELECT MAX(ts) FROM points WHERE source = ? AND target_id = ? AND metric = ? AND breakdown = ?",
+				(source, target_id, metric, breakdown),
+			).fetchone()
+		return row[0]
+
+	def get_latest_values(self, source: Source, target_id: int, metric: str, breakdown: str) -> dict[str, float]:
+		# sqlite fills bare columns from the row that holds the max
+		with self.lock:
+			rows = self.connection.execute(
+				"SELECT key, value, MAX(ts) FROM points WHERE source = ? AND target_id = ? AND metric = ? AND breakdown = ? GROUP BY key",
+				(source, target_id, metric, breakdown),
+			).fetchall()
+		return {key: value for key, value, _ in rows}
+
+	def iter_points(
+		self,
+		source: Source | None = None,
+		target_id: int | None = None,
+		metric: str | None = None,
+		breakdown: str | None = None,
+		start: str | None = None,
+		end: str | None = None,
+	) -> Iterator[tuple[str, int, str, str, str, str, float]]:
+		clauses: list[str] = []
+		args: list[Any] = []
+		for column, val in [("source", source), ("target_id", target_id), ("metric", metric), ("breakdown", breakdown)]:
+			if val != None:
+				clauses.append(f"{column} = ?")
+				args.append(val)
+		if start != None:
+			clauses.append("ts >= ?")
+			args.append(start)
+		if end != None:
+			clauses.append("ts < ?")
+			args.append(end)
+
+		where = " WHERE " + " AND ".join(clauses) if len(clauses) > 0 else ""
+		with self.lock:
+			rows = self.connection.execute(
+				f"SELECT source, target_id, metric, breakdown, key, ts, value FROM points{where} ORDER BY source, target_id, metric, breakdown, key, ts",
+				args,
+			).fetchall()
+		yield from rows
+
+	def read_series(self, source: Source, target_id: int, metric: str, breakdown: str) -> dict[str, dict[str, float]]:
+		out: dict[str, dict[str, float]] = {}
+		for _, _, _, _, key, ts, value in self.iter_points(source, target_id, metric, breakdown):
+			out.setdefault(key, {})[ts] = value
+		return out
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+history: History | None = None
+
+def set_history(path: str | None):
+	global history
+	if history is not None:
+		history.close()
+	history = None if path is None else History(path)
+
+def get_history() -> History | None:
+	return history
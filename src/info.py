@@ -1,8 +1,10 @@
-from lxml import html
 import json
 from requests import Session
 import src.util as util
-from typing import TypedDict
+import src.aio as aio
+from src.planner import Planner, Handle, run_plan
+from functools import cache
+from typing import TypedDict, Callable, Any
 
 class RatingData(TypedDict):
 	likes: int
@@ -14,51 +16,92 @@ class InfoData(TypedDict):
 	visits: int
 	concurrents: int
 
-GAME_URL_PREFIX = "https://www.roblox.com/games/"
+class GamePageData(TypedDict):
+	visits: int
+	concurrents: int
 
-def get_concurrents(session: Session, place_id: int) -> int: 
-	response = session.get(GAME_URL_PREFIX+str(place_id))
-	tree = html.fromstring(response.text)
-	
-	try:
-		for element in tree.xpath("//li[@class='game-stat game-stat-width-voice']"):
-			for stat in element.xpath(".//p[@class='text-label text-overflow font-caption-header']"):
-				if stat.text == "Active":
-					for val in element.xpath(".//p[@class='text-lead font-caption-body wait-for-i18n-format-render invisible']"):
-						return int(val.text.replace(",", ""))
-	except:
-		return 0
-
-	return 0
-	
-def get_game_stats(session: Session, place_id: int) -> InfoData:
-	universe_id = util.get_universe_id(session, place_id)
+GAME_URL_PREFIX = "https://www.roblox.com/games/"
 
-	# get like / dislike
-	for entry in json.loads(session.get(f"https://games.roblox.com/v1/games/votes?universeIds={universe_id}").text)["data"]:
-		if entry["id"] == universe_id:
-			likes = entry["upVotes"]
-			dislikes = entry["downVotes"]
+# the page is walked a single time for both stats
+GAME_PAGE_XPATHS: dict[str, str] = {
+	"page": "//p[@id='game-visit-count'] | //li[@class='game-stat game-stat-width-voice']",
+	"stat_label": ".//p[@class='text-label text-overflow font-caption-header']/text()",
+	"stat_value": ".//p[@class='text-lead font-caption-body wait-for-i18n-format-render invisible']/text()",
+}
 
-	# get favorites
-	favorites = json.loads(session.get(f"https://games.roblox.com/v1/games/{universe_id}/favorites/count").text)["favoritesCount"]
-	
-	# parse for concurrents and visits
-	response = session.get(GAME_URL_PREFIX+str(place_id))
-	tree = html.fromstring(response.text)
+@cache
+def get_game_page_xpaths() -> dict[str, Any]:
+	# compiled on the first parse, so lxml is not loaded at startup
+	return util.compile_xpaths(GAME_PAGE_XPATHS)
 
-	# get visits
-	for element in tree.xpath("//p[@id='game-visit-count']"):
-		visits = int(element.get("title").replace(",", ""))
+def parse_count(text: str) -> int:
+	return int(text.replace(",", ""))
 
-	concurrents = get_concurrents(session, place_id)
+def parse_game_page(text: str) -> GamePageData:
+	xpaths = get_game_page_xpaths()
+	visits: int | None = None
+	concurrents = 0
+	for element in xpaths["page"](util.get_html_tree(text)):
+		if element.tag == "p":
+			visits = parse_count(element.get("title"))
+		elif concurrents == 0 and "Active" in xpaths["stat_label"](element):
+			try:
+				concurrents = parse_count(xpaths["stat_value"](element)[0])
+			except (IndexError, ValueError):
+				pass
 
+	assert visits is not None, "game page has no visit count"
 	return {
-		"rating": {
-			"likes": likes,
-			"dislikes": dislikes,
-		},
-		"favorites": favorites,
 		"visits": visits,
 		"concurrents": concurrents,
 	}
+
+def parse_concurrents(text: str) -> int:
+	return parse_game_page(text)["concurrents"]
+
+def parse_visits(text: str) -> int:
+	return parse_game_page(text)["visits"]
+
+def plan_concurrents(planner: Planner, place_id: int) -> Handle[int]:
+	return planner.get(GAME_URL_PREFIX+str(place_id), parse_concurrents)
+
+def get_concurrents(session: Session, place_id: int) -> int:
+	return run_plan(session, lambda planner: plan_concurrents(planner, place_id).result)
+
+def plan_game_stats(planner: Planner, universe_id: int, place_id: int, universe_ids: list[int] = []) -> Callable[[], InfoData]:
+	# every place in a batch asks for the same votes url so the planner merges them into one call
+	vote_ids = sorted(set(universe_ids) | {universe_id})
+	votes = planner.get(f"https://games.roblox.com/v1/games/votes?universeIds={','.join(map(str, vote_ids))}")
+	favorites = planner.get(f"https://games.roblox.com/v1/games/{universe_id}/favorites/count")
+
+	# one parse of the game page for both concurrents and visits
+	page = planner.get(GAME_URL_PREFIX+str(place_id), parse_game_page)
+
+	def finish() -> InfoData:
+		page_data = page.result()
+
+		# get like / dislike
+		for entry in votes.result()["data"]:
+			if entry["id"] == universe_id:
+				likes = entry["upVotes"]
+				dislikes = entry["downVotes"]
+
+		return {
+			"rating": {
+				"likes": likes,
+				"dislikes": dislikes,
+			},
+			"favorites": favorites.result()["favoritesCount"],
+			"visits": page_data["visits"],
+			"concurrents": page_data["concurrents"],
+		}
+
+	return finish
+
+def get_game_stats(session: Session, place_id: int) -> InfoData:
+	universe_id = util.get_universe_id(session, place_id)
+	return run_plan(session, lambda planner: plan_game_stats(planner, universe_id, place_id))
+
+async def get_game_stats_async(client: aio.AsyncTransport, place_id: int) -> InfoData:
+	universe_id = await aio.get_universe_id(client, place_id)
+	return await aio.run_plan(client, lambda planner: plan_game_stats(planner, universe_id, place_id))
@@ -0,0 +1,178 @@
+import os
+import bisect
+from contextvars import ContextVar
+from threading import Lock, Thread
+from typing import TypedDict, Any
+from src.cache import get_endpoint_template
+
+# upper bounds in seconds, the last bucket is +Inf
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+NO_COLLECTOR = "none"
+
+# the collector and place whose request is being sent, set by the planner around each fetch
+Owner = tuple[str, int]
+owner_var: ContextVar[Owner | None] = ContextVar("owner", default=None)
+
+class Histogram:
+	def __init__(self):
+		self.counts = [0]*(len(LATENCY_BUCKETS) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value: float):
+		self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+		self.sum += value
+		self.count += 1
+
+class RequestStats(TypedDict):
+	requests: int
+	errors: int
+	retries: int
+	bytes: int
+	seconds: float
+
+class CollectorStats(TypedDict):
+	seconds: float
+	ok: bool
+
+RequestKey = tuple[str, str]
+# place, collector, endpoint
+PlaceRequestKey = tuple[int, str, str]
+
+lock = Lock()
+# process lifetime totals for the prometheus export
+latencies: dict[RequestKey, Histogram] = {}
+statuses: dict[tuple[str, str, int], int] = {}
+sizes: dict[RequestKey, int] = {}
+retries: dict[RequestKey, int] = {}
+collector_runs: dict[tuple[str, str], int] = {}
+collector_last: dict[str, CollectorStats] = {}
+# what each place used since its last snapshot, taken when the snapshot is written
+place_requests: dict[PlaceRequestKey, RequestStats] = {}
+place_collectors: dict[tuple[int, str], CollectorStats] = {}
+
+def observe_request(url: str, status: int, seconds: float, size: int, retry: bool):
+	owner = owner_var.get()
+	collector = NO_COLLECTOR if owner is None else owner[0]
+	endpoint = get_endpoint_template(url)
+	key = (collector, endpoint)
+	with lock:
+		if not key in latencies:
+			latencies[key] = Histogram()
+		latencies[key].observe(seconds)
+		statuses[(*key, status)] = statuses.get((*key, status), 0) + 1
+		sizes[key] = sizes.get(key, 0) + size
+		if retry:
+			retries[key] = retries.get(key, 0) + 1
+
+		if owner is not None:
+			stats = place_requests.setdefault((owner[1], collector, endpoint), {"requests": 0, "errors": 0, "retries": 0, "bytes": 0, "seconds": 0.0})
+			stats["requests"] += 1
+			stats["errors"] += 1 if status >= 400 else 0
+			stats["retries"] += 1 if retry else 0
+			stats["bytes"] += size
+			stats["seconds"] += seconds
+
+def observe_collector(name: str, place_id: int, seconds: float, ok: bool):
+	result = "success" if ok else "failure"
+	with lock:
+		collector_runs[(name, result)] = collector_runs.get((name, result), 0) + 1
+		collector_last[name] = {"seconds": seconds, "ok": ok}
+		place_collectors[(place_id, name)] = {"seconds": seconds, "ok": ok}
+
+def get_snapshot(place_id: int, names: list[str]) -> dict:
+	# takes what the place's collectors used since its last snapshot, so each snapshot
+	# only counts its own requests
+	out: dict = {}
+	with lock:
+		for name in names:
+			collector_stats = place_collectors.pop((place_id, name), None)
+			if collector_stats is None:
+				continue
+			endpoints: dict[str, RequestStats] = {}
+			for key in [key for key in place_requests if key[0] == place_id and key[1] == name]:
+				stats = place_requests.pop(key)
+				stats["seconds"] = round(stats["seconds"], 3)
+				endpoints[key[2]] = stats
+			out[name] = {
+				"seconds": round(collector_stats["seconds"], 3),
+				"ok": collector_stats["ok"],
+				"endpoints": endpoints,
+			}
+	return out
+
+def escape_label(val) -> str:
+	return str(val).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def get_labels(**labels) -> str:
+	return "{"+",".join(f'{key}="{escape_label(val)}"' for key, val in labels.items())+"}"
+
+def render() -> str:
+	lines: list[str] = []
+	with lock:
+		lines.append("# HELP midas_request_duration_seconds time spent on each http attempt")
+		lines.append("# TYPE midas_request_duration_seconds histogram")
+		for (collector, endpoint), histogram in sorted(latencies.items()):
+			total = 0
+			for bound, count in zip(LATENCY_BUCKETS + ["+Inf"], histogram.counts):
+				total += count
+				lines.append(f"midas_request_duration_seconds_bucket{get_labels(collector=collector, endpoint=endpoint, le=bound)} {total}")
+			lines.append(f"midas_request_duration_seconds_sum{get_labels(collector=collector, endpoint=endpoint)} {histogram.sum}")
+			lines.append(f"midas_request_duration_seconds_count{get_labels(collector=collector, endpoint=endpoint)} {histogram.count}")
+
+		lines.append("# HELP midas_requests_total http attempts by status code")
+		lines.append("# TYPE midas_requests_total counter")
+		for (collector, endpoint, status), count in sorted(statuses.items()):
+			lines.append(f"midas_requests_total{get_labels(collector=collector, endpoint=endpoint, status=status)} {count}")
+
+		lines.append("# HELP midas_response_bytes_total response body bytes received")
+		lines.append("# TYPE midas_response_bytes_total counter")
+		for (collector, endpoint), size in sorted(sizes.items()):
+			lines.append(f"midas_response_bytes_total{get_labels(collector=collector, endpoint=endpoint)} {size}")
+
+		lines.append("# HELP midas_request_retries_total attempts that repeated an earlier one")
+		lines.append("# TYPE midas_request_retries_total counter")
+		for (collector, endpoint), count in sorted(retries.items()):
+			lines.append(f"midas_request_retries_total{get_labels(collector=collector, endpoint=endpoint)} {count}")
+
+		lines.append("# HELP midas_collector_runs_total collector runs by result")
+		lines.append("# TYPE midas_collector_runs_total counter")
+		for (collector, result), count in sorted(collector_runs.items()):
+			lines.append(f"midas_collector_runs_total{get_labels(collector=collector, result=result)} {count}")
+
+		lines.append("# HELP midas_collector_duration_seconds wall time of the latest run of each collector")
+		lines.append("# TYPE midas_collector_duration_seconds gauge")
+		for collector, stats in sorted(collector_last.items()):
+			lines.append(f"midas_collector_duration_seconds{get_labels(collector=collector)} {stats['seconds']}")
+
+	return "\n".join(lines)+"\n"
+
+def write_textfile(path: str):
+	# node_exporter may read at any moment, so never leave a half written file behind
+	with open(path+".tmp", "w") as metrics_file:
+		metrics_file.write(render())
+	os.replace(path+".tmp", path)
+
+def serve(port: int, host: str = "127.0.0.1") -> Any:
+	# only daemons with -metrics-port pay for importing the http server
+	from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+	class MetricsHandler(BaseHTTPRequestHandler):
+		def log_message(self, *args):
+			pass
+
+		def do_GET(self):
+			if self.path.split("?")[0] != "/metrics":
+				self.send_error(404)
+				return
+			content = render().encode("utf-8")
+			self.send_response(200)
+			self.send_header("Content-Type", "text/plain; version=0.0.4")
+			self.send_header("Content-Length", str(len(content)))
+			self.end_headers()
+			self.wfile.write(content)
+
+	server = ThreadingHTTPServer((host, port), MetricsHandler)
+	server.daemon_threads = True
+	Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+	return server
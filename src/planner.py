@@ -0,0 +1,118 @@
+import json
+import time
+from functools import partial
+from dataclasses import dataclass
+from requests import Session
+from typing import Callable, Generic, TypeVar, Any
+import src.engine as engine
+import src.metrics as metrics
+
+T = TypeVar("T")
+
+JSON_PATCH_CONTENT_TYPE = "application/json-patch+json"
+
+@dataclass(frozen=True)
+class RequestSpec:
+	method: str
+	url: str
+	body: str | None = None
+	content_type: str | None = None
+
+class Handle(Generic[T]):
+	def __init__(self, spec: RequestSpec, parse: Callable[[str], T]):
+		self.spec = spec
+		self.parse = parse
+		self.text: str | None = None
+		self.error: Exception | None = None
+
+	def result(self) -> T:
+		if self.error is not None:
+			raise self.error
+		assert self.text is not None, f"{self.spec.method} {self.spec.url} has not been executed"
+		return self.parse(self.text)
+
+def send(session: Session, spec: RequestSpec) -> str:
+	headers = None
+	if spec.content_type != None:
+		headers = {"Content-Type": spec.content_type}
+
+	response = session.request(
+		method=spec.method,
+		url=spec.url,
+		data=spec.body,
+		headers=headers,
+	)
+	response.raise_for_status()
+	return response.text
+
+class Planner:
+	def __init__(self):
+		self.handles: dict[RequestSpec, list[Handle]] = {}
+		self.executed: set[RequestSpec] = set()
+		# first collector and place to plan each request, its metrics are tagged with them
+		self.owners: dict[RequestSpec, metrics.Owner | None] = {}
+		# every collector and place waiting on each request, for their fetch times
+		self.waiters: dict[RequestSpec, set[metrics.Owner]] = {}
+		self.started_at: float | None = None
+		self.finished_at: dict[metrics.Owner, float] = {}
+
+	def add(self, spec: RequestSpec, parse: Callable[[str], T]) -> Handle[T]:
+		handle = Handle(spec, parse)
+		self.handles.setdefault(spec, []).append(handle)
+		owner = metrics.owner_var.get()
+		self.owners.setdefault(spec, owner)
+		if owner is not None:
+			self.waiters.setdefault(spec, set()).add(owner)
+		return handle
+
+	def get(self, url: str, parse: Callable[[str], Any] = json.loads) -> Handle:
+		return self.add(RequestSpec("GET", url), parse)
+
+	def post_json(self, url: str, payload: Any, parse: Callable[[str], Any] = json.loads) -> Handle:
+		return self.add(RequestSpec("POST", url, json.dumps(payload), JSON_PATCH_CONTENT_TYPE), parse)
+
+	def get_request_count(self) -> int:
+		return sum(len(handles) for handles in self.handles.values())
+
+	def get_unique_count(self) -> int:
+		return len(self.handles)
+
+	def resolve(self, spec: RequestSpec, text: str | None, error: Exception | None):
+		for handle in self.handles[spec]:
+			handle.text = text
+			handle.error = error
+		finished_at = time.monotonic()
+		for owner in self.waiters.get(spec, []):
+			self.finished_at[owner] = finished_at
+
+	def get_owner(self, spec: RequestSpec) -> metrics.Owner | None:
+		return self.owners.get(spec)
+
+	def take_pending(self) -> list[RequestSpec]:
+		if self.started_at == None:
+			self.started_at = time.monotonic()
+		pending = [spec for spec in self.handles if not spec in self.executed]
+		self.executed.update(pending)
+		return pending
+
+	def fetch(self, session: Session, spec: RequestSpec):
+		token = metrics.owner_var.set(self.get_owner(spec))
+		try:
+			self.resolve(spec, send(session, spec), None)
+		except Exception as e:
+			self.resolve(spec, None, e)
+		finally:
+			metrics.owner_var.reset(token)
+
+	def execute(self, session: Session, workers: int = 1):
+		pending = self.take_pending()
+		engine.run_all(
+			[partial(self.fetch, session, spec) for spec in pending],
+			workers
+		)
+
+def run_plan(session: Session, build: Callable[[Planner], Callable[[], T]], workers: int = 1) -> T:
+	planner = Planner()
+	finish = build(planner)
+	planner.execute(session, workers)
+	return finish()
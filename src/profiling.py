@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+from threading import Thread, Event
+from requests import Session
+from typing import TypedDict, Callable, Any
+import src.collectors as collectors
+from src.collectors import CollectorContext
+from src.planner import Planner
+
+SAMPLE_INTERVAL = 0.005
+FLAME_FILE = "flame.folded"
+SUMMARY_FILE = "summary.json"
+
+# what the innermost python frame of a sample is waiting on, first prefix match wins
+WAIT_KINDS: list[tuple[str, str]] = [
+	# token bucket waits and retry backoff both sleep in the transport
+	("transport.py:acquire", "rate_limit"),
+	("transport.py:send_uncached", "rate_limit"),
+	("socket.py:", "network"),
+	("ssl.py:", "network"),
+	("client.py:", "network"),
+	("connection.py:", "network"),
+]
+
+class StageProfile(TypedDict):
+	wall: float
+	cpu: float
+	blocked: float
+	samples: dict[str, int]
+
+def get_frame_name(frame) -> str:
+	return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+def get_wait_kind(stack: str) -> str:
+	top = stack.split(";")[-1]
+	for prefix, kind in WAIT_KINDS:
+		if top.startswith(prefix):
+			return kind
+	return "cpu"
+
+class StackSampler:
+	def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+		self.thread_id = thread_id
+		self.interval = interval
+		self.label = "idle"
+		self.counts: dict[str, int] = {}
+		self.stop_event = Event()
+		self.thread = Thread(target=self.run, name="sampler", daemon=True)
+
+	def run(self):
+		while not self.stop_event.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			names = []
+			while frame != None:
+				names.append(get_frame_name(frame))
+				frame = frame.f_back
+			# folded stacks read root first, the stage label is the root
+			stack = ";".join([self.label] + names[::-1])
+			self.counts[stack] = self.counts.get(stack, 0) + 1
+
+	def start(self) -> "StackSampler":
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.stop_event.set()
+		self.thread.join()
+
+	def get_waits(self, label: str) -> dict[str, int]:
+		waits: dict[str, int] = {}
+		for stack, count in list(self.counts.items()):
+			if stack.split(";")[0] == label:
+				kind = get_wait_kind(stack)
+				waits[kind] = waits.get(kind, 0) + count
+		return waits
+
+	def write(self, path: str):
+		with open(path, "w") as flame_file:
+			for stack, count in sorted(self.counts.items()):
+				flame_file.write(f"{stack} {count}\n")
+
+def profile_stage(profile_dir: str, sampler: StackSampler, label: str, func: Callable[[], Any]) -> tuple[Any, StageProfile]:
+	profiler = cProfile.Profile()
+	sampler.label = label
+	wall_start = time.perf_counter()
+	cpu_start = time.thread_time()
+	try:
+		result = profiler.runcall(func)
+	finally:
+		cpu = time.thread_time() - cpu_start
+		wall = time.perf_counter() - wall_start
+		sampler.label = "idle"
+		profiler.dump_stats(os.path.join(profile_dir, f"{label}.pstats"))
+
+	return result, {
+		"wall": wall,
+		"cpu": cpu,
+		"blocked": max(wall - cpu, 0),
+		"samples": sampler.get_waits(label),
+	}
+
+def get_outcome(finish: Callable[[], Any]) -> Callable[[], Any]:
+	# finish inside the profile, but leave failures for the caller to handle like a normal run
+	try:
+		value = finish()
+		return lambda: value
+	except Exception as e:
+		error = e
+		def fail():
+			raise error
+		return fail
+
+def profile_run(
+	profile_dir: str,
+	session: Session,
+	contexts: list[CollectorContext],
+	names: list[str],
+	write: Callable[[dict[int, dict[str, Callable[[], Any]]]], None],
+) -> dict[str, StageProfile]:
+	os.makedirs(profile_dir, exist_ok=True)
+	sampler = StackSampler(threading.get_ident()).start()
+	stages: dict[str, StageProfile] = {}
+	place_sections: dict[int, dict[str, Callable[[], Any]]] = {ctx["place_id"]: {} for ctx in contexts}
+
+	try:
+		# one collector at a time on this thread, so every profile only holds its own work
+		for name in names:
+			def collect_serially() -> dict[int, Callable[[], Any]]:
+				planner = Planner()
+				finishers = {ctx["place_id"]: collectors.plan_collector(planner, ctx, name) for ctx in contexts}
+				planner.execute(session, 1)
+				return {place_id: get_outcome(finish) for place_id, finish in finishers.items()}
+
+			outcomes, stages[name] = profile_stage(profile_dir, sampler, name, collect_serially)
+			for place_id, outcome in outcomes.items():
+				place_sections[place_id][name] = outcome
+
+		_, stages["store"] = profile_stage(profile_dir, sampler, "store", lambda: write(place_sections))
+	finally:
+		sampler.stop()
+
+	sampler.write(os.path.join(profile_dir, FLAME_FILE))
+	with open(os.path.join(profile_dir, SUMMARY_FILE), "w") as summary_file:
+		json.dump(stages, summary_file, indent=1)
+
+	return stages
+
+def get_report(stages: dict[str, StageProfile]) -> str:
+	lines = [f"{'stage':<12} {'wall s':>8} {'cpu s':>8} {'blocked s':>9} {'network':>8} {'rate limit':>10}"]
+	for name, stage in stages.items():
+		total = max(sum(stage["samples"].values()), 1)
+		network = stage["samples"].get("network", 0)/total
+		rate_limit = stage["samples"].get("rate_limit", 0)/total
+		lines.append(f"{name:<12} {stage['wall']:>8.2f} {stage['cpu']:>8.2f} {stage['blocked']:>9.2f} {network:>8.0%} {rate_limit:>10.0%}")
+	return "\n".join(lines)
@@ -0,0 +1,182 @@
+import os
+import mmap
+import bisect
+import heapq
+from datetime import datetime
+from typing import Iterator, Iterable, Any
+import src.store as store
+import src.block as block
+from src.store import RECORD_HEADER, SEGMENT_HEADER, INDEX_ENTRY
+
+TimeArg = datetime | float | None
+
+class SegmentIndex:
+	def __init__(self, index_data: bytes | mmap.mmap, extra_entries: list[tuple[float, int]]):
+		self.index_data = index_data
+		self.indexed_count = len(index_data) // INDEX_ENTRY.size
+		self.extra_entries = extra_entries
+
+	def __len__(self) -> int:
+		return self.indexed_count + len(self.extra_entries)
+
+	def __getitem__(self, i: int) -> tuple[float, int]:
+		if i < self.indexed_count:
+			recorded_at, offset = INDEX_ENTRY.unpack_from(self.index_data, i*INDEX_ENTRY.size)
+			return recorded_at, offset
+		return self.extra_entries[i-self.indexed_count]
+
+	def get_time(self, i: int) -> float:
+		return self[i][0]
+
+	def bisect(self, recorded_at: float) -> int:
+		return bisect.bisect_left(range(len(self)), recorded_at, key=self.get_time)
+
+def to_timestamp(time_arg: TimeArg, default: float) -> float:
+	if time_arg is None:
+		return default
+	if isinstance(time_arg, datetime):
+		return time_arg.timestamp()
+	return time_arg
+
+def map_file(path: str) -> bytes | mmap.mmap:
+	if not os.path.exists(path) or os.path.getsize(path) == 0:
+		return b""
+	with open(path, "rb") as mapped_file:
+		return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def scan_records(segment_data: bytes | mmap.mmap, offset: int, last_time: float) -> list[tuple[float, int]]:
+	entries = []
+	while offset + RECORD_HEADER.size <= len(segment_data):
+		payload_len, crc, recorded_at, section_count = RECORD_HEADER.unpack_from(segment_data, offset)
+		if offset + RECORD_HEADER.size + payload_len > len(segment_data):
+			break
+		# kept monotonic like the index the store writes
+		last_time = max(last_time, recorded_at)
+		entries.append((last_time, offset))
+		offset += RECORD_HEADER.size + payload_len
+	return entries
+
+def load_index(segment_path: str, segment_data: bytes | mmap.mmap) -> SegmentIndex:
+	index_data = map_file(store.get_index_path(segment_path))
+	count = len(index_data) // INDEX_ENTRY.size
+
+	# pick up records appended after the last index write
+	scan_offset = SEGMENT_HEADER.size
+	last_time = 0.0
+	if count > 0:
+		last_time, last_offset = INDEX_ENTRY.unpack_from(index_data, (count-1)*INDEX_ENTRY.size)
+		payload_len = RECORD_HEADER.unpack_from(segment_data, last_offset)[0]
+		scan_offset = last_offset + RECORD_HEADER.size + payload_len
+
+	return SegmentIndex(index_data, scan_records(segment_data, scan_offset, last_time))
+
+def get_field(data: dict, path: list[str]) -> Any:
+	val: Any = data
+	for key in path:
+		val = val[key]
+	return val
+
+def project(sections: dict, field_paths: list[list[str]]) -> dict:
+	out: dict = {}
+	for path in field_paths:
+		try:
+			val = get_field(sections, path)
+		except (KeyError, IndexError, TypeError):
+			continue
+		branch = out
+		for key in path[:-1]:
+			branch = branch.setdefault(key, {})
+		branch[path[-1]] = val
+	return out
+
+def read_record(segment_data: bytes | mmap.mmap, offset: int, names: set[str] | None) -> tuple[float, dict]:
+	payload_len, crc, recorded_at, section_count = RECORD_HEADER.unpack_from(segment_data, offset)
+	start = offset + RECORD_HEADER.size
+	with memoryview(segment_data)[start:start+payload_len] as payload:
+		return recorded_at, store.decode_payload(payload, section_count, names)
+
+def iter_segment(segment_path: str, start: float, end: float, names: set[str] | None) -> Iterator[tuple[float, dict]]:
+	segment_data = map_file(segment_path)
+	if len(segment_data) < SEGMENT_HEADER.size:
+		return
+
+	index = load_index(segment_path, segment_data)
+	try:
+		# index times are the newest time appended so far, so a record appended out of order
+		# sits past the index times of its range, every later header is checked for its real time
+		matches: list[tuple[float, int]] = []
+		for i in range(index.bisect(start), len(index)):
+			offset = index[i][1]
+			recorded_at = RECORD_HEADER.unpack_from(segment_data, offset)[2]
+			if start <= recorded_at < end:
+				matches.append((recorded_at, offset))
+
+		matches.sort()
+		for recorded_at, offset in matches:
+			yield read_record(segment_data, offset, names)
+	finally:
+		# release the maps so the segment can be compacted or removed
+		for mapped in [index.index_data, segment_data]:
+			if isinstance(mapped, mmap.mmap):
+				mapped.close()
+
+def iter_block(block_path: str, start: float, end: float, names: set[str] | None) -> Iterator[tuple[float, dict]]:
+	for recorded_at, sections in block.read_block(block_path):
+		if start <= recorded_at < end:
+			if names is not None:
+				sections = {name: val for name, val in sections.items() if name in names}
+			yield recorded_at, sections
+
+def get_recorded_at(record: tuple[float, dict]) -> float:
+	return record[0]
+
+def merge_records(sources: list[Iterable[tuple[float, dict]]]) -> Iterator[tuple[float, dict]]:
+	# a compacted day can gain a segment again from late appends or replayed spools, and a
+	# crash part way through compaction leaves its records in both, so those are dropped once
+	last_time: float | None = None
+	same_time: list[dict] = []
+	for recorded_at, sections in heapq.merge(*sources, key=get_recorded_at):
+		if recorded_at != last_time:
+			last_time = recorded_at
+			same_time = []
+		elif sections in same_time:
+			continue
+		same_time.append(sections)
+		yield recorded_at, sections
+
+def iter_snapshots(
+	path: str,
+	start: TimeArg = None,
+	end: TimeArg = None,
+	fields: list[str] | None = None
+) -> Iterator[tuple[float, dict]]:
+	start_time = to_timestamp(start, 0)
+	end_time = to_timestamp(end, float("inf"))
+
+	field_paths: list[list[str]] | None = None
+	names: set[str] | None = None
+	if fields is not None:
+		field_paths = [field.split(".") for field in fields]
+		names = {field_path[0] for field_path in field_paths}
+
+	first_day = store.get_day(start_time) if start_time > 0 else ""
+	last_day = store.get_day(end_time) if end_time != float("inf") else "~"
+
+	block_days = {name[:-len(block.BLOCK_SUFFIX)] for name in block.list_blocks(path)}
+	segment_days = {name[:-len(store.SEGMENT_SUFFIX)] for name in store.list_segments(path)}
+
+	for day in sorted(block_days | segment_days):
+		if day < first_day or day > last_day:
+			continue
+
+		sources: list[Iterable[tuple[float, dict]]] = []
+		if day in block_days:
+			sources.append(iter_block(block.get_block_path(path, day), start_time, end_time, names))
+		if day in segment_days:
+			sources.append(iter_segment(os.path.join(path, day+store.SEGMENT_SUFFIX), start_time, end_time, names))
+		records = sources[0] if len(sources) == 1 else merge_records(sources)
+
+		for recorded_at, sections in records:
+			if field_paths is not None:
+				sections = project(sections, field_paths)
+			yield recorded_at, sections
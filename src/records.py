@@ -0,0 +1,290 @@
+import sys
+import math
+from array import array
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any
+from src.ads import AdData, IntCurTotalData, FloatCurTotalData
+from src.info import InfoData
+from src.sponsorships import SponsorData
+
+# snapshots as the collectors return them are nested dicts, one dict and one boxed
+# number per breakdown entry. these records keep the same data in slotted objects and
+# flat arrays, share the key names between snapshots, and turn back into the exact
+# json layout with to_json
+
+# ints past this lose precision as doubles, so they stay boxed
+MAX_ARRAY_INT = 2**53
+
+name_sets: dict[tuple[str, ...], tuple[str, ...]] = {}
+name_lock = Lock()
+
+def intern_names(names: tuple[str, ...]) -> tuple[str, ...]:
+	# every snapshot of a breakdown has the same keys, so they are held once per process
+	with name_lock:
+		if not names in name_sets:
+			shared = tuple(sys.intern(name) for name in names)
+			name_sets[shared] = shared
+		return name_sets[names]
+
+def is_number(val: Any) -> bool:
+	if isinstance(val, float):
+		# nan already marks a missing point
+		return val == val
+	if val == None:
+		return True
+	return isinstance(val, int) and not isinstance(val, bool) and abs(val) <= MAX_ARRAY_INT
+
+@dataclass(slots=True)
+class Breakdown:
+	names: tuple[str, ...]
+	# nan marks a missing point
+	values: array
+	# bit i is set when value i was an int, so it goes back out without a trailing .0
+	ints: int
+
+	@staticmethod
+	def from_dict(data: dict[str, Any]) -> "Breakdown":
+		values = array("d")
+		ints = 0
+		for i, val in enumerate(data.values()):
+			if val == None:
+				values.append(math.nan)
+				continue
+			if isinstance(val, int):
+				ints |= 1 << i
+			values.append(val)
+		return Breakdown(intern_names(tuple(data)), values, ints)
+
+	def to_json(self) -> dict[str, Any]:
+		return {
+			name: None if val != val else int(val) if self.ints >> i & 1 else val
+			for i, (name, val) in enumerate(zip(self.names, self.values))
+		}
+
+@dataclass(slots=True)
+class Tree:
+	names: tuple[str, ...]
+	children: list[Any]
+
+	def to_json(self) -> dict[str, Any]:
+		return {name: to_json(child) for name, child in zip(self.names, self.children)}
+
+def compact(data: Any) -> Any:
+	# dicts of plain numbers become arrays, other dicts keep their shape with shared keys
+	if isinstance(data, dict):
+		if len(data) > 0 and all(is_number(val) for val in data.values()):
+			return Breakdown.from_dict(data)
+		return Tree(intern_names(tuple(data)), [compact(val) for val in data.values()])
+	if isinstance(data, list):
+		return [compact(val) for val in data]
+	if isinstance(data, str):
+		return sys.intern(data)
+	return data
+
+def to_json(data: Any) -> Any:
+	if hasattr(data, "to_json"):
+		return data.to_json()
+	if isinstance(data, list):
+		return [to_json(val) for val in data]
+	return data
+
+# the typed records only take sections laid out exactly as the collectors write them,
+# anything else is compacted generically so no key is ever dropped
+CUR_TOTAL_FIELDS = ("current", "total")
+AD_FIELDS = ("title", "id", "type", "is_running", "clicks", "ctr", "bid", "impressions", "cpc")
+AD_CUR_TOTAL_FIELDS = ("clicks", "ctr", "bid", "impressions", "cpc")
+SPONSOR_FIELDS = ("title", "id", "status", "bid", "budget", "impressions", "impression_conversions", "clicks", "click_conversions", "target", "time")
+SPONSOR_TARGET_FIELDS = ("gender", "age", "device")
+SPONSOR_TIME_FIELDS = ("start", "end")
+INFO_FIELDS = ("rating", "favorites", "visits", "concurrents")
+RATING_FIELDS = ("likes", "dislikes")
+
+def has_fields(data: Any, fields: tuple[str, ...]) -> bool:
+	return isinstance(data, dict) and tuple(data) == fields
+
+def is_ad(data: Any) -> bool:
+	return has_fields(data, AD_FIELDS) and all(has_fields(data[key], CUR_TOTAL_FIELDS) for key in AD_CUR_TOTAL_FIELDS)
+
+def is_sponsor(data: Any) -> bool:
+	return (
+		has_fields(data, SPONSOR_FIELDS)
+		and has_fields(data["target"], SPONSOR_TARGET_FIELDS)
+		and all(isinstance(data["target"][key], list) for key in SPONSOR_TARGET_FIELDS)
+		and has_fields(data["time"], SPONSOR_TIME_FIELDS)
+	)
+
+def is_info(data: Any) -> bool:
+	return has_fields(data, INFO_FIELDS) and has_fields(data["rating"], RATING_FIELDS)
+
+@dataclass(slots=True)
+class IntCurTotal:
+	current: int
+	total: int
+
+	def to_json(self) -> IntCurTotalData:
+		return {"current": self.current, "total": self.total}
+
+@dataclass(slots=True)
+class FloatCurTotal:
+	current: float
+	total: float
+
+	def to_json(self) -> FloatCurTotalData:
+		return {"current": self.current, "total": self.total}
+
+@dataclass(slots=True)
+class AdRecord:
+	title: str
+	id: str
+	type: str
+	is_running: bool
+	clicks: IntCurTotal
+	ctr: FloatCurTotal
+	bid: IntCurTotal
+	impressions: IntCurTotal
+	cpc: FloatCurTotal
+
+	@staticmethod
+	def from_json(data: AdData) -> "AdRecord":
+		return AdRecord(
+			title=data["title"],
+			id=data["id"],
+			type=sys.intern(data["type"]),
+			is_running=data["is_running"],
+			clicks=IntCurTotal(**data["clicks"]),
+			ctr=FloatCurTotal(**data["ctr"]),
+			bid=IntCurTotal(**data["bid"]),
+			impressions=IntCurTotal(**data["impressions"]),
+			cpc=FloatCurTotal(**data["cpc"]),
+		)
+
+	def to_json(self) -> AdData:
+		return {
+			"title": self.title,
+			"id": self.id,
+			"type": self.type,
+			"is_running": self.is_running,
+			"clicks": self.clicks.to_json(),
+			"ctr": self.ctr.to_json(),
+			"bid": self.bid.to_json(),
+			"impressions": self.impressions.to_json(),
+			"cpc": self.cpc.to_json(),
+		}
+
+@dataclass(slots=True)
+class SponsorRecord:
+	title: str
+	id: int
+	status: str
+	bid: int
+	budget: int
+	impressions: int
+	impression_conversions: int
+	clicks: int
+	click_conversions: int
+	gender: tuple[str, ...]
+	age: tuple[str, ...]
+	device: tuple[str, ...]
+	start: str
+	end: str
+
+	@staticmethod
+	def from_json(data: SponsorData) -> "SponsorRecord":
+		return SponsorRecord(
+			title=data["title"],
+			id=data["id"],
+			status=sys.intern(data["status"]),
+			bid=data["bid"],
+			budget=data["budget"],
+			impressions=data["impressions"],
+			impression_conversions=data["impression_conversions"],
+			clicks=data["clicks"],
+			click_conversions=data["click_conversions"],
+			gender=intern_names(tuple(data["target"]["gender"])),
+			age=intern_names(tuple(data["target"]["age"])),
+			device=intern_names(tuple(data["target"]["device"])),
+			start=data["time"]["start"],
+			end=data["time"]["end"],
+		)
+
+	def to_json(self) -> SponsorData:
+		return {
+			"title": self.title,
+			"id": self.id,
+			"status": self.status,
+			"bid": self.bid,
+			"budget": self.budget,
+			"impressions": self.impressions,
+			"impression_conversions": self.impression_conversions,
+			"clicks": self.clicks,
+			"click_conversions": self.click_conversions,
+			"target": {
+				"gender": list(self.gender),
+				"age": list(self.age),
+				"device": list(self.device),
+			},
+			"time": {
+				"start": self.start,
+				"end": self.end,
+			},
+		}
+
+@dataclass(slots=True)
+class InfoRecord:
+	likes: int
+	dislikes: int
+	favorites: int
+	visits: int
+	concurrents: int
+
+	@staticmethod
+	def from_json(data: InfoData) -> "InfoRecord":
+		return InfoRecord(
+			likes=data["rating"]["likes"],
+			dislikes=data["rating"]["dislikes"],
+			favorites=data["favorites"],
+			visits=data["visits"],
+			concurrents=data["concurrents"],
+		)
+
+	def to_json(self) -> InfoData:
+		return {
+			"rating": {
+				"likes": self.likes,
+				"dislikes": self.dislikes,
+			},
+			"favorites": self.favorites,
+			"visits": self.visits,
+			"concurrents": self.concurrents,
+		}
+
+def from_section(name: str, data: Any) -> Any:
+	# sections without a fixed schema, such as dashboard and dev_stat, are compacted generically
+	if name == "info" and is_info(data):
+		return InfoRecord.from_json(data)
+	if name == "ads" and isinstance(data, list) and all(is_ad(ad) for ad in data):
+		return [AdRecord.from_json(ad) for ad in data]
+	if name == "sponsors" and isinstance(data, list) and all(is_sponsor(sponsor) for sponsor in data):
+		return [SponsorRecord.from_json(sponsor) for sponsor in data]
+	return compact(data)
+
+@dataclass(slots=True)
+class SnapshotRecord:
+	recorded_at: float
+	names: tuple[str, ...]
+	sections: list[Any]
+
+	@staticmethod
+	def from_json(snapshot: dict, recorded_at: float) -> "SnapshotRecord":
+		return SnapshotRecord(
+			recorded_at,
+			intern_names(tuple(snapshot)),
+			[from_section(name, data) for name, data in snapshot.items()],
+		)
+
+	def get_section(self, name: str) -> Any:
+		return self.sections[self.names.index(name)]
+
+	def to_json(self) -> dict:
+		return {name: to_json(section) for name, section in zip(self.names, self.sections)}
@@ -0,0 +1,80 @@
+import os
+import json
+import time
+from threading import Lock
+from typing import TypedDict
+import src.util as util
+
+RETRY_FILE = "retry-queue.json"
+RETRY_BASE = 60
+RETRY_CAP = 60*60
+retry_lock = Lock()
+
+# a collector that failed for a place, kept until a later run of it succeeds
+class RetryEntry(TypedDict):
+	collector: str
+	place_id: int
+	failed_at: float
+	attempts: int
+	next_at: float
+	error: str
+
+def get_entry_key(collector: str, place_id: int) -> str:
+	return f"{place_id}/{collector}"
+
+def read_queue() -> dict[str, RetryEntry]:
+	path = util.get_cache_path(RETRY_FILE)
+	if not os.path.exists(path):
+		return {}
+	try:
+		with open(path) as queue_file:
+			return json.load(queue_file)
+	except ValueError:
+		return {}
+
+def write_queue(queue: dict[str, RetryEntry]):
+	path = util.get_cache_path(RETRY_FILE)
+	with open(path+".tmp", "w") as queue_file:
+		json.dump(queue, queue_file, indent=1)
+	os.replace(path+".tmp", path)
+
+def get_retry_delay(attempts: int) -> float:
+	return min(RETRY_CAP, RETRY_BASE * 2**max(attempts - 1, 0))
+
+def update_queue(failures: dict[tuple[str, int], str], successes: list[tuple[str, int]]) -> dict[tuple[str, int], RetryEntry]:
+	now = time.time()
+	resolved: dict[tuple[str, int], RetryEntry] = {}
+	with retry_lock:
+		queue = read_queue()
+		changed = False
+		for collector, place_id in successes:
+			entry = queue.pop(get_entry_key(collector, place_id), None)
+			if entry is not None:
+				resolved[(collector, place_id)] = entry
+				changed = True
+
+		for (collector, place_id), error in failures.items():
+			key = get_entry_key(collector, place_id)
+			attempts = queue[key]["attempts"] + 1 if key in queue else 1
+			queue[key] = {
+				"collector": collector,
+				"place_id": place_id,
+				"failed_at": queue[key]["failed_at"] if key in queue else now,
+				"attempts": attempts,
+				"next_at": now + get_retry_delay(attempts),
+				"error": error,
+			}
+			changed = True
+
+		if changed:
+			write_queue(queue)
+	return resolved
+
+def get_queued(place_ids: list[int], due_only: bool = True) -> list[RetryEntry]:
+	now = time.time()
+	with retry_lock:
+		queue = read_queue()
+	return [
+		entry for entry in queue.values()
+		if entry["place_id"] in place_ids and (not due_only or entry["next_at"] <= now)
+	]
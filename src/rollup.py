@@ -0,0 +1,184 @@
+import os
+import sqlite3
+from threading import Lock
+from typing import TypedDict, Iterable, Any
+import src.reader as reader
+
+ROLLUP_FILE = "rollup.sqlite"
+REBUILD_BATCH = 1000
+
+# bucket widths in seconds, buckets start on utc boundaries
+PERIODS: dict[str, int] = {
+	"1h": 60*60,
+	"1d": 60*60*24,
+}
+
+# a * matches every key of a dict, or every entry of a list by its id
+DEFAULT_METRICS = [
+	"info.concurrents",
+	"info.visits",
+	"live.totalPlayerCount",
+	"ads.*.ctr.current",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+	metric TEXT NOT NULL,
+	period TEXT NOT NULL,
+	start REAL NOT NULL,
+	count INTEGER NOT NULL,
+	sum REAL NOT NULL,
+	min REAL NOT NULL,
+	max REAL NOT NULL,
+	last REAL NOT NULL,
+	last_at REAL NOT NULL,
+	PRIMARY KEY (metric, period, start)
+) WITHOUT ROWID
+"""
+
+# each point folds into its bucket, nothing already recorded is read back
+UPSERT = """
+INSERT INTO rollups VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+ON CONFLICT (metric, period, start) DO UPDATE SET
+	count = count + 1,
+	sum = sum + excluded.sum,
+	min = MIN(min, excluded.min),
+	max = MAX(max, excluded.max),
+	last = CASE WHEN excluded.last_at >= last_at THEN excluded.last ELSE last END,
+	last_at = MAX(last_at, excluded.last_at)
+"""
+
+class RollupRow(TypedDict):
+	metric: str
+	period: str
+	start: float
+	count: int
+	sum: float
+	min: float
+	max: float
+	avg: float
+	last: float
+
+def get_section_names(metrics: list[str]) -> set[str]:
+	return {metric.split(".")[0] for metric in metrics}
+
+def get_child_key(i: int, child: Any) -> str:
+	if isinstance(child, dict) and "id" in child:
+		return str(child["id"])
+	return str(i)
+
+def extract(data: Any, parts: list[str], prefix: list[str], out: list[tuple[str, float]]):
+	if len(parts) == 0:
+		if isinstance(data, (int, float)) and not isinstance(data, bool):
+			out.append((".".join(prefix), float(data)))
+		return
+
+	part = parts[0]
+	if isinstance(data, list):
+		for i, child in enumerate(data):
+			key = get_child_key(i, child)
+			if part == "*" or part == key:
+				extract(child, parts[1:], prefix + [key], out)
+	elif isinstance(data, dict):
+		if part == "*":
+			for key, child in data.items():
+				extract(child, parts[1:], prefix + [key], out)
+		elif part in data:
+			extract(data[part], parts[1:], prefix + [part], out)
+
+def get_points(sections: dict, metrics: list[str]) -> list[tuple[str, float]]:
+	points: list[tuple[str, float]] = []
+	for metric in metrics:
+		extract(sections, metric.split("."), [], points)
+	return points
+
+def get_bucket_start(recorded_at: float, seconds: int) -> float:
+	return float(int(recorded_at // seconds) * seconds)
+
+def get_rows(recorded_at: float, points: list[tuple[str, float]]) -> list[tuple]:
+	return [
+		(metric, period, get_bucket_start(recorded_at, seconds), val, val, val, val, recorded_at)
+		for metric, val in points
+		for period, seconds in PERIODS.items()
+	]
+
+class Rollup:
+	def __init__(self, path: str, metrics: list[str] = DEFAULT_METRICS):
+		self.path = path
+		self.metrics = metrics
+		self.section_names = get_section_names(metrics)
+		self.lock = Lock()
+		parent = os.path.dirname(path)
+		if parent:
+			os.makedirs(parent, exist_ok=True)
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("PRAGMA synchronous=NORMAL")
+		self.connection.execute(SCHEMA)
+		self.connection.commit()
+
+	def add(self, recorded_at: float, sections: dict) -> int:
+		rows = get_rows(recorded_at, get_points(sections, self.metrics))
+		with self.lock, self.connection:
+			self.connection.executemany(UPSERT, rows)
+		return len(rows)
+
+	def add_many(self, snapshots: Iterable[tuple[float, dict]]) -> int:
+		rows = [row for recorded_at, sections in snapshots for row in get_rows(recorded_at, get_points(sections, self.metrics))]
+		with self.lock, self.connection:
+			self.connection.executemany(UPSERT, rows)
+		return len(rows)
+
+	def clear(self):
+		with self.lock, self.connection:
+			self.connection.execute("DELETE FROM rollups")
+
+	def get_metrics(self) -> list[str]:
+		with self.lock:
+			return [row[0] for row in self.connection.execute("SELECT DISTINCT metric FROM rollups ORDER BY metric")]
+
+	def query(self, metric: str, period: str, start: float | None = None, end: float | None = None) -> list[RollupRow]:
+		assert period in PERIODS, f"unknown rollup period {period}"
+		clauses = ["metric = ?", "period = ?"]
+		args: list[Any] = [metric, period]
+		if start is not None:
+			clauses.append("start >= ?")
+			args.append(get_bucket_start(start, PERIODS[period]))
+		if end is not None:
+			clauses.append("start < ?")
+			args.append(end)
+
+		with self.lock:
+			rows = self.connection.execute(
+				f"SELECT start, count, sum, min, max, last FROM rollups WHERE {' AND '.join(clauses)} ORDER BY start",
+				args,
+			).fetchall()
+		return [
+			{
+				"metric": metric,
+				"period": period,
+				"start": bucket_start,
+				"count": count,
+				"sum": total,
+				"min": low,
+				"max": high,
+				"avg": total/count,
+				"last": last,
+			} for bucket_start, count, total, low, high, last in rows
+		]
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+def rebuild(rollup: Rollup, store_path: str) -> int:
+	# for data recorded before rollups existed, or snapshots replayed after a crash
+	rollup.clear()
+	added = 0
+	batch: list[tuple[float, dict]] = []
+	for snapshot in reader.iter_snapshots(store_path, fields=sorted(rollup.section_names)):
+		batch.append(snapshot)
+		if len(batch) >= REBUILD_BATCH:
+			added += rollup.add_many(batch)
+			batch = []
+	return added + rollup.add_many(batch)
@@ -0,0 +1,31 @@
+from typing import Any, Iterable
+
+# breakdown and stat payloads are {timestamp: value} maps, one per series, in no promised order
+
+def get_latest_iso(points: dict[str, Any]) -> Any:
+	# fixed format utc iso timestamps sort the same as the times they name, so no parsing is needed
+	latest_ts: str | None = None
+	latest_val: Any = None
+	for ts, val in points.items():
+		if val is not None and (latest_ts is None or ts > latest_ts):
+			latest_ts = ts
+			latest_val = val
+	return latest_val
+
+def get_latest_tick(points: dict[str, Any]) -> Any:
+	# non negative integer ticks order by length first, then lexicographically
+	latest_tick: str | None = None
+	latest_val: Any = None
+	for tick, val in points.items():
+		if val is None:
+			continue
+		if latest_tick is None or len(tick) > len(latest_tick) or (len(tick) == len(latest_tick) and tick > latest_tick):
+			latest_tick = tick
+			latest_val = val
+	return latest_val
+
+def reduce_latest_iso(series: Iterable[tuple[str, dict[str, Any]]]) -> dict[str, Any]:
+	return {key: get_latest_iso(points) for key, points in series}
+
+def reduce_latest_tick(series: Iterable[tuple[str, dict[str, Any]]]) -> dict[str, Any]:
+	return {key: get_latest_tick(points) for key, points in series}
@@ -1,7 +1,9 @@
 import json
 from requests import Session
 import src.util as util
-from typing import TypedDict
+import src.aio as aio
+from src.planner import Planner, Handle, run_plan
+from typing import TypedDict, Callable
 
 class SponsorAPIData(TypedDict):
 	adId: int
@@ -53,24 +55,26 @@ class SponsorData(TypedDict):
 	status: str
 	bid: int
 	budget: int
-	clicks: int
 	impressions: int
+	impression_conversions: int
+	clicks: int
+	click_conversions: int
 	target: SponsorTargeting
 	time: SponsorTime
 
+def plan_sponsor_data(planner: Planner, universe_id: int) -> Handle[SponsorAPIResponse]:
+	return planner.get(f"https://adconfiguration.roblox.com/v2/sponsored-games?universeId={universe_id}&includeReportingStats=true")
+
 def get_sponsor_data(session: Session, place_id: int) -> SponsorAPIResponse:
 	universe_id = util.get_universe_id(session, place_id)
-	response = session.get(
-		url=f"https://adconfiguration.roblox.com/v2/sponsored-games?universeId={universe_id}&includeReportingStats=true",
-		headers={},
-	)
-	data = json.loads(response.text)
-	return data
+	return run_plan(session, lambda planner: plan_sponsor_data(planner, universe_id).result)
 
-def get_sponsors(session: Session, place_id: int) -> list[SponsorData]:
-	out = []
+async def get_sponsor_data_async(client: aio.AsyncTransport, place_id: int) -> SponsorAPIResponse:
+	universe_id = await aio.get_universe_id(client, place_id)
+	return await aio.run_plan(client, lambda planner: plan_sponsor_data(planner, universe_id).result)
 
-	api_response = get_sponsor_data(session, place_id)
+def get_sponsor_list(api_response: SponsorAPIResponse) -> list[SponsorData]:
+	out = []
 
 	for sponsor_api_data in api_response["sponsoredGames"]:
 
@@ -97,4 +101,12 @@ def get_sponsors(session: Session, place_id: int) -> list[SponsorData]:
 		out.append(data)
 
 
-	return out
\ No newline at end of file
+	return out
+
+def plan_sponsors(planner: Planner, universe_id: int) -> Callable[[], list[SponsorData]]:
+	handle = plan_sponsor_data(planner, universe_id)
+	return lambda: get_sponsor_list(handle.result())
+
+def get_sponsors(session: Session, place_id: int) -> list[SponsorData]:
+	universe_id = util.get_universe_id(session, place_id)
+	return run_plan(session, lambda planner: plan_sponsors(planner, universe_id))
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import zlib
+import struct
+from threading import Lock
+from datetime import datetime, timezone
+from typing import Literal, Any
+
+Codec = Literal["json", "zlib", "zstd"]
+
+SEGMENT_MAGIC = b"MIDAS\x00"
+SEGMENT_VERSION = 1
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+DAY_FORMAT = "%Y-%m-%d"
+
+# magic, version, created at
+SEGMENT_HEADER = struct.Struct("<6sHd")
+# payload length, payload crc32, recorded at, section count
+RECORD_HEADER = struct.Struct("<IIdH")
+# name length, codec id, data length
+SECTION_HEADER = struct.Struct("<HBI")
+# recorded at, record offset
+INDEX_ENTRY = struct.Struct("<dQ")
+
+CODEC_IDS: dict[Codec, int] = {
+	"json": 0,
+	"zlib": 1,
+	"zstd": 2,
+}
+
+# zstandard is optional, it is imported where it is used
+def is_zstd_available() -> bool:
+	try:
+		import zstandard
+		return True
+	except ImportError:
+		return False
+
+def get_default_codec() -> Codec:
+	return "zstd" if is_zstd_available() else "zlib"
+
+def encode_default(value: Any) -> Any:
+	# compact records from src.records write out in the layout of the dicts they replace
+	if hasattr(value, "to_json"):
+		return value.to_json()
+	raise TypeError(f"{type(value).__name__} is not json serializable")
+
+def encode_section(name: str, value: Any, codec: Codec) -> bytes:
+	data = json.dumps(value, default=encode_default).encode("utf-8")
+	if codec == "zlib":
+		data = zlib.compress(data)
+	elif codec == "zstd":
+		import zstandard
+		data = zstandard.compress(data)
+	name_bytes = name.encode("utf-8")
+	return SECTION_HEADER.pack(len(name_bytes), CODEC_IDS[codec], len(data)) + name_bytes + data
+
+def decode_section_data(codec_id: int, data: bytes) -> Any:
+	if codec_id == CODEC_IDS["zlib"]:
+		data = zlib.decompress(data)
+	elif codec_id == CODEC_IDS["zstd"]:
+		try:
+			import zstandard
+		except ImportError:
+			raise ValueError("install zstandard to read zstd sections")
+		data = zstandard.decompress(data)
+	elif codec_id != CODEC_IDS["json"]:
+		raise ValueError(f"unknown section codec {codec_id}")
+	return json.loads(data)
+
+def get_record_header(payload: bytes, recorded_at: float, section_count: int) -> bytes:
+	return RECORD_HEADER.pack(len(payload), zlib.crc32(payload), recorded_at, section_count)
+
+def encode_record(snapshot: dict, recorded_at: float, codec: Codec = "zlib") -> bytes:
+	payload = b"".join(encode_section(name, value, codec) for name, value in snapshot.items())
+	return get_record_header(payload, recorded_at, len(snapshot)) + payload
+
+def decode_payload(payload: bytes | memoryview, section_count: int, names: set[str] | None = None) -> dict:
+	out = {}
+	offset = 0
+	for i in range(section_count):
+		name_len, codec_id, data_len = SECTION_HEADER.unpack_from(payload, offset)
+		offset += SECTION_HEADER.size
+		name = bytes(payload[offset:offset+name_len]).decode("utf-8")
+		offset += name_len
+		if names is None or name in names:
+			out[name] = decode_section_data(codec_id, bytes(payload[offset:offset+data_len]))
+		offset += data_len
+	return out
+
+def get_day(recorded_at: float) -> str:
+	return datetime.fromtimestamp(recorded_at, timezone.utc).strftime(DAY_FORMAT)
+
+def get_index_path(segment_path: str) -> str:
+	return segment_path[:-len(SEGMENT_SUFFIX)]+INDEX_SUFFIX
+
+def list_segments(path: str) -> list[str]:
+	if not os.path.exists(path):
+		return []
+	return sorted(name for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+
+class Store:
+	def __init__(self, path: str, codec: Codec = "zlib"):
+		self.path = path
+		self.codec = codec
+		self.lock = Lock()
+		self.last_indexed: dict[str, float] = {}
+		os.makedirs(path, exist_ok=True)
+
+	def get_segment_path(self, day: str) -> str:
+		return os.path.join(self.path, day+SEGMENT_SUFFIX)
+
+	def get_last_indexed(self, index_path: str) -> float:
+		if not index_path in self.last_indexed:
+			self.last_indexed[index_path] = 0
+			if os.path.exists(index_path):
+				with open(index_path, "r+b") as index_file:
+					index_file.seek(0, os.SEEK_END)
+					size = index_file.tell() - index_file.tell() % INDEX_ENTRY.size
+					# drop a torn trailing entry so later entries stay aligned
+					index_file.truncate(size)
+					if size > 0:
+						index_file.seek(size - INDEX_ENTRY.size)
+						self.last_indexed[index_path] = INDEX_ENTRY.unpack(index_file.read(INDEX_ENTRY.size))[0]
+		return self.last_indexed[index_path]
+
+	def append(self, snapshot: dict, recorded_at: float | None = None) -> str:
+		if recorded_at is None:
+			recorded_at = time.time()
+		return self.append_record(encode_record(snapshot, recorded_at, self.codec), recorded_at)
+
+	def append_record(self, record: bytes, recorded_at: float) -> str:
+		segment_path = self.get_segment_path(get_day(recorded_at))
+		index_path = get_index_path(segment_path)
+
+		with self.lock:
+			with open(segment_path, "ab") as segment_file:
+				if segment_file.tell() == 0:
+					segment_file.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, recorded_at))
+				offset = segment_file.tell()
+				segment_file.write(record)
+				segment_file.flush()
+				os.fsync(segment_file.fileno())
+
+			# index times are kept monotonic so readers can bisect them
+			index_time = max(recorded_at, self.get_last_indexed(index_path))
+			with open(index_path, "ab") as index_file:
+				index_file.write(INDEX_ENTRY.pack(index_time, offset))
+			self.last_indexed[index_path] = index_time
+
+		return segment_path
+
+	def get_last_offset(self, index_path: str) -> int | None:
+		self.get_last_indexed(index_path)
+		if not os.path.exists(index_path) or os.path.getsize(index_path) == 0:
+			return None
+		with open(index_path, "rb") as index_file:
+			index_file.seek(-INDEX_ENTRY.size, os.SEEK_END)
+			return INDEX_ENTRY.unpack(index_file.read(INDEX_ENTRY.size))[1]
+
+	def get_last_record(self, segment_path: str) -> tuple[float, int] | None:
+		# recorded at and crc of the newest indexed record, to tell if a spooled one already landed
+		with self.lock:
+			offset = self.get_last_offset(get_index_path(segment_path))
+			if offset is None:
+				return None
+			with open(segment_path, "rb") as segment_file:
+				segment_file.seek(offset)
+				_, crc, recorded_at, _ = RECORD_HEADER.unpack(segment_file.read(RECORD_HEADER.size))
+		return recorded_at, crc
+
+	def recover(self) -> int:
+		# a crash mid append leaves a torn record at the tail of the newest segment,
+		# or whole records the index never saw, cut the first and index the second
+		segments = list_segments(self.path)
+		if len(segments) == 0:
+			return 0
+		segment_path = os.path.join(self.path, segments[-1])
+		index_path = get_index_path(segment_path)
+
+		with self.lock:
+			last_offset = self.get_last_offset(index_path)
+			entries: list[tuple[float, int]] = []
+			with open(segment_path, "r+b") as segment_file:
+				if last_offset is None:
+					offset = SEGMENT_HEADER.size
+				else:
+					segment_file.seek(last_offset)
+					offset = last_offset + RECORD_HEADER.size + RECORD_HEADER.unpack(segment_file.read(RECORD_HEADER.size))[0]
+
+				segment_file.seek(offset)
+				while True:
+					header = segment_file.read(RECORD_HEADER.size)
+					if len(header) < RECORD_HEADER.size:
+						break
+					payload_len, crc, recorded_at, _ = RECORD_HEADER.unpack(header)
+					payload = segment_file.read(payload_len)
+					if len(payload) < payload_len or zlib.crc32(payload) != crc:
+						break
+					entries.append((recorded_at, offset))
+					offset += RECORD_HEADER.size + payload_len
+
+				segment_file.seek(0, os.SEEK_END)
+				size = segment_file.tell()
+				if size > offset or size < SEGMENT_HEADER.size:
+					# a torn segment header is cut too, the next append writes a fresh one
+					segment_file.truncate(offset if size >= SEGMENT_HEADER.size else 0)
+					segment_file.flush()
+					os.fsync(segment_file.fileno())
+
+			index_time = self.get_last_indexed(index_path)
+			with open(index_path, "ab") as index_file:
+				for recorded_at, record_offset in entries:
+					index_time = max(recorded_at, index_time)
+					index_file.write(INDEX_ENTRY.pack(index_time, record_offset))
+			self.last_indexed[index_path] = index_time
+
+		return len(entries)
@@ -0,0 +1,238 @@
+import time
+import random
+from email.utils import parsedate_to_datetime
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlsplit
+from requests import Session, PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from typing import Mapping
+from src.cache import ResponseCache, CachedResponse, CacheKey
+import src.metrics as metrics
+
+DEFAULT_HOST_LIMIT = 6
+DEFAULT_TIMEOUT = 30
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# requests per second each host starts at, -host-rates overrides them
+HOST_RATES: dict[str, float] = {
+	"apis.roblox.com": 10,
+	"develop.roblox.com": 5,
+	"games.roblox.com": 5,
+	"www.roblox.com": 2,
+	"adconfiguration.roblox.com": 2,
+}
+DEFAULT_RATE = 5
+MIN_RATE = 0.2
+# until a host throttles, its bucket probes up to this many times its starting rate
+MAX_RATE_FACTOR = 4
+# each success adds this share of the starting rate
+RATE_STEP = 0.05
+
+class TokenBucket:
+	def __init__(self, rate: float, burst: float | None = None):
+		self.start_rate = rate
+		# a 429 above the starting rate lowers the ceiling to just under where it came,
+		# the bucket can always climb back to its starting rate
+		self.max_rate = rate*MAX_RATE_FACTOR
+		self.step = rate*RATE_STEP
+		self.rate = rate
+		self.burst = burst if burst is not None else max(rate, 1)
+		self.tokens = self.burst
+		self.updated = time.monotonic()
+		self.blocked_until = 0.0
+		self.lock = Lock()
+
+	def reserve(self) -> float:
+		with self.lock:
+			now = time.monotonic()
+			self.tokens = min(self.burst, self.tokens + (now - self.updated)*self.rate)
+			self.updated = now
+			# tokens may go negative, each caller waits out its own reservation
+			self.tokens -= 1
+			return max(-self.tokens/self.rate, self.blocked_until - now, 0)
+
+	def acquire(self):
+		wait = self.reserve()
+		if wait > 0:
+			time.sleep(wait)
+
+	def on_success(self):
+		with self.lock:
+			self.rate = min(self.max_rate, self.rate + self.step)
+
+	def on_throttle(self, retry_after: float | None):
+		with self.lock:
+			self.max_rate = max(self.start_rate, min(self.max_rate, self.rate - self.step))
+			self.rate = max(MIN_RATE, self.rate/2)
+			if retry_after is not None:
+				self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+# points every host at one server, "https://host/path" is sent to "<base>/host/path"
+redirect_base: str | None = None
+
+def set_redirect(base_url: str | None):
+	global redirect_base
+	redirect_base = None if base_url is None else base_url.rstrip("/")
+
+def get_redirect_url(url: str) -> str:
+	if redirect_base == None:
+		return url
+	parts = urlsplit(url)
+	query = "?"+parts.query if parts.query else ""
+	return f"{redirect_base}/{parts.netloc}{parts.path}{query}"
+
+buckets: dict[str, TokenBucket] = {}
+bucket_lock = Lock()
+
+def set_host_rates(rates: dict[str, float]):
+	with bucket_lock:
+		HOST_RATES.update(rates)
+		# buckets made before the override start over at the new rate
+		for host in rates:
+			buckets.pop(host, None)
+
+def get_bucket(host: str) -> TokenBucket:
+	with bucket_lock:
+		if not host in buckets:
+			buckets[host] = TokenBucket(HOST_RATES.get(host, DEFAULT_RATE))
+		return buckets[host]
+
+def get_retry_after(headers: Mapping[str, str]) -> float | None:
+	retry_after = headers.get("Retry-After")
+	if retry_after is None:
+		return None
+	try:
+		return max(float(retry_after), 0)
+	except ValueError:
+		pass
+	try:
+		retry_at = parsedate_to_datetime(retry_after)
+	except (TypeError, ValueError):
+		return None
+	if retry_at is None:
+		return None
+	return max(retry_at.timestamp() - time.time(), 0)
+
+def get_backoff(attempt: int) -> float:
+	# full jitter keeps retrying workers from synchronising
+	return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+def get_retry_delay(status: int, headers: Mapping[str, str], attempt: int) -> float | None:
+	if not status in RETRY_STATUSES or attempt >= MAX_RETRIES:
+		return None
+	retry_after = get_retry_after(headers)
+	if retry_after is not None:
+		return min(retry_after, BACKOFF_CAP)
+	return get_backoff(attempt)
+
+def get_cache_key(request: PreparedRequest) -> CacheKey:
+	body = request.body
+	if isinstance(body, bytes):
+		body = body.decode("utf-8")
+	assert request.method and request.url
+	return (request.method, request.url, body)
+
+def get_cached_response(request: PreparedRequest, entry: CachedResponse) -> Response:
+	response = Response()
+	response.status_code = entry.status
+	response.headers = CaseInsensitiveDict(entry.headers)
+	response._content = entry.content
+	response.encoding = entry.encoding
+	response.url = entry.url
+	response.request = request
+	return response
+
+class TransportAdapter(HTTPAdapter):
+	def __init__(self, session: Session, host_limit: int = DEFAULT_HOST_LIMIT, pool_size: int = 10, cache: ResponseCache | None = None):
+		self.session = session
+		self.cache = cache
+		self.host_limit = max(host_limit, 1)
+		self._slots: dict[str, BoundedSemaphore] = {}
+		self._slot_lock = Lock()
+		super().__init__(pool_maxsize=max(pool_size, self.host_limit))
+
+	def get_slot(self, host: str) -> BoundedSemaphore:
+		with self._slot_lock:
+			if not host in self._slots:
+				self._slots[host] = BoundedSemaphore(self.host_limit)
+			return self._slots[host]
+
+	def rotate_csrf_token(self, request: PreparedRequest, response: Response) -> bool:
+		# only requests that already carried a token are replayed, never the initial logout probe
+		old_token = request.headers.get("X-Csrf-Token")
+		new_token = response.headers.get("x-csrf-token")
+		if response.status_code != 403 or old_token is None or new_token is None or new_token == old_token:
+			return False
+		self.session.headers["X-Csrf-Token"] = new_token
+		request.headers["X-Csrf-Token"] = new_token
+		return True
+
+	def send(self, request: PreparedRequest, *args, **kwargs) -> Response:
+		cache = self.cache
+		if cache is None:
+			return self.send_uncached(request, *args, **kwargs)
+
+		key = get_cache_key(request)
+		entry = cache.lookup(key)
+		if entry is not None and entry.is_fresh():
+			return get_cached_response(request, entry)
+
+		request.headers.update(cache.get_validators(entry))
+		response = self.send_uncached(request, *args, **kwargs)
+		if entry is not None and response.status_code == 304:
+			cache.revalidated(key, entry)
+			response.close()
+			return get_cached_response(request, entry)
+
+		cache.store(key, response.status_code, response.headers, response.content, response.encoding)
+		return response
+
+	def send_uncached(self, request: PreparedRequest, *args, **kwargs) -> Response:
+		assert request.url
+		host = urlsplit(request.url).netloc
+		bucket = get_bucket(host)
+		if kwargs.get("timeout") == None:
+			kwargs["timeout"] = DEFAULT_TIMEOUT
+		url = request.url
+		request.url = get_redirect_url(url)
+
+		attempt = 0
+		rotated = False
+		while True:
+			with self.get_slot(host):
+				bucket.acquire()
+				sent_at = time.perf_counter()
+				response = super().send(request, *args, **kwargs)
+				metrics.observe_request(url, response.status_code, time.perf_counter() - sent_at, len(response.content), attempt > 0 or rotated)
+
+			if not rotated and self.rotate_csrf_token(request, response):
+				rotated = True
+				response.close()
+				continue
+
+			delay = get_retry_delay(response.status_code, response.headers, attempt)
+			if response.status_code == 429:
+				bucket.on_throttle(get_retry_after(response.headers))
+			elif response.status_code < 400:
+				bucket.on_success()
+
+			if delay is None:
+				return response
+
+			response.close()
+			time.sleep(delay)
+			attempt += 1
+
+def mount(session: Session, workers: int, host_limit: int = DEFAULT_HOST_LIMIT, cache: ResponseCache | None = None) -> Session:
+	session.mount("https://", TransportAdapter(session, host_limit, pool_size=workers, cache=cache))
+	return session
+
+def get_cache(session: Session) -> ResponseCache | None:
+	adapter = session.get_adapter("https://")
+	if isinstance(adapter, TransportAdapter):
+		return adapter.cache
+	return None
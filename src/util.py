@@ -1,17 +1,99 @@
-from bs4 import BeautifulSoup as htmlparser
+import os
 import json
+import time
+from threading import Lock
 from datetime import datetime
-from lxml.html import HtmlElement
-from lxml import html
 from requests import Session
+from typing import Any
 
-def get_universe_id(session: Session, place_id: int) -> int:
-	response = session.get(f"https://games.roblox.com/v1/games/multiget-place-details?placeIds={place_id}")
-	for place in json.loads(response.text):
+DEFAULT_CACHE_DIR = ".midas-cache"
+UNIVERSE_CACHE_FILE = "universe-ids.json"
+UNIVERSE_CACHE_TTL = 60*60*24*7
+PLACE_BATCH_SIZE = 50
+
+cache_dir = DEFAULT_CACHE_DIR
+universe_ids: dict[int, int] = {}
+universe_lock = Lock()
+
+def set_cache_dir(path: str):
+	global cache_dir
+	cache_dir = path
+
+def get_cache_path(file_name: str) -> str:
+	os.makedirs(cache_dir, exist_ok=True)
+	return os.path.join(cache_dir, file_name)
+
+def read_universe_cache() -> dict[str, dict]:
+	path = get_cache_path(UNIVERSE_CACHE_FILE)
+	if not os.path.exists(path):
+		return {}
+	try:
+		with open(path) as cache_file:
+			return json.load(cache_file)
+	except ValueError:
+		return {}
+
+def write_universe_cache(resolved: dict[int, int]):
+	cache_data = read_universe_cache()
+	for place_id, universe_id in resolved.items():
+		cache_data[str(place_id)] = {
+			"universe_id": universe_id,
+			"time": time.time(),
+		}
+	path = get_cache_path(UNIVERSE_CACHE_FILE)
+	with open(path+".tmp", "w") as cache_file:
+		json.dump(cache_data, cache_file)
+	os.replace(path+".tmp", path)
+
+def get_multiget_url(place_ids: list[int]) -> str:
+	return f"https://games.roblox.com/v1/games/multiget-place-details?placeIds={','.join(map(str, place_ids))}"
+
+def parse_universe_ids(place_ids: list[int], text: str) -> dict[int, int]:
+	out: dict[int, int] = {}
+	for place in json.loads(text):
 		universe_id = int(place["universeId"])
 		assert universe_id
-		return universe_id
-	raise ValueError("Bad response: "+response.text)
+		out[int(place["placeId"])] = universe_id
+
+	for place_id in place_ids:
+		if not place_id in out:
+			raise ValueError("Bad response: "+text)
+	return out
+
+def fetch_universe_ids(session: Session, place_ids: list[int]) -> dict[int, int]:
+	out: dict[int, int] = {}
+	for i in range(0, len(place_ids), PLACE_BATCH_SIZE):
+		batch = place_ids[i:i+PLACE_BATCH_SIZE]
+		out.update(parse_universe_ids(batch, session.get(get_multiget_url(batch)).text))
+	return out
+
+def take_cached_universe_ids(place_ids: list[int]) -> list[int]:
+	missing: list[int] = []
+	cache_data = read_universe_cache()
+	for place_id in place_ids:
+		if place_id in universe_ids:
+			continue
+		entry = cache_data.get(str(place_id))
+		if entry and time.time() - entry["time"] < UNIVERSE_CACHE_TTL:
+			universe_ids[place_id] = int(entry["universe_id"])
+		else:
+			missing.append(place_id)
+	return missing
+
+def save_universe_ids(resolved: dict[int, int]):
+	write_universe_cache(resolved)
+	universe_ids.update(resolved)
+
+def get_universe_ids(session: Session, place_ids: list[int]) -> dict[int, int]:
+	with universe_lock:
+		missing = take_cached_universe_ids(place_ids)
+		if len(missing) > 0:
+			save_universe_ids(fetch_universe_ids(session, missing))
+
+		return {place_id: universe_ids[place_id] for place_id in place_ids}
+
+def get_universe_id(session: Session, place_id: int) -> int:
+	return get_universe_ids(session, [place_id])[place_id]
 	
 # def get_if_owner_is_group(session: Session, place_id: int) -> bool:
 # 	return False
@@ -19,14 +101,23 @@ def get_universe_id(session: Session, place_id: int) -> int:
 # def get_owner_id(session: Session, place_id: int) -> int:
 # 	return 42223924
 
+# lxml loads on the first parse rather than at startup
+
 def dump_element(element) -> str:
+	from lxml import html
 	return (html.tostring(element)).decode('utf-8')
 
-def get_html_tree(tree_content: str) -> HtmlElement:
+def get_html_tree(tree_content: str) -> Any:
+	from lxml import html
 	return html.fromstring(tree_content)
 
+def compile_xpaths(paths: dict[str, str]) -> dict[str, Any]:
+	from lxml import etree
+	return {name: etree.XPath(path) for name, path in paths.items()}
+
 def get_xcrf_token(session: Session) -> str:
-	response = session.post("https://auth.roblox.com/v2/logout")
+	# without a token the logout endpoint only hands one out, with a valid one it signs the cookie out
+	response = session.post("https://auth.roblox.com/v2/logout", headers={"X-Csrf-Token": None})
 	token = response.headers["x-csrf-token"]
 	assert token
 	return token
\ No newline at end of file
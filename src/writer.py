@@ -0,0 +1,172 @@
+import os
+import time
+import zlib
+import itertools
+from queue import Queue
+from threading import Thread, Event, Lock
+from typing import Callable, Any
+import src.store as store
+import src.rollup as rollup
+import src.records as records
+from src.store import Store, RECORD_HEADER
+from src.rollup import Rollup
+
+SPOOL_DIR = "spool"
+PART_SUFFIX = ".part"
+READY_SUFFIX = ".ready"
+
+spool_ids = itertools.count()
+
+# a spool holds one snapshot's encoded sections, which are the payload of its record.
+# on commit the record header is appended as a trailer, the file is synced and renamed
+# to .ready, and only then copied into the segment. a crash before the rename loses
+# the snapshot, a crash after it is replayed by recover_spools.
+
+def read_ready(ready_path: str) -> tuple[bytes, float]:
+	with open(ready_path, "rb") as ready_file:
+		data = ready_file.read()
+	header = data[-RECORD_HEADER.size:]
+	_, _, recorded_at, _ = RECORD_HEADER.unpack(header)
+	return header + data[:-RECORD_HEADER.size], recorded_at
+
+def sync_dir(path: str):
+	# the rename is only durable once the directory entry is
+	if hasattr(os, "O_DIRECTORY"):
+		dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+		try:
+			os.fsync(dir_fd)
+		finally:
+			os.close(dir_fd)
+
+def append_ready(data_store: Store, ready_path: str):
+	record, recorded_at = read_ready(ready_path)
+	_, crc, _, _ = RECORD_HEADER.unpack_from(record)
+	# a crash between the append and the remove leaves the record in both places
+	if data_store.get_last_record(data_store.get_segment_path(store.get_day(recorded_at))) != (recorded_at, crc):
+		data_store.append_record(record, recorded_at)
+	os.remove(ready_path)
+
+def recover_spools(data_store: Store) -> int:
+	spool_path = os.path.join(data_store.path, SPOOL_DIR)
+	data_store.recover()
+	if not os.path.exists(spool_path):
+		return 0
+
+	replayed = 0
+	for name in sorted(os.listdir(spool_path)):
+		path = os.path.join(spool_path, name)
+		if name.endswith(READY_SUFFIX):
+			append_ready(data_store, path)
+			replayed += 1
+		elif name.endswith(PART_SUFFIX):
+			# never committed, the run that wrote it stopped part way
+			print(f"dropping uncommitted snapshot {path}")
+			os.remove(path)
+	return replayed
+
+class Spool:
+	def __init__(self, writer: "SnapshotWriter", data_store: Store, store_rollup: Rollup | None):
+		self.writer = writer
+		self.store = data_store
+		self.rollup = store_rollup
+		# sections the rollup reads, kept as records until the commit lands
+		self.rollup_sections: dict[str, Any] = {}
+		self.path = os.path.join(data_store.path, SPOOL_DIR, f"{time.time_ns()}-{next(spool_ids)}{PART_SUFFIX}")
+		self.names: list[str] = []
+		# only touched on the writer thread
+		self.file: Any = None
+		self.length = 0
+		self.crc = 0
+		self.count = 0
+
+	def write(self, name: str, value: Any):
+		self.names.append(name)
+		# sections wait for the writer thread as compact records, not the collectors' dicts
+		section = records.from_section(name, value)
+		self.writer.submit(lambda: self.write_section(name, section))
+
+	def commit(self, recorded_at: float):
+		self.writer.submit(lambda: self.commit_record(recorded_at))
+
+	def write_section(self, name: str, value: Any):
+		# encoding happens here, off the thread that is still finishing collectors
+		section = store.encode_section(name, value, self.store.codec)
+		if self.file == None:
+			self.file = open(self.path, "wb")
+		self.file.write(section)
+		self.length += len(section)
+		self.crc = zlib.crc32(section, self.crc)
+		self.count += 1
+		if self.rollup is not None and name in self.rollup.section_names:
+			self.rollup_sections[name] = value
+
+	def commit_record(self, recorded_at: float):
+		if self.file == None:
+			self.file = open(self.path, "wb")
+		self.file.write(RECORD_HEADER.pack(self.length, self.crc, recorded_at, self.count))
+		self.file.flush()
+		os.fsync(self.file.fileno())
+		self.file.close()
+
+		ready_path = self.path[:-len(PART_SUFFIX)]+READY_SUFFIX
+		os.replace(self.path, ready_path)
+		sync_dir(os.path.dirname(ready_path))
+		append_ready(self.store, ready_path)
+
+		if self.rollup is not None and len(self.rollup_sections) > 0:
+			try:
+				self.rollup.add(recorded_at, {name: records.to_json(section) for name, section in self.rollup_sections.items()})
+			except Exception as e:
+				# the snapshot is already safe, a rollup rebuild can fill the gap
+				print(f"rollup update failed for {self.store.path}: {e}")
+
+class SnapshotWriter:
+	def __init__(self, rollup_metrics: list[str] | None = None):
+		self.queue: Queue[Callable[[], None] | None] = Queue()
+		self.errors: list[Exception] = []
+		self.recovered: set[str] = set()
+		# rollups are kept next to each store when metrics are given
+		self.rollup_metrics = rollup_metrics
+		self.rollups: dict[str, Rollup] = {}
+		self.recover_lock = Lock()
+		self.thread = Thread(target=self.run, name="writer", daemon=True)
+		self.thread.start()
+
+	def run(self):
+		while True:
+			job = self.queue.get()
+			if job == None:
+				return
+			try:
+				job()
+			except Exception as e:
+				print(f"snapshot write failed: {e}")
+				self.errors.append(e)
+
+	def submit(self, job: Callable[[], None]):
+		self.queue.put(job)
+
+	def open(self, data_store: Store) -> Spool:
+		with self.recover_lock:
+			if not data_store.path in self.recovered:
+				os.makedirs(os.path.join(data_store.path, SPOOL_DIR), exist_ok=True)
+				replayed = recover_spools(data_store)
+				if replayed > 0:
+					print(f"replayed {replayed} committed snapshots into {data_store.path}")
+				self.recovered.add(data_store.path)
+				if self.rollup_metrics is not None:
+					self.rollups[data_store.path] = Rollup(os.path.join(data_store.path, rollup.ROLLUP_FILE), self.rollup_metrics)
+		return Spool(self, data_store, self.rollups.get(data_store.path))
+
+	def flush(self):
+		done = Event()
+		self.submit(done.set)
+		done.wait()
+
+	def close(self):
+		self.queue.put(None)
+		self.thread.join()
+		for store_rollup in self.rollups.values():
+			store_rollup.close()
+		if len(self.errors) > 0:
+			raise self.errors[0]